@@ -0,0 +1,26 @@
+import functools
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+def is_admin(update: Update) -> bool:
+    user = update.effective_user
+    return bool(user) and user.id in config.bot.ADMIN_IDS
+
+
+def admin_only(handler):
+    """Команда доступна только пользователям из ADMIN_IDS, остальных молча игнорируем"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not is_admin(update):
+            user_id = update.effective_user.id if update.effective_user else None
+            logger.warning(f"Попытка вызвать админ-команду пользователем {user_id}")
+            return
+        return await handler(update, context)
+    return wrapper
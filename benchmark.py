@@ -0,0 +1,616 @@
+"""Нагрузочный прогон: N пользователей проходят опрос от /start до отзыва.
+
+Приложение собирается тем же main.build_application(), что и в работе,
+апдейты идут через update_queue, как при polling. Telegram заменен
+офлайн-заглушкой Bot API, YaGPT — локальным HTTP-сервером с настраиваемой
+задержкой, долей ошибок 5xx и 429.
+
+    python benchmark.py --users 2000 --concurrency 200 --latency 1.5
+    python benchmark.py --output after.json --compare before.json
+
+Результат пишется в JSON (коммит, параметры, метрики), чтобы сравнивать
+прогоны между коммитами.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiohttp import web
+from telegram import Bot, Update
+from telegram.request import BaseRequest, RequestData
+
+import survey
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot"}
+STUB_MARKER = "Demyanov realty — сгенерировано заглушкой."
+
+# Из этих слов заглушка собирает случайный текст: если все ответы
+# совпадут, каждый уйдет на перегенерацию как почти-дубликат
+STUB_WORDS = (
+    "агентство менеджер сделка квартира документы показ договор цена срок юрист ипотека банк "
+    "быстро честно спокойно удобно внимательно грамотно вежливо подробно заранее вовремя "
+    "помогли объяснили подготовили организовали нашли согласовали проверили сопровождали "
+    "спасибо рекомендую довольны благодарим советую обратимся снова отлично надежно профессионально"
+).split()
+
+# Фразы, по которым видно, чем закончился опрос
+DONE_TEXT = "Вот ваш отзыв"
+REJECTED_TEXTS = ("очень много запросов", "Очередь заполнилась")
+CANDIDATES_TEXT = "Листайте стрелками"
+TIMEOUT_TEXT = "Опрос закрыт"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(values: List[float], scale: float = 1000.0) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max, по умолчанию в миллисекундах"""
+    def scaled(value):
+        return None if value is None else round(value * scale, 2)
+    return {
+        'count': len(values),
+        'p50': scaled(percentile(values, 50)),
+        'p95': scaled(percentile(values, 95)),
+        'p99': scaled(percentile(values, 99)),
+        'max': scaled(max(values) if values else None),
+    }
+
+
+# Заглушка YaGPT
+
+HOT_FOLDER = 'benchmark-0'
+
+
+class StubYaGPT:
+    """HTTP-сервер, отвечающий как completion API YaGPT"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, rate_429: float,
+                 slow_rate: float = 0.0, slow_latency: float = 0.0, hot_429: float = 0.0,
+                 dirty_rate: float = 0.0, invalid_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        # Хвост распределения: доля ответов, которые идут slow_latency секунд
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        # Доля 429 только для каталога HOT_FOLDER: у него исчерпана квота
+        self.hot_429 = hot_429
+        # Доля текстов с разметкой и эмодзи (чинятся на месте) и совсем
+        # негодных — одно предложение без названия агентства
+        self.dirty_rate = dirty_rate
+        self.invalid_rate = invalid_rate
+        self.responses = Counter()
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/completion', self.completion)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/completion"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def _delay(self) -> float:
+        if random.random() < self.slow_rate:
+            return self.slow_latency
+        return max(0.0, random.gauss(self.latency, self.jitter))
+
+    @staticmethod
+    def _result(text: str, final: bool) -> dict:
+        return {
+            "result": {
+                "alternatives": [{
+                    "message": {"role": "assistant", "text": text},
+                    "status": "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL",
+                }],
+                "usage": {"inputTextTokens": "180", "completionTokens": "90", "totalTokens": "270"},
+                "modelVersion": "benchmark",
+            }
+        }
+
+    async def completion(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        roll = random.random()
+        if request.headers.get('x-folder-id') == HOT_FOLDER and random.random() < self.hot_429:
+            self.responses[429] += 1
+            return web.json_response({"error": "Too Many Requests"}, status=429)
+        if roll < self.rate_429:
+            self.responses[429] += 1
+            return web.json_response({"error": "Too Many Requests"}, status=429)
+        if roll < self.rate_429 + self.error_rate:
+            await asyncio.sleep(self._delay() / 4)
+            self.responses[500] += 1
+            return web.json_response({"error": "Internal Server Error"}, status=500)
+
+        text = f"{STUB_MARKER} {' '.join(random.choices(STUB_WORDS, k=40))}."
+        quality = random.random()
+        if quality < self.invalid_rate:
+            text = f"{' '.join(random.choices(STUB_WORDS, k=20))}."
+        elif quality < self.invalid_rate + self.dirty_rate:
+            text = f"**Отзыв:** {text} 👍 `Спасибо`"
+        delay = self._delay()
+        self.responses[200] += 1
+        if not payload.get('completionOptions', {}).get('stream'):
+            await asyncio.sleep(delay)
+            return web.json_response(self._result(text, final=True))
+
+        # Потоковый ответ: несколько строк с накопленным текстом
+        response = web.StreamResponse()
+        await response.prepare(request)
+        words = text.split()
+        parts = 4
+        for part in range(1, parts + 1):
+            await asyncio.sleep(delay / parts)
+            chunk = " ".join(words[:len(words) * part // parts])
+            line = json.dumps(self._result(chunk, final=part == parts), ensure_ascii=False)
+            await response.write(line.encode() + b"\n")
+        await response.write_eof()
+        return response
+
+
+# Офлайн Bot API
+
+class FakeTelegram(BaseRequest):
+    """Bot API без сети: правдоподобные ответы и сигналы ждущим пользователям"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self.outcomes = Counter()
+        self._message_ids = itertools.count(1000)
+        self._waiters: Dict[tuple, asyncio.Future] = {}
+
+    def expect(self, key: tuple) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[key] = future
+        return future
+
+    def _notify(self, key: tuple, value):
+        future = self._waiters.pop(key, None)
+        if future and not future.done():
+            future.set_result(value)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if name == 'getMe':
+            result = BOT_USER
+        elif name in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            message_id = params.get('message_id') or next(self._message_ids)
+            text = params.get('text', '')
+            result = {
+                "message_id": message_id, "date": int(time.time()), "text": text,
+                "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER,
+            }
+            self._observe(chat_id, message_id, text, params.get('reply_markup'))
+        elif name == 'answerCallbackQuery':
+            self._notify(('query', params.get('callback_query_id')), True)
+            result = True
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def _observe(self, chat_id: int, message_id: int, text: str, reply_markup):
+        if DONE_TEXT in text:
+            # Источник текста (yagpt/local/pool/fallback) считает сам бот
+            # в reviews_delivered_total — по тексту его не угадать
+            self.outcomes['delivered'] += 1
+            self._notify(('done', chat_id), 'delivered')
+        elif CANDIDATES_TEXT in text:
+            # Варианты на выбор: пользователь дальше жмет кнопки под ними
+            self._notify(('done', chat_id), message_id)
+        elif TIMEOUT_TEXT in text:
+            self.outcomes['timed_out'] += 1
+        elif any(phrase in text for phrase in REJECTED_TEXTS):
+            self.outcomes['rejected'] += 1
+            self._notify(('done', chat_id), 'rejected')
+        elif reply_markup and 'callback_data' in json.dumps(reply_markup):
+            # Новый вопрос опроса с inline-кнопками
+            self._notify(('question', chat_id), message_id)
+
+
+# Синтетические пользователи
+
+class SurveyDriver:
+    def __init__(self, application, telegram: FakeTelegram, args):
+        self.application = application
+        self.telegram = telegram
+        self.args = args
+        self._update_ids = itertools.count(1)
+        self._query_ids = itertools.count(1)
+        self.survey_latencies: List[float] = []
+        self.response_latencies: List[float] = []
+        self.failures = Counter()
+        self.abandoned = 0
+
+    @staticmethod
+    def _user(chat_id: int) -> dict:
+        return {"id": chat_id, "is_bot": False, "first_name": "User", "username": f"user{chat_id}"}
+
+    def _message(self, chat_id: int, text: str) -> Update:
+        message = {
+            "message_id": next(self._update_ids), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "from": self._user(chat_id), "text": text,
+        }
+        if text.startswith('/'):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.de_json({"update_id": next(self._update_ids), "message": message}, self.application.bot)
+
+    def _callback(self, chat_id: int, message_id: int, data: str) -> Update:
+        query = {
+            "id": str(next(self._query_ids)), "from": self._user(chat_id), "chat_instance": "benchmark",
+            "data": data,
+            "message": {
+                "message_id": message_id, "date": int(time.time()), "text": "...",
+                "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER,
+            },
+        }
+        return Update.de_json({"update_id": next(self._update_ids), "callback_query": query}, self.application.bot)
+
+    async def _send(self, update: Update, key: tuple, record: bool = True):
+        """Отправить апдейт и дождаться реакции бота"""
+        waiter = self.telegram.expect(key)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await self.application.update_queue.put(update)
+        result = await asyncio.wait_for(waiter, self.args.step_timeout)
+        if record:
+            self.response_latencies.append(loop.time() - started)
+        if self.args.think:
+            await asyncio.sleep(random.uniform(0, 2 * self.args.think))
+        return result
+
+    async def _press(self, chat_id: int, message_id: int, data: str, key: Optional[tuple] = None):
+        update = self._callback(chat_id, message_id, data)
+        return await self._send(update, key or ('question', chat_id))
+
+    async def run_user(self, chat_id: int):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        # Часть пользователей бросает опрос на случайном шаге
+        abandon_at = random.randrange(len(survey.STEPS)) if random.random() < self.args.abandon_rate else None
+        try:
+            message_id = await self._send(self._message(chat_id, '/start'), ('question', chat_id))
+            for step in survey.STEPS:
+                if step.state == abandon_at:
+                    self.abandoned += 1
+                    return
+                if step.kind == survey.CHOICE:
+                    index = random.randrange(len(step.options))
+                    message_id = await self._press(chat_id, message_id, f"{step.key}:{index}")
+                elif step.kind == survey.MULTI:
+                    for index in random.sample(range(len(step.options)), random.randint(1, 3)):
+                        update = self._callback(chat_id, message_id, f"{step.key}:{index}")
+                        await self._send(update, ('query', update.callback_query.id))
+                    message_id = await self._press(chat_id, message_id, f"{step.key}:{survey.DONE}")
+                elif random.random() < self.args.comment_rate:
+                    message_id = await self._send(self._message(chat_id, "Все отлично, спасибо"), ('question', chat_id))
+                else:
+                    message_id = await self._press(chat_id, message_id, f"{step.key}:{survey.SKIP}")
+
+            confirm = survey.CONFIRMATION.options.index(survey.CONFIRM_YES)
+            # Ожидание генерации в задержку ответа на апдейт не входит
+            update = self._callback(chat_id, message_id, f"{survey.CONFIRMATION.key}:{confirm}")
+            outcome = await self._send(update, ('done', chat_id), record=False)
+            if isinstance(outcome, int):
+                # Пришли варианты: листаем к следующему и выбираем его
+                update = self._callback(chat_id, outcome, "cand:show:1")
+                await self._send(update, ('query', update.callback_query.id))
+                update = self._callback(chat_id, outcome, "cand:pick:1")
+                outcome = await self._send(update, ('done', chat_id), record=False)
+        except asyncio.TimeoutError:
+            self.failures['timeout'] += 1
+            return
+        if outcome != 'rejected':
+            self.survey_latencies.append(loop.time() - started)
+
+    async def run(self) -> float:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def limited(chat_id: int):
+            async with semaphore:
+                await self.run_user(chat_id)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(100000 + number) for number in range(self.args.users)))
+        return time.perf_counter() - started
+
+
+async def sample_loop_lag(samples: List[float], interval: float = 0.05):
+    """Насколько позже положенного просыпается цикл событий"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def measure_imports(top: int = 8) -> Optional[dict]:
+    """Импорт main в чистом интерпретаторе с -X importtime, мс: всего и самые долгие прямые импорты.
+
+    В этом процессе модули уже загружены, поэтому замер — в отдельном.
+    """
+    try:
+        report = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import main'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True, timeout=60
+        ).stderr
+    except (OSError, subprocess.SubprocessError):
+        return None
+    # Строки вида "import time: <свое, мкс> | <с вложенными, мкс> | <модуль>":
+    # вложенные импорты печатаются раньше родителя и с отступом на 2 пробела глубже
+    children = []
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            children.append((int(cumulative), name))
+        elif depth == 0:
+            if name == 'main':
+                return {
+                    'total': round(int(cumulative) / 1000, 1),
+                    'slowest': {module: round(us / 1000, 1) for us, module in sorted(children, reverse=True)[:top]},
+                }
+            children = []
+    return None
+
+
+def counter_values(counter) -> Dict[str, int]:
+    """Значения счетчика Prometheus с одной меткой"""
+    return {
+        sample.labels[next(iter(sample.labels))]: int(sample.value)
+        for metric in counter.collect() for sample in metric.samples
+        if sample.name.endswith('_total') and sample.labels
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args, workdir: str) -> dict:
+    stub = StubYaGPT(args.latency, args.jitter, args.error_rate, args.rate_429, args.slow_rate, args.slow_latency,
+                     args.hot_429, args.dirty_rate, args.invalid_rate)
+    await stub.start()
+
+    # Конфиг читается при импорте, поэтому окружение — до импорта main
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:benchmark',
+        'YANDEX_API_KEY': 'benchmark',
+        'YANDEX_FOLDER_ID': 'benchmark',
+        'YANDEX_GPT_URL': stub.url,
+        'DB_PATH': os.path.join(workdir, 'reviews.db'),
+        'STATE_DB_PATH': os.path.join(workdir, 'state.db'),
+        'SERVER_ENABLED': '0',
+        'BOT_MODE': 'polling',
+        'POOL_ENABLED': '1' if args.pool else '0',
+        'GENERATION_STREAMING': '1' if args.streaming else '0',
+        'GENERATION_CANDIDATES': str(args.candidates),
+        'GENERATION_BACKEND': args.backend,
+        'YAGPT_HEDGE_ENABLED': '0' if args.no_hedge else '1',
+        'STATE_SESSION_TIMEOUT': str(args.session_timeout if args.session_timeout is not None else 1800),
+        'YANDEX_GPT_BACKENDS': ','.join(f"benchmark-{i}:benchmark" for i in range(args.backends)),
+    })
+    import main
+    import metrics
+    from database import db_manager
+    logging.getLogger().setLevel(args.log_level)
+
+    # Время записи пачек отзывов
+    db_writes: List[float] = []
+    db_rows = 0
+    write_batch = db_manager._write_batch
+
+    async def timed_write_batch(batch):
+        nonlocal db_rows
+        started = time.perf_counter()
+        try:
+            return await write_batch(batch)
+        finally:
+            db_writes.append(time.perf_counter() - started)
+            db_rows += len(batch)
+
+    db_manager._write_batch = timed_write_batch
+
+    imports = measure_imports()
+    imports_ms = imports['total'] if imports else None
+
+    # Запуск приложения до приема обновлений — как run_polling, без сети
+    startup_started = time.perf_counter()
+    telegram = FakeTelegram(args.telegram_latency)
+    application = main.build_application(bot=Bot('123456:benchmark', request=telegram))
+    driver = SurveyDriver(application, telegram, args)
+
+    lag_samples: List[float] = []
+    await application.initialize()
+    await main.post_init(application)
+    await application.start()
+    startup_ms = round((time.perf_counter() - startup_started) * 1000, 1)
+    lag_task = asyncio.create_task(sample_loop_lag(lag_samples))
+    try:
+        duration = await driver.run()
+        if driver.abandoned and args.session_timeout:
+            # Брошенные опросы должны закрыться по таймауту
+            await asyncio.sleep(args.session_timeout + 1)
+        sessions = metrics.collect_sessions(application)
+    finally:
+        lag_task.cancel()
+        await application.stop()
+        await main.post_stop(application)
+        await application.shutdown()
+        await main.post_shutdown(application)
+        await stub.stop()
+
+    completed = len(driver.survey_latencies)
+    updates = len(driver.response_latencies)
+    return {
+        'cold_start_ms': {
+            'imports': imports_ms,
+            'startup': startup_ms,
+            'total': round(imports_ms + startup_ms, 1) if imports_ms is not None else None,
+            'slowest_imports': imports['slowest'] if imports else None,
+        },
+        'duration_s': round(duration, 3),
+        'surveys_completed': completed,
+        'surveys_abandoned': driver.abandoned,
+        'sessions_left': sessions,
+        'surveys_per_s': round(completed / duration, 2) if duration else None,
+        'updates_per_s': round(updates / duration, 2) if duration else None,
+        'survey_latency_ms': summarize(driver.survey_latencies),
+        'response_latency_ms': summarize(driver.response_latencies),
+        'loop_lag_ms': summarize(lag_samples),
+        'db_write_ms': summarize(db_writes),
+        'db_rows_written': db_rows,
+        'outcomes': dict(telegram.outcomes),
+        'review_sources': counter_values(metrics.REVIEWS_DELIVERED),
+        'failures': dict(driver.failures),
+        'telegram_calls': dict(telegram.calls),
+        'yagpt_responses': {str(status): count for status, count in stub.responses.items()},
+        'yagpt_backends': main.yagpt_client.pool.stats(),
+        'review_text': {
+            'fixes': counter_values(metrics.REVIEW_TEXT_FIXES),
+            'rejected': counter_values(metrics.REVIEW_TEXT_REJECTED),
+        },
+    }
+
+
+# Показатели, которые сравниваются между прогонами: (путь, чем меньше, тем лучше)
+COMPARED = [
+    (('cold_start_ms', 'total'), True),
+    (('surveys_per_s',), False),
+    (('survey_latency_ms', 'p50'), True),
+    (('survey_latency_ms', 'p95'), True),
+    (('survey_latency_ms', 'p99'), True),
+    (('response_latency_ms', 'p95'), True),
+    (('loop_lag_ms', 'p99'), True),
+    (('db_write_ms', 'p95'), True),
+]
+
+
+def compare(previous: dict, current: dict):
+    print(f"\nСравнение с {previous.get('commit')} -> {current.get('commit')}:")
+    for path, lower_is_better in COMPARED:
+        before, after = previous['results'], current['results']
+        for key in path:
+            before = (before or {}).get(key)
+            after = (after or {}).get(key)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        better = (change < 0) == lower_is_better
+        mark = '✅' if better or abs(change) < 5 else '⚠️'
+        print(f"  {mark} {'.'.join(path)}: {before} -> {after} ({change:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон опроса")
+    parser.add_argument('--users', type=int, default=500, help="сколько пользователей проходят опрос")
+    parser.add_argument('--concurrency', type=int, default=100, help="сколько опросов идет одновременно")
+    parser.add_argument('--latency', type=float, default=1.0, help="средняя задержка YaGPT, с")
+    parser.add_argument('--jitter', type=float, default=0.3, help="разброс задержки YaGPT, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="доля очень медленных ответов YaGPT")
+    parser.add_argument('--slow-latency', type=float, default=20.0, help="задержка медленных ответов, с")
+    parser.add_argument('--backends', type=int, default=1, help="сколько каталогов YaGPT в пуле")
+    parser.add_argument('--hot-429', type=float, default=0.0, help=f"доля ответов 429 для каталога {HOT_FOLDER}")
+    parser.add_argument('--dirty-rate', type=float, default=0.0, help="доля ответов с разметкой и эмодзи")
+    parser.add_argument('--invalid-rate', type=float, default=0.0, help="доля негодных ответов, требующих перегенерации")
+    parser.add_argument('--no-hedge', action='store_true', help="не дублировать медленные запросы")
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="задержка каждого вызова Bot API, с")
+    parser.add_argument('--think', type=float, default=0.0, help="средняя пауза пользователя между ответами, с")
+    parser.add_argument('--abandon-rate', type=float, default=0.0, help="доля пользователей, бросающих опрос")
+    parser.add_argument('--session-timeout', type=float, help="через сколько секунд закрывать брошенный опрос")
+    parser.add_argument('--comment-rate', type=float, default=0.3, help="доля пользователей с комментарием")
+    parser.add_argument('--step-timeout', type=float, default=120.0, help="сколько ждать ответа бота, с")
+    parser.add_argument('--streaming', action='store_true', help="потоковая генерация")
+    parser.add_argument('--backend', choices=('yagpt', 'local'), default='yagpt',
+                        help="бэкенд генерации; local — шаблоны, без заглушки YaGPT")
+    parser.add_argument('--candidates', type=int, default=1, help="сколько вариантов отзыва предлагать")
+    parser.add_argument('--pool', action='store_true', help="включить пул готовых отзывов")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='CRITICAL')
+    parser.add_argument('--output', default='benchmark_results.json', help="куда сохранить JSON")
+    parser.add_argument('--compare', help="JSON предыдущего прогона для сравнения")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory(prefix='bot-benchmark-') as workdir:
+        results = asyncio.run(run_benchmark(args, workdir))
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'log_level')},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"\nРезультаты сохранены в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+    # Все опросы завершены или закрыты по таймауту — в памяти не должно остаться ничего
+    leftover = results['sessions_left']
+    finished = not results['failures'] and (args.session_timeout or not results['surveys_abandoned'])
+    if finished and (leftover['sessions'] or leftover['conversations']):
+        sys.exit(f"\n⚠️ После прогона в памяти остались опросы: {leftover}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict
+
+from telegram import Bot, Update
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from telegram.ext import Application, ContextTypes
+
+import keyboards as kb
+from admin import admin_only
+from config import config
+from database import db_manager
+from rate_limit import ChatRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Одновременных запросов sendMessage внутри рассылки
+MAX_IN_FLIGHT = 30
+# Сколько раз повторять отправку после RetryAfter
+MAX_RETRIES = 3
+
+limiter = ChatRateLimiter(config.broadcast.GLOBAL_RATE, config.broadcast.CHAT_RATE)
+_tasks: Dict[int, asyncio.Task] = {}
+# Метка этого процесса в аренде рассылок (см. database.claim_broadcast)
+OWNER = uuid.uuid4().hex
+
+
+def _lease() -> float:
+    return time.time() + config.broadcast.LEASE
+
+
+async def _send(bot: Bot, user_id: int, text: str) -> bool:
+    for _ in range(MAX_RETRIES):
+        await limiter.acquire(user_id)
+        try:
+            await bot.send_message(user_id, text, reply_markup=kb.get_platform_keyboard())
+            return True
+        except RetryAfter as e:
+            # Flood wait касается всего бота — притормаживаем всю рассылку
+            logger.warning(f"Рассылка: RetryAfter {e.retry_after} с")
+            limiter.pause(e.retry_after)
+        except Forbidden:
+            # Пользователь заблокировал бота
+            return False
+        except TelegramError as e:
+            logger.warning(f"Рассылка: не удалось отправить {user_id}: {e}")
+            return False
+    return False
+
+
+async def run_broadcast(bot: Bot, broadcast_id: int, admin_chat_id: int, text: str,
+                        last_user_id: int = 0, sent: int = 0, failed: int = 0):
+    """Разослать text всем авторам отзывов, начиная после last_user_id.
+
+    Получатели читаются из БД пачками, отправки внутри пачки идут
+    параллельно, а их результаты разбираются по порядку user_id. Так
+    last_user_id — граница, до которой отправлено все; она сохраняется
+    раз в CHECKPOINT_INTERVAL секунд и при остановке. После перезапуска
+    повторно уйдут только сообщения, отправленные после последней отметки.
+
+    Рассылку ведет реплика, которая держит ее аренду: контрольная точка
+    продлевает аренду, а если рассылку уже забрала другая реплика, эта
+    останавливается, чтобы не слать сообщения дважды.
+    """
+    semaphore = asyncio.Semaphore(MAX_IN_FLIGHT)
+    loop = asyncio.get_running_loop()
+    next_checkpoint = loop.time() + config.broadcast.CHECKPOINT_INTERVAL
+
+    async def send_one(user_id: int) -> bool:
+        async with semaphore:
+            return await _send(bot, user_id, text)
+
+    try:
+        async for chunk in db_manager.iter_reviewer_ids(last_user_id, config.broadcast.CHUNK_SIZE):
+            tasks = [asyncio.create_task(send_one(user_id)) for user_id in chunk]
+            try:
+                for user_id, task in zip(chunk, tasks):
+                    if await task:
+                        sent += 1
+                    else:
+                        failed += 1
+                    last_user_id = user_id
+                    if loop.time() >= next_checkpoint:
+                        if not await db_manager.save_broadcast_progress(
+                            broadcast_id, OWNER, _lease(), last_user_id, sent, failed
+                        ):
+                            logger.warning(f"Рассылку {broadcast_id} продолжает другая реплика, останавливаемся")
+                            return
+                        next_checkpoint = loop.time() + config.broadcast.CHECKPOINT_INTERVAL
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        if not await db_manager.save_broadcast_progress(
+            broadcast_id, OWNER, 0, last_user_id, sent, failed, status='done'
+        ):
+            logger.warning(f"Рассылку {broadcast_id} продолжает другая реплика, останавливаемся")
+            return
+        logger.info(f"Рассылка {broadcast_id} завершена: отправлено {sent}, ошибок {failed}")
+        await bot.send_message(
+            admin_chat_id,
+            f"📣 Рассылка #{broadcast_id} завершена.\nОтправлено: {sent}\nНе доставлено: {failed}"
+        )
+    except asyncio.CancelledError:
+        # Отправки после last_user_id отменены, отмечаем точную границу и
+        # освобождаем аренду: следующая запущенная реплика сразу продолжит
+        await db_manager.save_broadcast_progress(broadcast_id, OWNER, 0, last_user_id, sent, failed)
+        logger.info(f"Рассылка {broadcast_id} остановлена на user_id {last_user_id}")
+        raise
+    finally:
+        _tasks.pop(broadcast_id, None)
+
+
+def _start(bot: Bot, broadcast_id: int, *args, **kwargs):
+    _tasks[broadcast_id] = asyncio.create_task(
+        run_broadcast(bot, broadcast_id, *args, **kwargs), name=f"broadcast-{broadcast_id}"
+    )
+
+
+@admin_only
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast <текст> — разослать сообщение всем, кто оставлял отзыв"""
+    text = update.message.text.partition(' ')[2].strip()
+    if not text:
+        await update.message.reply_text("Использование: /broadcast <текст сообщения>")
+        return
+
+    broadcast_id = await db_manager.create_broadcast(update.effective_chat.id, text, OWNER, _lease())
+    _start(context.bot, broadcast_id, update.effective_chat.id, text)
+    await update.message.reply_text(f"📣 Рассылка #{broadcast_id} запущена.")
+
+
+async def resume_broadcasts(application: Application):
+    """Продолжить рассылки, прерванные перезапуском.
+
+    Реплик несколько, и каждая при запуске видит одни и те же
+    незавершенные рассылки — продолжает только та, что взяла аренду.
+    """
+    for broadcast_id, admin_chat_id, text, last_user_id, sent, failed in await db_manager.get_unfinished_broadcasts():
+        if not await db_manager.claim_broadcast(broadcast_id, OWNER, _lease()):
+            continue
+        logger.info(f"Продолжаем рассылку {broadcast_id} с user_id {last_user_id}")
+        _start(application.bot, broadcast_id, admin_chat_id, text,
+               last_user_id=last_user_id, sent=sent, failed=failed)
+
+
+async def stop_broadcasts():
+    # Каждая рассылка сохранит границу при отмене и продолжится при следующем запуске
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
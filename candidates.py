@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import config
+from generation_queue import GenerationJob
+
+# Несколько вариантов отзыва на выбор. Варианты живут в памяти, пока
+# пользователь листает их в одном сообщении: переключение — только
+# правка сообщения, без запросов к YaGPT.
+
+CALLBACK_PREFIX = 'cand'
+SHOW = 'show'
+PICK = 'pick'
+MORE = 'more'
+
+SessionKey = Tuple[int, int]
+
+
+@dataclass
+class CandidateSession:
+    job: GenerationJob
+    texts: List[str]
+    index: int = 0
+
+    @property
+    def can_reroll(self) -> bool:
+        return self.job.rerolls < config.generation.MAX_REROLLS
+
+
+class CandidateCache:
+    """Варианты по (chat_id, message_id); самые давние вытесняются"""
+
+    def __init__(self, max_size: int = config.generation.CANDIDATE_CACHE_SIZE):
+        self.max_size = max_size
+        self._sessions: OrderedDict = OrderedDict()
+
+    def put(self, key: SessionKey, session: CandidateSession):
+        self._sessions[key] = session
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_size:
+            self._sessions.popitem(last=False)
+
+    def get(self, key: SessionKey) -> Optional[CandidateSession]:
+        session = self._sessions.get(key)
+        if session is not None:
+            self._sessions.move_to_end(key)
+        return session
+
+    def pop(self, key: SessionKey) -> Optional[CandidateSession]:
+        return self._sessions.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+def parse_callback(data: str) -> Tuple[str, Optional[int]]:
+    """callback_data 'cand:<действие>[:<номер>]' -> (действие, номер)"""
+    _, action, value = (data.split(':', 2) + [''])[:3]
+    return action, int(value) if value.isdigit() else None
+
+
+def render(session: CandidateSession) -> str:
+    return (
+        f"✍️ Вариант {session.index + 1} из {len(session.texts)}:\n\n"
+        f"{session.texts[session.index]}\n\n"
+        "Листайте стрелками и выберите понравившийся вариант."
+    )
+
+
+def keyboard(session: CandidateSession) -> InlineKeyboardMarkup:
+    count = len(session.texts)
+    index = session.index
+    rows = [
+        [
+            InlineKeyboardButton("◀️", callback_data=f"{CALLBACK_PREFIX}:{SHOW}:{(index - 1) % count}"),
+            InlineKeyboardButton(f"{index + 1}/{count}", callback_data=f"{CALLBACK_PREFIX}:{SHOW}:{index}"),
+            InlineKeyboardButton("▶️", callback_data=f"{CALLBACK_PREFIX}:{SHOW}:{(index + 1) % count}"),
+        ],
+        [InlineKeyboardButton("✅ Выбрать этот вариант", callback_data=f"{CALLBACK_PREFIX}:{PICK}:{index}")],
+    ]
+    if session.can_reroll:
+        rows.append([InlineKeyboardButton("🔄 Другие варианты", callback_data=f"{CALLBACK_PREFIX}:{MORE}")])
+    return InlineKeyboardMarkup(rows)
+
+
+candidate_cache = CandidateCache()
@@ -0,0 +1,238 @@
+import os
+from dotenv import load_dotenv
+
+# Скрипты (например, review_pool.py) импортируют конфиг без main.py
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_int_set(name: str) -> frozenset:
+    value = os.getenv(name, '')
+    return frozenset(int(item) for item in value.replace(' ', '').split(',') if item)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Настройки бота
+class BotConfig:
+    TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
+    # polling — long polling, webhook — прием обновлений через HTTP
+    MODE = os.getenv('BOT_MODE', 'polling')
+    # Параллельная обработка апдейтов разных чатов
+    CONCURRENT_UPDATES = _env_bool('BOT_CONCURRENT_UPDATES', True)
+    # Сколько чатов обслуживается одновременно
+    MAX_CONCURRENT_UPDATES = _env_int('BOT_MAX_CONCURRENT_UPDATES', 32)
+    # Telegram ID администраторов через запятую
+    ADMIN_IDS = _env_int_set('ADMIN_IDS')
+    # Задержка правки inline-клавиатуры после нажатия, секунды:
+    # быстрые нажатия подряд сливаются в одну правку
+    KEYBOARD_EDIT_DELAY = float(os.getenv('BOT_KEYBOARD_EDIT_DELAY', '0.4'))
+
+
+# HTTP-сервер (health/readiness и вебхук)
+class ServerConfig:
+    ENABLED = _env_bool('SERVER_ENABLED', True)
+    HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+    # Cloud Run передает порт в PORT
+    PORT = _env_int('PORT', 8080)
+    # Публичный адрес сервиса, например https://bot-xxxx.run.app
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    # Проверяется по заголовку X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_MAX_CONNECTIONS = _env_int('WEBHOOK_MAX_CONNECTIONS', 40)
+
+
+# Общее хранилище состояния опросов
+class StateConfig:
+    ENABLED = _env_bool('STATE_ENABLED', True)
+    PATH = os.getenv('STATE_DB_PATH', 'state.db')
+    # Как часто досбрасывать изменения вне апдейтов (фоновые задачи), секунды
+    FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', '2'))
+    # Через сколько секунд без ответа опрос закрывается; 0 — не закрывать
+    SESSION_TIMEOUT = float(os.getenv('STATE_SESSION_TIMEOUT', '1800'))
+    CONVERSATION_NAME = 'survey'
+
+
+# Массовые рассылки
+class BroadcastConfig:
+    # Общий лимит Telegram — около 30 сообщений в секунду
+    GLOBAL_RATE = float(os.getenv('BROADCAST_GLOBAL_RATE', '25'))
+    # Не чаще одного сообщения в секунду в один чат
+    CHAT_RATE = float(os.getenv('BROADCAST_CHAT_RATE', '1'))
+    # Сколько user_id читать из БД за раз
+    CHUNK_SIZE = _env_int('BROADCAST_CHUNK_SIZE', 500)
+    # Как часто сохранять прогресс, секунды: столько сообщений может уйти повторно после сбоя
+    CHECKPOINT_INTERVAL = float(os.getenv('BROADCAST_CHECKPOINT_INTERVAL', '1'))
+    # На сколько секунд реплика берет рассылку в аренду; продлевается на каждой контрольной точке.
+    # Рассылку с истекшей арендой продолжит другая реплика при запуске
+    LEASE = float(os.getenv('BROADCAST_LEASE', '60'))
+
+
+# Общий HTTP-пул для внешних API
+class HttpConfig:
+    # Максимум одновременных соединений в пуле
+    CONNECTION_LIMIT = _env_int('HTTP_CONNECTION_LIMIT', 20)
+    # Сколько секунд держать простаивающее соединение открытым
+    KEEPALIVE_TIMEOUT = _env_int('HTTP_KEEPALIVE_TIMEOUT', 60)
+    # Время жизни DNS-кэша, секунды
+    DNS_CACHE_TTL = _env_int('HTTP_DNS_CACHE_TTL', 300)
+
+
+# База данных отзывов
+class DatabaseConfig:
+    PATH = os.getenv('DB_PATH', 'reviews.db')
+    # Сколько отзывов пишется одной транзакцией
+    BATCH_SIZE = _env_int('DB_BATCH_SIZE', 50)
+    # Сколько секунд ждать, пока наберется пачка
+    FLUSH_INTERVAL = float(os.getenv('DB_FLUSH_INTERVAL', '0.5'))
+    # Предел очереди отложенной записи
+    QUEUE_SIZE = _env_int('DB_QUEUE_SIZE', 10000)
+    # Сколько раз пробовать записать пачку, прежде чем писать ее по одному отзыву
+    WRITE_ATTEMPTS = _env_int('DB_WRITE_ATTEMPTS', 3)
+    # Пауза перед первым повтором, секунды; дальше удваивается
+    RETRY_DELAY = float(os.getenv('DB_RETRY_DELAY', '0.5'))
+
+
+# Фоновая генерация отзывов
+class GenerationConfig:
+    # Одновременных запросов к YaGPT (по квоте каталога)
+    WORKERS = _env_int('GENERATION_WORKERS', 4)
+    # Сколько задач может ждать в очереди
+    QUEUE_SIZE = _env_int('GENERATION_QUEUE_SIZE', 200)
+    # Срок на задачу с момента постановки в очередь, секунды
+    JOB_TIMEOUT = float(os.getenv('GENERATION_JOB_TIMEOUT', '60'))
+    # Сколько при остановке ждать принятых задач, секунды; остальным — запасной текст.
+    # Cloud Run убивает процесс через 10 с после SIGTERM
+    DRAIN_TIMEOUT = float(os.getenv('GENERATION_DRAIN_TIMEOUT', '6'))
+    # Чем писать отзывы: 'yagpt' или 'local' — шаблоны без сети (нагрузочные тесты, отказ YaGPT)
+    BACKEND = os.getenv('GENERATION_BACKEND', 'yagpt')
+    # Показывать отзыв по мере генерации, редактируя одно сообщение
+    STREAMING = _env_bool('GENERATION_STREAMING', True)
+    # Минимальный интервал между правками сообщения, секунды
+    STREAM_EDIT_INTERVAL = float(os.getenv('GENERATION_STREAM_EDIT_INTERVAL', '1.0'))
+    # Сколько вариантов отзыва предлагать на выбор; 1 — сразу готовый отзыв
+    CANDIDATES = _env_int('GENERATION_CANDIDATES', 1)
+    # Сколько раз можно запросить другие варианты
+    MAX_REROLLS = _env_int('GENERATION_MAX_REROLLS', 2)
+    # Сколько наборов вариантов держать в памяти
+    CANDIDATE_CACHE_SIZE = _env_int('GENERATION_CANDIDATE_CACHE_SIZE', 5000)
+    # Проверка текста отзыва (review_text.py): длина в символах и число предложений
+    REVIEW_MIN_LENGTH = _env_int('GENERATION_REVIEW_MIN_LENGTH', 100)
+    REVIEW_MAX_LENGTH = _env_int('GENERATION_REVIEW_MAX_LENGTH', 1500)
+    REVIEW_MIN_SENTENCES = _env_int('GENERATION_REVIEW_MIN_SENTENCES', 2)
+    REVIEW_MAX_SENTENCES = _env_int('GENERATION_REVIEW_MAX_SENTENCES', 7)
+    # Сколько раз запросить новый текст, если ответ YaGPT не удалось исправить
+    REVIEW_REGENERATIONS = _env_int('GENERATION_REVIEW_REGENERATIONS', 1)
+
+
+# Пул заранее сгенерированных отзывов
+class PoolConfig:
+    ENABLED = _env_bool('POOL_ENABLED', True)
+    # Сколько разных отзывов держать на каждую комбинацию ответов
+    TARGET_PER_COMBO = _env_int('POOL_TARGET_PER_COMBO', 5)
+    # Ниже этого остатка комбинация пополняется
+    LOW_STOCK = _env_int('POOL_LOW_STOCK', 2)
+    # Сколько раз можно выдать один и тот же текст
+    MAX_SERVES = _env_int('POOL_MAX_SERVES', 1)
+    # Период пополнения, секунды
+    REFILL_INTERVAL = _env_int('POOL_REFILL_INTERVAL', 600)
+    # Сколько отзывов генерировать за один проход пополнения
+    REFILL_BATCH = _env_int('POOL_REFILL_BATCH', 20)
+    # Одновременных запросов к YaGPT при пополнении
+    REFILL_CONCURRENCY = _env_int('POOL_REFILL_CONCURRENCY', 2)
+
+
+# Защита вызовов YaGPT
+class ResilienceConfig:
+    # Ошибок подряд до размыкания circuit breaker
+    FAILURE_THRESHOLD = _env_int('YAGPT_FAILURE_THRESHOLD', 5)
+    # Через сколько секунд пробовать снова
+    RESET_TIMEOUT = float(os.getenv('YAGPT_RESET_TIMEOUT', '30'))
+    # Пробных запросов в полуоткрытом состоянии
+    HALF_OPEN_PROBES = _env_int('YAGPT_HALF_OPEN_PROBES', 1)
+    # Попыток на 429/5xx и верхняя граница паузы между ними, секунды
+    RETRY_ATTEMPTS = _env_int('YAGPT_RETRY_ATTEMPTS', 3)
+    RETRY_MAX_WAIT = float(os.getenv('YAGPT_RETRY_MAX_WAIT', '10'))
+    # Адаптивный (AIMD) лимит одновременных запросов
+    CONCURRENCY_INITIAL = _env_int('YAGPT_CONCURRENCY_INITIAL', 4)
+    CONCURRENCY_MIN = _env_int('YAGPT_CONCURRENCY_MIN', 1)
+    CONCURRENCY_MAX = _env_int('YAGPT_CONCURRENCY_MAX', 16)
+    # Дублирующий запрос, если ответа нет дольше обычного (только без потоковой генерации)
+    HEDGE_ENABLED = _env_bool('YAGPT_HEDGE_ENABLED', True)
+    # Через какой перцентиль недавних задержек отправлять дубль
+    HEDGE_PERCENTILE = float(os.getenv('YAGPT_HEDGE_PERCENTILE', '0.9'))
+    # Задержка до дубля, пока статистики мало, и нижняя граница, секунды
+    HEDGE_DELAY = float(os.getenv('YAGPT_HEDGE_DELAY', '5'))
+    HEDGE_MIN_DELAY = float(os.getenv('YAGPT_HEDGE_MIN_DELAY', '0.5'))
+    # Сколько последних задержек учитывать и с какого числа им доверять
+    HEDGE_WINDOW = _env_int('YAGPT_HEDGE_WINDOW', 200)
+    HEDGE_MIN_SAMPLES = _env_int('YAGPT_HEDGE_MIN_SAMPLES', 20)
+    # Доля дублей от всех запросов, не больше
+    HEDGE_MAX_FRACTION = float(os.getenv('YAGPT_HEDGE_MAX_FRACTION', '0.1'))
+
+
+# Ограничения на генерацию отзывов
+class LimitsConfig:
+    # Сколько запросов к YaGPT один пользователь может запустить за окно
+    # (варианты на выбор — GENERATION_CANDIDATES запросов за раз)
+    USER_GENERATIONS = _env_int('LIMIT_USER_GENERATIONS', 5)
+    # Окно, секунды
+    USER_WINDOW = _env_int('LIMIT_USER_WINDOW', 3600)
+    # Сколько пользователей помнить; самые давние забываются
+    MAX_USERS = _env_int('LIMIT_MAX_USERS', 10000)
+    # Суточный бюджет YaGPT в токенах и в рублях; 0 — без ограничения
+    DAILY_TOKENS = _env_int('LIMIT_DAILY_TOKENS', 0)
+    DAILY_COST = float(os.getenv('LIMIT_DAILY_COST', '0'))
+    # Цена 1000 токенов, рубли
+    TOKEN_PRICE = float(os.getenv('YAGPT_TOKEN_PRICE', '0.2'))
+
+
+# Проверка отзывов на почти-дубликаты
+class DedupConfig:
+    ENABLED = _env_bool('DEDUP_ENABLED', True)
+    # Оценка сходства (Жаккар по MinHash), с которой отзыв считается повтором
+    THRESHOLD = float(os.getenv('DEDUP_THRESHOLD', '0.6'))
+    # Сколько раз перегенерировать слишком похожий отзыв
+    MAX_REGENERATIONS = _env_int('DEDUP_MAX_REGENERATIONS', 2)
+    # Сколько кандидатов из LSH-корзин сравнивать
+    MAX_CANDIDATES = _env_int('DEDUP_MAX_CANDIDATES', 200)
+    # По сколько старых отзывов индексировать за проход при старте
+    BACKFILL_CHUNK = _env_int('DEDUP_BACKFILL_CHUNK', 500)
+
+
+# Метрики Prometheus
+class MetricsConfig:
+    # Отдавать /metrics на HTTP-сервере
+    ENABLED = _env_bool('METRICS_ENABLED', True)
+    # Как часто замерять задержку цикла событий, секунды
+    LOOP_LAG_INTERVAL = float(os.getenv('METRICS_LOOP_LAG_INTERVAL', '0.5'))
+    # Как часто писать в лог число опросов в памяти и RSS процесса, секунды
+    SESSION_REPORT_INTERVAL = float(os.getenv('METRICS_SESSION_REPORT_INTERVAL', '3600'))
+
+
+class Config:
+    bot = BotConfig
+    server = ServerConfig
+    state = StateConfig
+    broadcast = BroadcastConfig
+    http = HttpConfig
+    db = DatabaseConfig
+    generation = GenerationConfig
+    pool = PoolConfig
+    resilience = ResilienceConfig
+    limits = LimitsConfig
+    metrics = MetricsConfig
+    dedup = DedupConfig
+
+
+config = Config()
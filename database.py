@@ -1,45 +1,547 @@
 import aiosqlite
+import asyncio
+import functools
 import json
 import logging
+import time
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 from config import config
+import metrics
+import minhash
+import survey
 
 logger = logging.getLogger(__name__)
 
+# Миграции схемы: номер версии хранится в PRAGMA user_version.
+# Каждая миграция выполняется один раз, по порядку, в своей транзакции.
+
+async def _migration_1(db: aiosqlite.Connection):
+    # Исходная схема из main.py
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            user_name TEXT,
+            gender TEXT,
+            service TEXT,
+            likes TEXT,
+            recommendation TEXT,
+            comment TEXT,
+            generated_review TEXT,
+            date_created DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+async def _migration_2(db: aiosqlite.Connection):
+    # Колонка status из старой схемы database.py
+    async with db.execute("PRAGMA table_info(reviews)") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if 'status' not in columns:
+        await db.execute("ALTER TABLE reviews ADD COLUMN status TEXT DEFAULT 'draft'")
+
+async def _migration_3(db: aiosqlite.Connection):
+    # Пул заранее сгенерированных отзывов для опросов без комментария
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS review_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            combo_key TEXT NOT NULL,
+            review_text TEXT NOT NULL,
+            served_count INTEGER NOT NULL DEFAULT 0,
+            date_created DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_review_pool_combo
+        ON review_pool (combo_key, served_count)
+    ''')
+
+async def _migration_4(db: aiosqlite.Connection):
+    # Рассылки с контрольной точкой для продолжения после перезапуска
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'running',
+            date_created DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+async def _migration_5(db: aiosqlite.Connection):
+    # Индексы для отчетов и выгрузок, маска likes и сводные таблицы,
+    # которые дальше обновляются при каждой записи пачки (_write_batch)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_reviews_user_id ON reviews (user_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_reviews_date_created ON reviews (date_created)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_reviews_service ON reviews (service, date_created)")
+
+    async with db.execute("PRAGMA table_info(reviews)") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if 'likes_mask' not in columns:
+        # Бит i — i-й вариант шага likes, как в survey.py
+        await db.execute("ALTER TABLE reviews ADD COLUMN likes_mask INTEGER NOT NULL DEFAULT 0")
+
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS review_stats_service (
+            service TEXT PRIMARY KEY,
+            reviews INTEGER NOT NULL DEFAULT 0,
+            recommended INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS review_stats_daily (
+            day TEXT NOT NULL,
+            service TEXT NOT NULL,
+            reviews INTEGER NOT NULL DEFAULT 0,
+            recommended INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, service)
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS review_stats_likes (
+            name TEXT PRIMARY KEY,
+            reviews INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # Заполняем по уже накопленным отзывам
+    masks = []
+    async with db.execute("SELECT id, likes FROM reviews") as cursor:
+        async for review_id, likes_json in cursor:
+            try:
+                likes = json.loads(likes_json or '[]')
+            except ValueError:
+                likes = []
+            masks.append((LIKES_STEP.mask(likes), review_id))
+    await db.executemany("UPDATE reviews SET likes_mask = ? WHERE id = ?", masks)
+
+    await db.execute("DELETE FROM review_stats_service")
+    await db.execute('''
+        INSERT INTO review_stats_service (service, reviews, recommended)
+        SELECT service, COUNT(*), SUM(recommendation = ?) FROM reviews
+        WHERE service IS NOT NULL GROUP BY service
+    ''', (survey.RECOMMEND_YES,))
+    await db.execute("DELETE FROM review_stats_daily")
+    await db.execute('''
+        INSERT INTO review_stats_daily (day, service, reviews, recommended)
+        SELECT date(date_created), service, COUNT(*), SUM(recommendation = ?) FROM reviews
+        WHERE service IS NOT NULL GROUP BY 1, 2
+    ''', (survey.RECOMMEND_YES,))
+    await db.execute("DELETE FROM review_stats_likes")
+    for index, like in enumerate(LIKES_STEP.options):
+        await db.execute('''
+            INSERT INTO review_stats_likes (name, reviews)
+            SELECT ?, COUNT(*) FROM reviews WHERE likes_mask & ? != 0
+        ''', (like, 1 << index))
+
+async def _migration_6(db: aiosqlite.Connection):
+    # MinHash-подписи отзывов и LSH-корзины для поиска почти-дубликатов.
+    # Старые отзывы индексируются в фоне (DatabaseManager.backfill_signatures)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS review_signatures (
+            review_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL
+        )
+    ''')
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS review_lsh (
+            bucket INTEGER NOT NULL,
+            review_id INTEGER NOT NULL
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_review_lsh_bucket ON review_lsh (bucket)")
+
+async def _migration_7(db: aiosqlite.Connection):
+    # Аренда рассылки: ее ведет одна реплика, пока не истечет lease_until (unix-время).
+    # Прежние незавершенные рассылки свободны — их заберет первая запущенная реплика
+    await db.execute("ALTER TABLE broadcasts ADD COLUMN owner TEXT")
+    await db.execute("ALTER TABLE broadcasts ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+]
+
+LIKES_STEP = survey.step('likes')
+
+
+def _signatures(texts: List[Optional[str]]) -> List[List[int]]:
+    # Считается в потоке, чтобы пачка подписей не задерживала цикл событий
+    return [minhash.signature(text or "") for text in texts]
+
+
+ReviewRow = Tuple[int, str, str, str, str, int, str, str, str]
+
+def _opened(method):
+    """Метод, которому нужна открытая БД: дождется открытия или сам его начнет"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        await self.init_database()
+        return await method(self, *args, **kwargs)
+    return wrapper
+
 class DatabaseManager:
     def __init__(self, db_path: str = config.db.PATH):
         self.db_path = db_path
+        self._db: Optional[aiosqlite.Connection] = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=config.db.QUEUE_SIZE)
+        self._writer_task: Optional[asyncio.Task] = None
+        self._opening: Optional[asyncio.Task] = None
 
     async def init_database(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS reviews (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT NOT NULL,
-                    gender TEXT NOT NULL,
-                    service TEXT NOT NULL,
-                    likes TEXT NOT NULL,
-                    recommendation TEXT NOT NULL,
-                    comment TEXT,
-                    generated_review TEXT NOT NULL,
-                    status TEXT DEFAULT 'draft',
-                    date_created DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            await db.commit()
-
-    async def save_review(self, user_id: int, user_name: str, gender: str, service: str, 
+        """Открыть БД и применить миграции.
+
+        Открытие идет один раз, повторные вызовы ждут его. При старте
+        бота запускается в фоне, чтобы миграции не задерживали прием
+        обновлений.
+        """
+        if self._opening is None:
+            self._opening = asyncio.create_task(self._open())
+        await asyncio.shield(self._opening)
+
+    async def _open(self):
+        # Одно соединение на весь процесс
+        started = asyncio.get_running_loop().time()
+        self._db = await aiosqlite.connect(self.db_path)
+        await self._db.execute("PRAGMA journal_mode=WAL")
+        await self._db.execute("PRAGMA synchronous=NORMAL")
+        await self._migrate()
+        self._writer_task = asyncio.create_task(self._writer())
+        logger.info(f"БД открыта за {(asyncio.get_running_loop().time() - started) * 1000:.0f} мс")
+
+    async def _migrate(self):
+        async with self._db.execute("PRAGMA user_version") as cursor:
+            version = (await cursor.fetchone())[0]
+
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            # sqlite3 сам открывает транзакцию только перед INSERT/UPDATE/DELETE,
+            # а CREATE и ALTER без BEGIN фиксируются сразу — упавшая на середине
+            # миграция оставила бы схему наполовину измененной
+            await self._db.execute("BEGIN")
+            try:
+                await migration(self._db)
+                await self._db.execute(f"PRAGMA user_version = {number}")
+                await self._db.commit()
+            except Exception:
+                await self._db.rollback()
+                raise
+            logger.info(f"Миграция БД {number} применена")
+
+    @_opened
+    async def save_review(self, user_id: int, user_name: str, gender: str, service: str,
                          likes: List[str], recommendation: str, comment: str, generated_review: str):
+        # Запись откладывается: отзыв попадает в очередь и пишется пачкой
         likes_json = json.dumps(likes, ensure_ascii=False)
+        likes_mask = LIKES_STEP.mask(likes)
+        # Обычно мгновенно; долго — только если очередь записи переполнена
+        with metrics.DB_SAVE_REVIEW.time():
+            await self._queue.put(
+                (user_id, user_name, gender, service, likes_json, likes_mask, recommendation, comment, generated_review)
+            )
+
+    @_opened
+    async def take_pooled_review(self, combo_key: str, max_serves: int) -> Optional[str]:
+        """Выдать наименее использованный готовый отзыв для комбинации ответов"""
+        async with self._db.execute('''
+            UPDATE review_pool SET served_count = served_count + 1
+            WHERE id = (
+                SELECT id FROM review_pool
+                WHERE combo_key = ? AND served_count < ?
+                ORDER BY served_count
+                LIMIT 1
+            )
+            RETURNING review_text
+        ''', (combo_key, max_serves)) as cursor:
+            row = await cursor.fetchone()
+        await self._db.commit()
+        return row[0] if row else None
+
+    @_opened
+    async def add_pooled_reviews(self, rows: List[Tuple[str, str]]):
+        """Добавить в пул пары (combo_key, review_text)"""
+        await self._db.executemany(
+            "INSERT INTO review_pool (combo_key, review_text) VALUES (?, ?)", rows
+        )
+        await self._db.commit()
+
+    @_opened
+    async def prune_pool(self, max_serves: int) -> int:
+        """Удалить из пула исчерпанные отзывы; возвращает, сколько удалено"""
+        async with self._db.execute("DELETE FROM review_pool WHERE served_count >= ?", (max_serves,)) as cursor:
+            pruned = cursor.rowcount
+        await self._db.commit()
+        return pruned
+
+    @_opened
+    async def pooled_stock(self, max_serves: int) -> Dict[str, int]:
+        """Сколько еще не исчерпанных отзывов осталось по каждой комбинации"""
+        async with self._db.execute('''
+            SELECT combo_key, COUNT(*) FROM review_pool
+            WHERE served_count < ?
+            GROUP BY combo_key
+        ''', (max_serves,)) as cursor:
+            return {key: count for key, count in await cursor.fetchall()}
+
+    async def iter_reviewer_ids(self, after_user_id: int = 0, chunk_size: int = 500) -> AsyncIterator[List[int]]:
+        """Уникальные user_id авторов отзывов по возрастанию, пачками.
+
+        Пагинация по ключу (user_id > последнего), так что в памяти
+        только одна пачка, а продолжить можно с любого user_id.
+        """
+        await self.init_database()
+        while True:
+            async with self._db.execute('''
+                SELECT DISTINCT user_id FROM reviews
+                WHERE user_id > ?
+                ORDER BY user_id
+                LIMIT ?
+            ''', (after_user_id, chunk_size)) as cursor:
+                chunk = [row[0] for row in await cursor.fetchall()]
+            if not chunk:
+                return
+            yield chunk
+            after_user_id = chunk[-1]
+
+    @_opened
+    async def create_broadcast(self, admin_chat_id: int, text: str, owner: str, lease_until: float) -> int:
+        async with self._db.execute(
+            "INSERT INTO broadcasts (admin_chat_id, text, owner, lease_until) VALUES (?, ?, ?, ?)",
+            (admin_chat_id, text, owner, lease_until)
+        ) as cursor:
+            broadcast_id = cursor.lastrowid
+        await self._db.commit()
+        return broadcast_id
+
+    @_opened
+    async def claim_broadcast(self, broadcast_id: int, owner: str, lease_until: float) -> bool:
+        """Взять незавершенную рассылку, если ее аренда истекла; False — ее ведет другая реплика"""
+        async with self._db.execute('''
+            UPDATE broadcasts SET owner = ?, lease_until = ?
+            WHERE id = ? AND status = 'running' AND (owner = ? OR lease_until < ?)
+        ''', (owner, lease_until, broadcast_id, owner, time.time())) as cursor:
+            claimed = cursor.rowcount == 1
+        await self._db.commit()
+        return claimed
+
+    @_opened
+    async def save_broadcast_progress(self, broadcast_id: int, owner: str, lease_until: float,
+                                      last_user_id: int, sent: int, failed: int, status: str = 'running') -> bool:
+        """Сохранить прогресс и продлить аренду; False — рассылку уже забрала другая реплика"""
+        async with self._db.execute('''
+            UPDATE broadcasts SET last_user_id = ?, sent = ?, failed = ?, status = ?, lease_until = ?
+            WHERE id = ? AND owner = ?
+        ''', (last_user_id, sent, failed, status, lease_until, broadcast_id, owner)) as cursor:
+            saved = cursor.rowcount == 1
+        await self._db.commit()
+        return saved
+
+    @_opened
+    async def get_unfinished_broadcasts(self) -> List[Tuple[int, int, str, int, int, int]]:
+        """Незавершенные рассылки, которые сейчас никто не ведет"""
+        async with self._db.execute('''
+            SELECT id, admin_chat_id, text, last_user_id, sent, failed
+            FROM broadcasts WHERE status = 'running' AND lease_until < ?
+            ORDER BY id
+        ''', (time.time(),)) as cursor:
+            return list(await cursor.fetchall())
+
+    async def _index_signatures(self, signatures: Iterable[Tuple[int, List[int]]]):
+        signature_rows = []
+        bucket_rows = []
+        for review_id, signature in signatures:
+            signature_rows.append((review_id, minhash.pack(signature)))
+            bucket_rows.extend((bucket, review_id) for bucket in minhash.buckets(signature))
+        await self._db.executemany(
+            "INSERT OR REPLACE INTO review_signatures (review_id, signature) VALUES (?, ?)", signature_rows
+        )
+        await self._db.executemany("INSERT INTO review_lsh (bucket, review_id) VALUES (?, ?)", bucket_rows)
+
+    @_opened
+    async def max_similarity(self, signature: List[int], limit: int = config.dedup.MAX_CANDIDATES) -> float:
+        """Наибольшее сходство с уже сохраненными отзывами.
+
+        Сравниваются только кандидаты из общих LSH-корзин — один
+        индексный запрос, сколько бы отзывов ни было в таблице.
+        """
+        buckets = minhash.buckets(signature)
+        placeholders = ', '.join('?' * len(buckets))
+        async with self._db.execute(f'''
+            SELECT signature FROM review_signatures
+            WHERE review_id IN (
+                SELECT DISTINCT review_id FROM review_lsh WHERE bucket IN ({placeholders}) LIMIT ?
+            )
+        ''', (*buckets, limit)) as cursor:
+            rows = await cursor.fetchall()
+        return max((minhash.similarity(signature, minhash.unpack(row[0])) for row in rows), default=0.0)
+
+    @_opened
+    async def backfill_signatures(self, chunk_size: int = config.dedup.BACKFILL_CHUNK) -> int:
+        """Проиндексировать отзывы, сохраненные до появления индекса похожести"""
+        indexed = 0
+        last_id = 0
+        while True:
+            async with self._db.execute('''
+                SELECT r.id, r.generated_review FROM reviews r
+                LEFT JOIN review_signatures s ON s.review_id = r.id
+                WHERE r.id > ? AND s.review_id IS NULL
+                ORDER BY r.id LIMIT ?
+            ''', (last_id, chunk_size)) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                if indexed:
+                    logger.info(f"Индекс похожести: добавлено {indexed} старых отзывов")
+                return indexed
+            signatures = await asyncio.to_thread(_signatures, [text for _, text in rows])
+            await self._index_signatures(zip((review_id for review_id, _ in rows), signatures))
+            await self._db.commit()
+            indexed += len(rows)
+            last_id = rows[-1][0]
+
+    @_opened
+    async def get_stats(self, days: int = 7) -> Dict[str, Any]:
+        """Сводка по отзывам из сводных таблиц — без просмотра reviews"""
+        async with self._db.execute(
+            "SELECT service, reviews, recommended FROM review_stats_service ORDER BY reviews DESC"
+        ) as cursor:
+            services = list(await cursor.fetchall())
+        async with self._db.execute(
+            "SELECT name, reviews FROM review_stats_likes ORDER BY reviews DESC"
+        ) as cursor:
+            likes = list(await cursor.fetchall())
+        async with self._db.execute('''
+            SELECT day, SUM(reviews), SUM(recommended) FROM review_stats_daily
+            WHERE day > date('now', ?)
+            GROUP BY day ORDER BY day DESC
+        ''', (f'-{days} days',)) as cursor:
+            daily = list(await cursor.fetchall())
+
+        return {
+            'reviews': sum(row[1] for row in services),
+            'recommended': sum(row[2] for row in services),
+            'services': services,
+            'likes': likes,
+            'daily': daily,
+        }
+
+    @_opened
+    async def flush(self):
+        """Дождаться записи всех отзывов из очереди"""
+        await self._queue.join()
+
+    async def close(self):
+        if self._opening is not None:
+            # Если БД еще открывается, дожидаемся — иначе соединение останется открытым
+            await asyncio.wait([self._opening])
+            self._opening = None
+        if self._writer_task is not None:
+            # None — сигнал писателю дописать очередь и завершиться
+            await self._queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    async def _writer(self):
+        stopping = False
+
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+
+            # Даем очереди набраться, чтобы писать пачкой
+            if self._queue.qsize() < config.db.BATCH_SIZE:
+                await asyncio.sleep(config.db.FLUSH_INTERVAL)
+
+            batch = [item]
+            while len(batch) < config.db.BATCH_SIZE and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                if not await self._write_with_retries(batch, config.db.WRITE_ATTEMPTS):
+                    # Пачка не пишется целиком — по одному, чтобы плохая строка не утянула остальные
+                    for row in batch:
+                        if not await self._write_with_retries([row], 1):
+                            metrics.DB_REVIEWS_LOST.inc()
+                            logger.error(f"Отзыв пользователя {row[0]} не записан в БД и потерян")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_with_retries(self, batch: List[ReviewRow], attempts: int) -> bool:
+        """Записать пачку, повторяя с растущей паузой; False — если так и не вышло"""
+        for attempt in range(attempts):
+            if attempt:
+                await asyncio.sleep(config.db.RETRY_DELAY * 2 ** (attempt - 1))
+            try:
+                with metrics.DB_WRITE_BATCH.time():
+                    await self._write_batch(batch)
+                return True
+            except Exception as e:
+                logger.warning(f"Ошибка записи {len(batch)} отзывов в БД (попытка {attempt + 1} из {attempts}): {e}")
+                try:
+                    await self._db.rollback()
+                except Exception as rollback_error:
+                    logger.error(f"Не удалось откатить транзакцию: {rollback_error}")
+        return False
+
+    async def _write_batch(self, batch: List[ReviewRow]):
+        # Вся пачка — одна транзакция, вместе со сводными таблицами и индексом похожести
+        review_ids = []
+        for row in batch:
+            async with self._db.execute('''
+                INSERT INTO reviews (user_id, user_name, gender, service, likes, likes_mask, recommendation, comment, generated_review)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row) as cursor:
+                review_ids.append(cursor.lastrowid)
+        if config.dedup.ENABLED:
+            signatures = await asyncio.to_thread(_signatures, [row[8] for row in batch])
+            await self._index_signatures(zip(review_ids, signatures))
 
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                INSERT INTO reviews (user_id, user_name, gender, service, likes, recommendation, comment, generated_review)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (user_id, user_name, gender, service, likes_json, recommendation, comment, generated_review))
+        # Сначала сворачиваем пачку в приращения, потом по одному upsert на ключ
+        services: Dict[str, List[int]] = {}
+        likes: Dict[str, int] = {}
+        for row in batch:
+            service, likes_mask, recommendation = row[3], row[5], row[6]
+            totals = services.setdefault(service, [0, 0])
+            totals[0] += 1
+            totals[1] += recommendation == survey.RECOMMEND_YES
+            for like in LIKES_STEP.selected(likes_mask):
+                likes[like] = likes.get(like, 0) + 1
 
-            await db.commit()
+        service_rows = [(service, reviews, recommended) for service, (reviews, recommended) in services.items()]
+        await self._db.executemany('''
+            INSERT INTO review_stats_service (service, reviews, recommended) VALUES (?, ?, ?)
+            ON CONFLICT (service) DO UPDATE SET
+                reviews = reviews + excluded.reviews,
+                recommended = recommended + excluded.recommended
+        ''', service_rows)
+        # date('now') совпадает с днем date_created, который тоже ставится в UTC
+        await self._db.executemany('''
+            INSERT INTO review_stats_daily (day, service, reviews, recommended) VALUES (date('now'), ?, ?, ?)
+            ON CONFLICT (day, service) DO UPDATE SET
+                reviews = reviews + excluded.reviews,
+                recommended = recommended + excluded.recommended
+        ''', service_rows)
+        await self._db.executemany('''
+            INSERT INTO review_stats_likes (name, reviews) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET reviews = reviews + excluded.reviews
+        ''', list(likes.items()))
+        await self._db.commit()
 
-db_manager = DatabaseManager()
\ No newline at end of file
+db_manager = DatabaseManager()
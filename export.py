@@ -0,0 +1,197 @@
+import asyncio
+import csv
+import datetime
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import survey
+from admin import admin_only
+from database import db_manager
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'jsonl')
+COLUMNS = (
+    'id', 'date_created', 'user_id', 'user_name', 'gender', 'service',
+    'likes', 'recommendation', 'comment', 'generated_review',
+)
+# Сколько строк читать из курсора за раз — столько и держим в памяти
+CHUNK_SIZE = 1000
+# Telegram принимает от ботов файлы до 50 МБ
+MAX_DOCUMENT_SIZE = 50 * 1024 * 1024
+
+USAGE = (
+    "Использование: /export [csv|jsonl] [с ГГГГ-ММ-ДД] [по ГГГГ-ММ-ДД] [услуга]\n"
+    "Например: /export jsonl 2024-01-01 2024-01-31 Покупка квартиры"
+)
+
+_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+# Одна выгрузка за раз: каждая занимает поток и читает всю выборку
+_lock = asyncio.Lock()
+
+
+class ExportArgumentError(ValueError):
+    pass
+
+
+@dataclass
+class ExportRequest:
+    fmt: str = 'csv'
+    date_from: Optional[datetime.date] = None
+    date_to: Optional[datetime.date] = None
+    service: Optional[str] = None
+
+    @property
+    def filename(self) -> str:
+        parts = ['reviews']
+        if self.date_from:
+            parts.append(f"from-{self.date_from}")
+        if self.date_to:
+            parts.append(f"to-{self.date_to}")
+        if self.service:
+            parts.append(self.service.lower().replace(' ', '-'))
+        return f"{'_'.join(parts)}.{self.fmt}.gz"
+
+
+def parse_args(args: List[str]) -> ExportRequest:
+    """Разобрать аргументы /export: формат, до двух дат и название услуги"""
+    request = ExportRequest()
+    rest = []
+    dates = []
+    for arg in args:
+        if arg.lower() in FORMATS and not rest:
+            request.fmt = arg.lower()
+        elif _DATE.match(arg) and not rest:
+            try:
+                dates.append(datetime.date.fromisoformat(arg))
+            except ValueError:
+                raise ExportArgumentError(f"Неверная дата: {arg}")
+        else:
+            rest.append(arg)
+
+    if len(dates) > 2:
+        raise ExportArgumentError("Укажите не больше двух дат")
+    if dates:
+        request.date_from = dates[0]
+    if len(dates) == 2:
+        request.date_to = dates[1]
+        if request.date_to < request.date_from:
+            raise ExportArgumentError("Дата начала позже даты конца")
+
+    if rest:
+        name = " ".join(rest).lower()
+        services = {option.lower(): option for option in survey.step('service').options}
+        if name not in services:
+            raise ExportArgumentError(f"Неизвестная услуга. Варианты: {', '.join(services.values())}")
+        request.service = services[name]
+    return request
+
+
+def _query(request: ExportRequest) -> Tuple[str, list]:
+    conditions = []
+    params = []
+    if request.service:
+        conditions.append("service = ?")
+        params.append(request.service)
+    if request.date_from:
+        conditions.append("date_created >= ?")
+        params.append(request.date_from.isoformat())
+    if request.date_to:
+        # date_created хранится как 'ГГГГ-ММ-ДД ЧЧ:ММ:СС', конец — включительно
+        conditions.append("date_created < ?")
+        params.append((request.date_to + datetime.timedelta(days=1)).isoformat())
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {', '.join(COLUMNS)} FROM reviews {where} ORDER BY id", params
+
+
+def write_export(db_path: str, path: str, request: ExportRequest) -> int:
+    """Записать выборку в gzip-файл, возвращает число строк.
+
+    Работает в отдельном потоке со своим соединением только для чтения:
+    в режиме WAL оно не мешает записи отзывов. Строки читаются пачками
+    по CHUNK_SIZE, так что память не зависит от размера таблицы.
+    """
+    sql, params = _query(request)
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rows = 0
+    try:
+        cursor = connection.execute(sql, params)
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as out:
+            writer = csv.writer(out) if request.fmt == 'csv' else None
+            if writer:
+                writer.writerow(COLUMNS)
+            while True:
+                chunk = cursor.fetchmany(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if writer:
+                    writer.writerows(chunk)
+                else:
+                    for row in chunk:
+                        record = dict(zip(COLUMNS, row))
+                        try:
+                            record['likes'] = json.loads(record['likes'] or '[]')
+                        except ValueError:
+                            pass
+                        out.write(json.dumps(record, ensure_ascii=False))
+                        out.write('\n')
+                rows += len(chunk)
+    finally:
+        connection.close()
+    return rows
+
+
+@admin_only
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export [csv|jsonl] [с] [по] [услуга] — выгрузка отзывов файлом"""
+    try:
+        request = parse_args(context.args or [])
+    except ExportArgumentError as e:
+        await update.message.reply_text(f"{e}\n\n{USAGE}")
+        return
+
+    if _lock.locked():
+        await update.message.reply_text("⏳ Предыдущая выгрузка еще готовится, попробуйте чуть позже.")
+        return
+
+    async with _lock:
+        await update.message.reply_text("⏳ Готовлю выгрузку...")
+        # Отзывы из очереди записи тоже должны попасть в файл
+        await db_manager.flush()
+
+        fd, path = tempfile.mkstemp(suffix=f".{request.fmt}.gz")
+        os.close(fd)
+        try:
+            rows = await asyncio.to_thread(write_export, db_manager.db_path, path, request)
+            if not rows:
+                await update.message.reply_text("По этим условиям отзывов нет.")
+                return
+            size = os.path.getsize(path)
+            if size > MAX_DOCUMENT_SIZE:
+                await update.message.reply_text(
+                    f"Файл получился {size // (1024 * 1024)} МБ — больше лимита Telegram. Сузьте период."
+                )
+                return
+
+            logger.info(f"Выгрузка {rows} отзывов ({size} байт) для {update.effective_user.id}")
+            with open(path, 'rb') as document:
+                await update.message.reply_document(
+                    document,
+                    filename=request.filename,
+                    caption=f"📦 Отзывов: {rows}",
+                    write_timeout=120,
+                    read_timeout=120
+                )
+        finally:
+            os.remove(path)
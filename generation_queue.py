@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from telegram import Bot
+
+from config import config
+from resilience import request_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationQueueFull(Exception):
+    """Очередь генерации переполнена"""
+
+
+@dataclass
+class GenerationJob:
+    chat_id: int
+    user_id: int
+    user_name: str
+    gender: str
+    service: str
+    likes: List[str]
+    recommendation: str
+    comment: str = ""
+    # Сообщение, в котором уже показан текст по ходу генерации
+    message_id: Optional[int] = None
+    # Сколько раз пользователь просил другие варианты
+    rerolls: int = 0
+    # Крайний срок по часам event loop, выставляется при постановке в очередь
+    deadline: float = field(default=0.0, compare=False)
+
+
+# Результат генерации: текст, несколько вариантов на выбор или None
+Result = Union[str, List[str], None]
+Producer = Callable[[Bot, GenerationJob], Awaitable[Result]]
+Deliverer = Callable[[Bot, GenerationJob, Result], Awaitable[None]]
+
+
+class GenerationPool:
+    """Пул фоновых воркеров для генерации отзывов.
+
+    Обработчик только ставит задачу в очередь и сразу возвращается.
+    Воркер вызывает produce() не дольше срока задачи, а затем deliver()
+    с результатом (None, если генерация не удалась или срок истек).
+    При остановке задачи, не успевшие за drain_timeout, тоже получают
+    deliver() с None — запасной текст вместо тишины.
+    """
+
+    def __init__(self, produce: Producer, deliver: Deliverer,
+                 workers: int = config.generation.WORKERS,
+                 queue_size: int = config.generation.QUEUE_SIZE,
+                 job_timeout: float = config.generation.JOB_TIMEOUT,
+                 drain_timeout: float = config.generation.DRAIN_TIMEOUT):
+        self._produce = produce
+        self._deliver = deliver
+        self._workers_count = workers
+        self._job_timeout = job_timeout
+        self._drain_timeout = drain_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers: List[asyncio.Task] = []
+        # Задачи, для которых воркер сейчас генерирует текст
+        self._producing: Dict[asyncio.Task, GenerationJob] = {}
+        self._busy = 0
+        self._bot: Optional[Bot] = None
+
+    @property
+    def depth(self) -> int:
+        """Сколько задач ждут или выполняются"""
+        return self._queue.qsize() + self._busy
+
+    @property
+    def saturated(self) -> bool:
+        """Все воркеры заняты, новая задача будет ждать"""
+        return self.depth >= self._workers_count
+
+    @property
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        for number in range(self._workers_count):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"generation-worker-{number}"))
+
+    async def stop(self):
+        # Дожидаемся уже принятых задач, но не дольше drain_timeout:
+        # после SIGTERM платформа дает на остановку считанные секунды
+        try:
+            await asyncio.wait_for(self._queue.join(), self._drain_timeout)
+        except asyncio.TimeoutError:
+            late = list(self._producing.values())
+            for worker in self._producing:
+                worker.cancel()
+            while not self._queue.empty():
+                late.append(self._queue.get_nowait())
+                self._queue.task_done()
+            logger.warning(f"Генерация не уложилась в {self._drain_timeout} с при остановке, "
+                           f"запасной текст для {len(late)} задач")
+            await asyncio.gather(*(self._deliver_safely(job, None) for job in late))
+            # Остальные воркеры уже отправляют готовые отзывы
+            await self._queue.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    def submit(self, job: GenerationJob):
+        job.deadline = asyncio.get_running_loop().time() + self._job_timeout
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise GenerationQueueFull()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        worker = asyncio.current_task()
+        while True:
+            job = await self._queue.get()
+            self._busy += 1
+            try:
+                text = None
+                remaining = job.deadline - loop.time()
+                if remaining > 0:
+                    # wait_for запускает генерацию в новой задаче с копией контекста
+                    request_deadline.set(job.deadline)
+                    self._producing[worker] = job
+                    try:
+                        text = await asyncio.wait_for(self._produce(self._bot, job), remaining)
+                    except asyncio.TimeoutError:
+                        logger.warning(f"Генерация для чата {job.chat_id} не уложилась в срок")
+                    except Exception as e:
+                        logger.error(f"Ошибка генерации для чата {job.chat_id}: {e}")
+                    finally:
+                        # Дальше отзыв отправляется: stop() его уже не перехватит
+                        self._producing.pop(worker, None)
+                else:
+                    logger.warning(f"Задача чата {job.chat_id} простояла в очереди дольше срока")
+
+                await self._deliver_safely(job, text)
+            finally:
+                self._busy -= 1
+                self._queue.task_done()
+
+    async def _deliver_safely(self, job: GenerationJob, text: Result):
+        try:
+            await self._deliver(self._bot, job, text)
+        except Exception as e:
+            logger.error(f"Ошибка отправки отзыва в чат {job.chat_id}: {e}")
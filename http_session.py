@@ -0,0 +1,40 @@
+import logging
+from typing import Optional
+
+import aiohttp
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Одна сессия на процесс: соединения и TLS переиспользуются между запросами
+_session: Optional[aiohttp.ClientSession] = None
+
+
+async def open_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=config.http.CONNECTION_LIMIT,
+            keepalive_timeout=config.http.KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=config.http.DNS_CACHE_TTL,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+        logger.info("HTTP-сессия открыта")
+    return _session
+
+
+async def get_session() -> aiohttp.ClientSession:
+    # Обычно сессия уже открыта в post_init, но скрипты и тесты
+    # могут вызывать клиентов и без приложения
+    if _session is None or _session.closed:
+        return await open_session()
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("HTTP-сессия закрыта")
+    _session = None
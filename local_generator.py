@@ -0,0 +1,287 @@
+import random
+import re
+from typing import Dict, List, Optional, Sequence
+
+import survey
+
+# Локальный генератор отзывов: шаблоны и синонимы, без сети.
+#
+# Отзыв собирается из предложений: вступление с упоминанием услуги и
+# агентства, предложения о том, что понравилось, подробность об услуге,
+# комментарий клиента и завершение. Середина перемешивается, у каждого
+# предложения несколько вариантов. Формы, зависящие от пола автора,
+# записаны как {мужская|женская}.
+
+BRAND = "Demyanov realty"
+
+_GENDER_FORM = re.compile(r'\{([^{}|]*)\|([^{}|]*)\}')
+_PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+# Название агентства в нужном падеже
+BRAND_FORMS = {
+    'acc': [BRAND, f"агентство {BRAND}"],
+    'gen': [BRAND, f"агентства {BRAND}", f"команды {BRAND}"],
+    'prep': [BRAND, f"агентстве {BRAND}"],
+    'ins': [BRAND, f"агентством {BRAND}", f"командой {BRAND}"],
+    'dat': [BRAND, f"агентству {BRAND}", f"команде {BRAND}"],
+}
+
+# Услуга: что хотел сделать (inf), что сделал (past), с чем помогли (ins),
+# и подробности о самой услуге
+SERVICES: Dict[str, dict] = {
+    'Сдача квартиры в аренду': {
+        'inf': ["сдать квартиру в аренду", "найти арендаторов для квартиры"],
+        'past': ["{сдал|сдала} квартиру в аренду"],
+        'ins': ["со сдачей квартиры в аренду", "с поиском арендаторов"],
+        'details': [
+            "Надежных арендаторов нашли быстрее, чем я {ожидал|ожидала}.",
+            "Помогли правильно оценить арендную ставку и грамотно составить договор найма.",
+            "Арендаторов проверили заранее, так что за квартиру я {спокоен|спокойна}.",
+        ],
+    },
+    'Съём квартиры': {
+        'inf': ["снять квартиру", "подобрать квартиру для аренды"],
+        'past': ["{снял|сняла} квартиру"],
+        'ins': ["с поиском квартиры для аренды", "с арендой квартиры"],
+        'details': [
+            "Подобрали несколько достойных вариантов под мой бюджет.",
+            "Просмотры организовали в удобное для меня время.",
+            "Квартиру нашли именно в том районе, который мне был нужен.",
+        ],
+    },
+    'Покупка квартиры': {
+        'inf': ["купить квартиру", "подобрать и купить квартиру"],
+        'past': ["{купил|купила} квартиру"],
+        'ins': ["с покупкой квартиры", "с выбором и покупкой квартиры"],
+        'details': [
+            "Юридическую чистоту квартиры проверили очень тщательно.",
+            "Помогли найти квартиру, о которой я давно {мечтал|мечтала}.",
+            "На сделке все документы были готовы заранее.",
+        ],
+    },
+    'Покупка дома': {
+        'inf': ["купить дом", "подобрать загородный дом"],
+        'past': ["{купил|купила} дом"],
+        'ins': ["с покупкой дома", "с выбором дома"],
+        'details': [
+            "Дом и документы на участок проверили до мелочей.",
+            "Показали только те дома, которые действительно подходили под мои запросы.",
+            "Помогли разобраться со всеми нюансами загородной недвижимости.",
+        ],
+    },
+    'Продажа квартиры': {
+        'inf': ["продать квартиру", "выгодно продать квартиру"],
+        'past': ["{продал|продала} квартиру"],
+        'ins': ["с продажей квартиры"],
+        'details': [
+            "Квартиру продали по хорошей цене и без долгого ожидания.",
+            "Грамотно подготовили объявление и сами провели все показы.",
+            "Покупателя нашли быстро, а сделка прошла без нервов.",
+        ],
+    },
+    'Продажа дома': {
+        'inf': ["продать дом", "продать загородный дом"],
+        'past': ["{продал|продала} дом"],
+        'ins': ["с продажей дома"],
+        'details': [
+            "Покупателя на дом нашли быстрее, чем я {рассчитывал|рассчитывала}.",
+            "Помогли собрать все документы по дому и участку.",
+            "Дом сумели показать с лучшей стороны, и цена меня устроила.",
+        ],
+    },
+    'Флиппинг': {
+        'inf': ["вложиться в флиппинг", "заработать на перепродаже недвижимости"],
+        'past': ["{вложился|вложилась} в проект по флиппингу"],
+        'ins': ["с проектом по флиппингу"],
+        'details': [
+            "Объект под ремонт и перепродажу подобрали с хорошим потенциалом.",
+            "Расчеты по доходности были понятными и честными.",
+            "Ремонт и перепродажу провели точно в оговоренные сроки.",
+        ],
+    },
+    'Хоумстейджинг': {
+        'inf': ["подготовить квартиру к продаже", "сделать хоумстейджинг перед продажей"],
+        'past': ["{заказал|заказала} хоумстейджинг"],
+        'ins': ["с хоумстейджингом", "с подготовкой жилья к продаже"],
+        'details': [
+            "После хоумстейджинга квартира на фотографиях стала выглядеть совсем по-другому.",
+            "Преображение жилья заметно ускорило поиск покупателя.",
+            "Недорогими средствами сделали интерьер светлым и уютным.",
+        ],
+    },
+    'Финансовые услуги': {
+        'inf': ["разобраться с ипотекой", "решить финансовые вопросы по сделке"],
+        'past': ["{получил|получила} помощь с финансовыми вопросами"],
+        'ins': ["с ипотекой и финансовыми вопросами", "с финансовой стороной сделки"],
+        'details': [
+            "Помогли подобрать выгодные условия по ипотеке.",
+            "Все финансовые нюансы объяснили простым языком.",
+            "Взаимодействие с банком полностью взяли на себя.",
+        ],
+    },
+}
+
+# Что понравилось: отдельные предложения и существительные (вин. падеж) для перечня
+LIKES: Dict[str, dict] = {
+    'Скорость': {
+        'sentences': [
+            "Все сделали быстро, без лишних проволочек.",
+            "Сроки приятно удивили: всё заняло меньше времени, чем я {рассчитывал|рассчитывала}.",
+            "Работали оперативно, на вопросы отвечали в тот же день.",
+            "Ничего не затягивали, каждый этап шел строго по плану.",
+        ],
+        'nouns': ["скорость работы", "оперативность", "быстроту"],
+    },
+    'Вежливость менеджера': {
+        'sentences': [
+            "Менеджер был неизменно вежлив и терпелив ко всем моим вопросам.",
+            "Отдельное спасибо менеджеру за тактичность и доброжелательность.",
+            "С менеджером было приятно общаться: корректно, спокойно и без давления.",
+        ],
+        'nouns': ["вежливость менеджера", "внимательность менеджера", "доброжелательность менеджера"],
+    },
+    'Прозрачность договора': {
+        'sentences': [
+            "Договор был прозрачным, без мелкого шрифта и скрытых пунктов.",
+            "Каждый пункт договора подробно объяснили, никаких сюрпризов не было.",
+            "Условия договора с самого начала были понятными и честными.",
+        ],
+        'nouns': ["прозрачность договора", "понятный договор", "честные условия договора"],
+    },
+    'Цена': {
+        'sentences': [
+            "Стоимость услуг оказалась вполне разумной.",
+            "Цена полностью соответствует качеству работы.",
+            "Порадовало, что цену назвали сразу и она не менялась по ходу дела.",
+        ],
+        'nouns': ["адекватную цену", "разумную стоимость услуг", "честную цену"],
+    },
+    'Стиль работы': {
+        'sentences': [
+            "Понравился сам стиль работы: четко, структурно и по делу.",
+            "Чувствуется профессиональный подход, всё организовано продуманно.",
+            "Команда работает слаженно, я всегда {знал|знала}, на каком этапе мой вопрос.",
+        ],
+        'nouns': ["стиль работы", "профессиональный подход", "слаженную работу команды"],
+    },
+}
+
+OPENINGS = [
+    "Недавно {past} с помощью {brand_gen}.",
+    "{Обратился|Обратилась} в {brand_acc}, когда {решил|решила} {inf}.",
+    "Специалисты {brand_gen} помогли мне {inf}, и я {доволен|довольна} результатом.",
+    "{Ins} мне помогали специалисты {brand_gen}.",
+    "{Выбирал|Выбирала} агентство, чтобы {inf}, и {остановился|остановилась} на {brand_prep}.",
+    "Хочу поделиться впечатлениями о работе {brand_gen}: {ins} всё прошло отлично.",
+    "Благодаря {brand_dat} мне удалось {inf} без лишних хлопот.",
+]
+
+LIST_SENTENCES = [
+    "Отдельно хочу отметить {nouns}.",
+    "Особенно {оценил|оценила} {nouns}.",
+    "Из плюсов выделю {nouns}.",
+]
+
+COMMENT_PREFIXES = ["", "От себя добавлю: ", "Еще скажу так: "]
+
+THANKS = [
+    "Спасибо всей команде!",
+    "Большое спасибо за помощь!",
+    "Благодарю за работу!",
+]
+
+CLOSINGS_RECOMMEND = [
+    "Смело рекомендую {brand_acc} друзьям и знакомым.",
+    "Буду советовать {brand_acc} всем знакомым.",
+    "Если снова понадобится помощь с недвижимостью, обязательно обращусь сюда.",
+    "Всем, кто ищет надежного риелтора, советую {brand_acc}.",
+    "Однозначно рекомендую!",
+]
+
+CLOSINGS_NEUTRAL = [
+    "Спасибо за проделанную работу.",
+    "В целом благодарю команду за помощь.",
+    "Спасибо специалистам {brand_gen} за участие.",
+]
+
+
+def _join(items: Sequence[str]) -> str:
+    if len(items) == 1:
+        return items[0]
+    return f"{', '.join(items[:-1])} и {items[-1]}"
+
+
+def _capitalize(text: str) -> str:
+    return text[:1].upper() + text[1:]
+
+
+class LocalReviewGenerator:
+    """Отзыв из шаблонов за десятки микросекунд, без обращения к сети.
+
+    Интерфейс generate_review тот же, что у клиента YaGPT, так что
+    генератор подходит и как основной бэкенд (нагрузочные тесты, отказ
+    YaGPT), и как запасной вариант.
+    """
+
+    def __init__(self, seed: Optional[int] = None):
+        self._random = random.Random(seed)
+
+    def compose(self, gender: str, service: str, likes: List[str], recommendation: str, comment: str = "") -> str:
+        rnd = self._random
+        female = "женск" in gender.lower()
+        service_forms = SERVICES.get(service) or {
+            'inf': [f"получить услугу «{service}»"],
+            'past': ["{получил|получила} услугу «" + service + "»"],
+            'ins': [f"с услугой «{service}»"],
+            'details': [],
+        }
+
+        def choose(match) -> str:
+            name = match.group(1)
+            if name.startswith('brand_'):
+                return rnd.choice(BRAND_FORMS[name[len('brand_'):]])
+            if name == 'Ins':
+                return _capitalize(rnd.choice(service_forms['ins']))
+            return rnd.choice(service_forms[name])
+
+        def fill(template: str) -> str:
+            # Сначала подстановки — в них тоже бывают формы по полу
+            text = _PLACEHOLDER.sub(choose, template)
+            return _GENDER_FORM.sub(lambda match: match.group(2 if female else 1), text)
+
+        body = []
+        known = [like for like in likes if like in LIKES]
+        described = rnd.sample(known, min(len(known), rnd.randint(1, 2))) if known else []
+        for like in described:
+            body.append(rnd.choice(LIKES[like]['sentences']))
+        listed = [like for like in likes if like not in described]
+        if listed:
+            nouns = [rnd.choice(LIKES[like]['nouns']) if like in LIKES else like.lower() for like in listed]
+            body.append(rnd.choice(LIST_SENTENCES).replace('{nouns}', _join(nouns)))
+        if service_forms['details'] and rnd.random() < 0.7:
+            body.append(rnd.choice(service_forms['details']))
+        rnd.shuffle(body)
+        sentences = [fill(sentence) for sentence in [rnd.choice(OPENINGS)] + body]
+
+        # Комментарий клиента вставляем как есть, без подстановок
+        comment = " ".join(comment.split())
+        if comment:
+            if comment[-1] not in '.!?…':
+                comment += '.'
+            prefix = rnd.choice(COMMENT_PREFIXES)
+            sentences.append(prefix + (comment if prefix else _capitalize(comment)))
+
+        recommends = recommendation == survey.RECOMMEND_YES
+        ending = [fill(rnd.choice(CLOSINGS_RECOMMEND if recommends else CLOSINGS_NEUTRAL))]
+        if rnd.random() < 0.4:
+            ending.insert(rnd.randint(0, 1), rnd.choice(THANKS))
+        sentences.extend(ending)
+
+        return " ".join(sentences)
+
+    async def generate_review(self, gender: str, service: str, likes: list, recommendation: str, comment: str = "",
+                              temperature: Optional[float] = None) -> Optional[str]:
+        return self.compose(gender, service, likes, recommendation, comment)
+
+
+local_generator = LocalReviewGenerator()
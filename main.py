@@ -1,8 +1,10 @@
+import startup
 import os
 import logging
 import asyncio
-import sqlite3
-import json
+import dataclasses
+import warnings
+from contextlib import aclosing
 from dotenv import load_dotenv
 
 # Загрузка .env файла
@@ -13,19 +15,28 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 YANDEX_API_KEY = os.getenv('YANDEX_API_KEY')
 YANDEX_FOLDER_ID = os.getenv('YANDEX_FOLDER_ID')
 
-# Проверка переменных
-print("=" * 60)
-print("🔍 ЗАГРУЖЕННЫЕ ПЕРЕМЕННЫЕ ИЗ .env:")
-print(f"✅ TELEGRAM_BOT_TOKEN: {TELEGRAM_BOT_TOKEN}")
-print(f"✅ YANDEX_API_KEY: {YANDEX_API_KEY}")
-print(f"✅ YANDEX_FOLDER_ID: {YANDEX_FOLDER_ID}")
-print("=" * 60)
-
-# Теперь импорты из telegram (ПОСЛЕ переменных!)
-from telegram import Update, ReplyKeyboardRemove
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, ConversationHandler
-from yagpt_client import yagpt_client
+# Остальные импорты — после load_dotenv: config читает окружение при импорте
+from telegram import Bot, Update, ReplyKeyboardRemove
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, MessageHandler, TypeHandler, filters, ContextTypes, ConversationHandler
+from telegram.warnings import PTBUserWarning
+from yagpt_client import YandexConfig, yagpt_client
+from config import config
+from update_processor import PerChatUpdateProcessor
+import http_session
+from database import db_manager
+from generation_queue import GenerationJob, GenerationPool, GenerationQueueFull
+from streaming import ProgressiveMessage, keyboard_edits
+import review_pool
+import web_server
+from persistence import SurveyPersistence
+from state_store import SQLiteStateStore
 import keyboards as kb
+import survey
+import metrics
+import minhash
+import review_text
+from rate_limit import SlidingWindowLimiter
+from local_generator import local_generator
 
 # Настройка логирования
 logging.basicConfig(
@@ -34,50 +45,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Состояния разговора
-GENDER, SERVICE, LIKES, COMMENT, RECOMMENDATION, FINAL_CONFIRMATION = range(6)
-
-# База данных
-class DatabaseManager:
-    def __init__(self, db_path='reviews.db'):
-        self.db_path = db_path
-    
-    def init_database(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                user_name TEXT,
-                gender TEXT,
-                service TEXT,
-                likes TEXT,
-                recommendation TEXT,
-                comment TEXT,
-                generated_review TEXT,
-                date_created DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        conn.commit()
-        conn.close()
-    
-    def save_review(self, user_id, user_name, gender, service, likes, recommendation, comment, generated_review):
-        likes_json = json.dumps(likes, ensure_ascii=False)
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO reviews (user_id, user_name, gender, service, likes, recommendation, comment, generated_review)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, user_name, gender, service, likes_json, recommendation, comment, generated_review))
-        conn.commit()
-        conn.close()
-
-db_manager = DatabaseManager()
+# Команды админов и необязательные функции загружаются при первом использовании
+broadcast = startup.lazy_import('broadcast')
+stats = startup.lazy_import('stats')
+export = startup.lazy_import('export')
+candidates = startup.lazy_import('candidates')
+startup.imports_done()
+
+# Бэкенд генерации; у локального тот же generate_review, что у клиента YaGPT
+review_backend = local_generator if config.generation.BACKEND == 'local' else yagpt_client
+
+# Сколько генераций YaGPT запускает один пользователь (опросы, /test, «другие варианты»)
+generation_limiter = SlidingWindowLimiter(
+    config.limits.USER_GENERATIONS,
+    config.limits.USER_WINDOW,
+    config.limits.MAX_USERS
+)
+
+def generation_allowed(user_id: int, requests: int = 1) -> bool:
+    """Можно ли сейчас тратить requests запросов к YaGPT на этого пользователя"""
+    if review_backend is local_generator:
+        return True
+    if yagpt_client.budget.exhausted:
+        metrics.RATE_LIMITED.labels('budget').inc()
+        return False
+    if not generation_limiter.hit(user_id, requests):
+        logger.info(f"Пользователь {user_id} превысил лимит генераций")
+        metrics.RATE_LIMITED.labels('user').inc()
+        return False
+    return True
+
+# Состояния разговора — номера шагов из survey.SURVEY_SCHEMA
+FINAL_CONFIRMATION = survey.CONFIRMATION.state
+
+def end_survey(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Закончить опрос: запись с ответами больше не нужна, убираем ее из памяти"""
+    context.application.drop_user_data(update.effective_user.id)
+    return ConversationHandler.END
 
 # Обработчики команд
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
+    metrics.SURVEY_FUNNEL.labels('start').inc()
 
     # Вступительное сообщение
     welcome_text = (
@@ -94,283 +103,670 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Ждем немного и задаем первый вопрос
     await asyncio.sleep(1)
-    await update.message.reply_text(
-        "👥 Какого вы пола?",
-        reply_markup=kb.get_gender_keyboard()
-    )
-    return GENDER
+    return await ask_step(update, context, survey.FIRST_STEP)
 
-async def handle_gender(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_answer = update.message.text
-    valid_genders = ['👩 Женский', '👨 Мужской', 'Женский', 'Мужской']
+async def show(update: Update, text: str, reply_markup=None, **kwargs):
+    """Показать следующий экран опроса.
 
-    if user_answer not in valid_genders:
-        await update.message.reply_text(
-            "Пожалуйста, выберите пол с помощью кнопок 👇",
-            reply_markup=kb.get_gender_keyboard()
-        )
-        return GENDER
+    После нажатия inline-кнопки правим то же сообщение, а на текст
+    пользователя отвечаем новым.
+    """
+    query = update.callback_query
+    if query:
+        await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    else:
+        await update.effective_message.reply_text(text, reply_markup=reply_markup, **kwargs)
+
+async def read_answer(update: Update, step):
+    """Ответ на шаг: текст сообщения или вариант с нажатой кнопки"""
+    query = update.callback_query
+    if query is None:
+        return update.message.text
+    # Пока на нажатие не ответили, у пользователя крутятся часики на кнопке
+    await query.answer()
+    return step.parse_callback(query.data)
+
+async def ask_step(update: Update, context: ContextTypes.DEFAULT_TYPE, step):
+    """Задать вопрос шага, а после последнего — показать сводку"""
+    if step is None:
+        metrics.SURVEY_FUNNEL.labels(survey.CONFIRMATION.key).inc()
+        await show(update, survey.summary_text(context.user_data), survey.CONFIRMATION.inline_keyboard)
+        return FINAL_CONFIRMATION
 
-    context.user_data['gender'] = user_answer
-    await update.message.reply_text(
-        "🏢 Какую услугу вы получили?",
-        reply_markup=kb.get_service_keyboard()
-    )
-    return SERVICE
+    metrics.SURVEY_FUNNEL.labels(step.key).inc()
+    if step.kind == survey.MULTI:
+        context.user_data.set_answer(step, 0)
+    await show(update, step.prompt, step.inline_keyboard)
+    return step.state
+
+def make_step_handler(step):
+    """Обработчик ответа на шаг опроса, собирается один раз при старте"""
+
+    async def handle_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_answer = await read_answer(update, step)
+
+        if user_answer not in step.valid:
+            await update.effective_message.reply_text(step.invalid_text, reply_markup=step.inline_keyboard)
+            return step.state
+
+        context.user_data.set_answer(step, step.normalize(user_answer))
+        return await ask_step(update, context, step.next)
+
+    async def handle_multi(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.callback_query
+        user_answer = step.parse_callback(query.data) if query else update.message.text
+        session = context.user_data
+
+        if user_answer == step.done:
+            if not session.mask(step):
+                if query:
+                    await query.answer(step.empty_text, show_alert=True)
+                else:
+                    await update.message.reply_text(step.empty_text, reply_markup=step.keyboard_for_mask(0))
+                return step.state
+            if query:
+                await query.answer()
+                # Отложенная правка отметок не должна лечь поверх следующего вопроса
+                await keyboard_edits.settle(query.message.chat_id, query.message.message_id)
+            return await ask_step(update, context, step.next)
+
+        if user_answer not in step.valid:
+            if query:
+                await query.answer()
+            else:
+                await update.message.reply_text(step.invalid_text, reply_markup=step.keyboard_for_mask(session.mask(step)))
+            return step.state
+
+        action = "добавлено" if session.toggle(step, user_answer) else "убрано"
+
+        if query:
+            # Отметки на клавиатуре обновятся одной правкой после серии нажатий
+            keyboard_edits.schedule(
+                context.bot, query.message.chat_id, query.message.message_id,
+                lambda: step.keyboard_for_mask(session.mask(step))
+            )
+            await query.answer(f"{user_answer} {action}")
+            return step.state
 
-async def handle_service(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_answer = update.message.text
-    valid_services = ['Сдача квартиры в аренду', 'Съём квартиры', 'Покупка квартиры', 
-                     'Покупка дома', 'Продажа квартиры', 'Продажа дома', 
-                     'Флиппинг', 'Хоумстейджинг', 'Финансовые услуги']
+        selected = session.answer(step)
+        selected_text = ", ".join(selected) if selected else "пока ничего не выбрано"
 
-    if user_answer not in valid_services:
         await update.message.reply_text(
-            "Пожалуйста, выберите услугу с помощью кнопок 👇",
-            reply_markup=kb.get_service_keyboard()
+            f"{user_answer} {action} ✅\n\n"
+            f"Выбрано: {selected_text}\n\n"
+            f"Продолжайте выбирать или нажмите '{step.done}'",
+            reply_markup=step.keyboard_for_mask(session.mask(step))
         )
-        return SERVICE
+        return step.state
 
-    context.user_data['service'] = user_answer
-    context.user_data['likes'] = []
+    async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_answer = await read_answer(update, step)
+        context.user_data.set_answer(step, "" if user_answer in (step.skip, None) else user_answer)
+        return await ask_step(update, context, step.next)
 
-    await update.message.reply_text(
-        "⭐ Что вам понравилось в работе с нашим агентством?\n\n"
-        "Можно выбрать несколько вариантов. Нажмите '✅ Завершить выбор' когда закончите.",
-        reply_markup=kb.get_likes_keyboard()
-    )
-    return LIKES
+    handler = {
+        survey.CHOICE: handle_choice,
+        survey.MULTI: handle_multi,
+        survey.TEXT: handle_text,
+    }[step.kind]
+    handler.__name__ = f"handle_{step.key}"
+    return handler
 
-async def handle_likes(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_answer = update.message.text
-    valid_likes = ['Скорость', 'Вежливость менеджера', 'Прозрачность договора', 
-                  'Цена', 'Стиль работы', '✅ Завершить выбор']
+async def handle_final_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_answer = await read_answer(update, survey.CONFIRMATION)
 
-    if user_answer not in valid_likes:
-        await update.message.reply_text(
-            "Пожалуйста, используйте кнопки для выбора 👇",
-            reply_markup=kb.get_likes_keyboard()
+    if user_answer not in survey.CONFIRMATION.valid:
+        await update.effective_message.reply_text(
+            survey.CONFIRMATION.invalid_text,
+            reply_markup=survey.CONFIRMATION.inline_keyboard
         )
-        return LIKES
-
-    if user_answer == '✅ Завершить выбор':
-        if not context.user_data['likes']:
-            await update.message.reply_text(
-                "Пожалуйста, выберите хотя бы один вариант перед завершением 👇",
-                reply_markup=kb.get_likes_keyboard()
-            )
-            return LIKES
+        return FINAL_CONFIRMATION
 
-        await update.message.reply_text(
-            "💬 Хотите добавить комментарий или уточнение к отзыву?\n\n"
-            "Напишите ваш комментарий или нажмите 'Пропустить'",
-            reply_markup=kb.get_skip_keyboard()
+    if user_answer == survey.CONFIRM_YES:
+        metrics.SURVEY_FUNNEL.labels('confirmed').inc()
+        user = update.effective_user
+        answers = context.user_data.answers()
+        job = GenerationJob(
+            chat_id=update.effective_chat.id,
+            user_id=user.id,
+            user_name=user.username or user.first_name,
+            gender=answers['gender'],
+            service=answers['service'],
+            likes=answers['likes'],
+            recommendation=answers['recommendation'],
+            comment=answers['comment'] or ''
         )
-        return COMMENT
-
-    if user_answer in context.user_data['likes']:
-        context.user_data['likes'].remove(user_answer)
-        action = "убрано"
-    else:
-        context.user_data['likes'].append(user_answer)
-        action = "добавлено"
 
-    selected_text = ", ".join(context.user_data['likes']) if context.user_data['likes'] else "пока ничего не выбрано"
+        # Без комментария отзыв можно сразу взять из заранее сгенерированного пула
+        if config.pool.ENABLED and not job.comment:
+            pooled_review = await review_pool.take(job.gender, job.service, job.likes, job.recommendation)
+            if pooled_review:
+                await show(update, "✨ Ваш отзыв готов!")
+                await deliver_review(context.bot, job, pooled_review, source='pool')
+                return end_survey(update, context)
+
+        # Сначала очередь: отказ из-за нее не должен тратить лимит пользователя
+        if generation_pool.full:
+            await show(update, "⏳ Сейчас очень много запросов. Пожалуйста, попробуйте через пару минут — напишите /start")
+            return end_survey(update, context)
+
+        # Варианты на выбор — это CANDIDATES запросов к YaGPT, столько и списываем
+        if not generation_allowed(user.id, config.generation.CANDIDATES):
+            # Лимит исчерпан: без запроса к YaGPT — отзыв из пула или шаблонный
+            pooled_review = None
+            if config.pool.ENABLED:
+                pooled_review = await review_pool.take(job.gender, job.service, job.likes, job.recommendation)
+            await show(update, "✨ Ваш отзыв готов!")
+            await deliver_review(context.bot, job, pooled_review, source='pool')
+            return end_survey(update, context)
+
+        if generation_pool.saturated:
+            waiting_text = (
+                "✨ Генерируем ваш отзыв с помощью AI...\n\n"
+                f"Сейчас много желающих, перед вами в очереди: {generation_pool.depth}. "
+                "Пришлем отзыв, как только он будет готов."
+            )
+        else:
+            waiting_text = "✨ Генерируем ваш отзыв с помощью AI...\n\nЭто займет 10-15 секунд."
 
-    await update.message.reply_text(
-        f"{user_answer} {action} ✅\n\n"
-        f"Выбрано: {selected_text}\n\n"
-        "Продолжайте выбирать или нажмите '✅ Завершить выбор'",
-        reply_markup=kb.get_likes_keyboard()
-    )
-    return LIKES
+        await show(update, waiting_text)
 
-async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_answer = update.message.text
+        # Генерация идет в фоне, обработчик сразу освобождается
+        try:
+            generation_pool.submit(job)
+        except GenerationQueueFull:
+            await update.effective_message.reply_text(
+                "⏳ Очередь заполнилась, пока мы принимали ваш запрос. Попробуйте через пару минут — напишите /start"
+            )
 
-    if user_answer == 'Пропустить':
-        context.user_data['comment'] = ""
     else:
-        context.user_data['comment'] = user_answer
-
-    await update.message.reply_text(
-        "🤝 Посоветуете своим знакомым наше агентство?",
-        reply_markup=kb.get_recommendation_keyboard()
-    )
-    return RECOMMENDATION
-
-async def handle_recommendation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_answer = update.message.text
-
-    if user_answer not in ['✅ Да', '❌ Нет']:
-        await update.message.reply_text(
-            "Пожалуйста, используйте кнопки для ответа 👇",
-            reply_markup=kb.get_recommendation_keyboard()
+        await show(update, "Хорошо, давайте начнем заново.")
+        await update.effective_message.reply_text("Напишите /start")
+
+    return end_survey(update, context)
+
+# Фоновая генерация отзыва
+async def produce_review(bot: Bot, job: GenerationJob):
+    if config.generation.CANDIDATES > 1:
+        return await generate_candidates(job)
+    text = await generate_review(bot, job)
+    if text and config.dedup.ENABLED:
+        text = await make_unique(job, text)
+    return text
+
+async def generate_review(bot: Bot, job: GenerationJob):
+    if not config.generation.STREAMING or review_backend is not yagpt_client:
+        return await review_backend.generate_review(
+            job.gender,
+            job.service,
+            job.likes,
+            job.recommendation,
+            job.comment
         )
-        return RECOMMENDATION
-
-    context.user_data['recommendation'] = user_answer
-
-    # Показываем сводку
-    summary_text = "📋 Проверьте ваши ответы:\n\n"
-    summary_text += f"👥 Пол: {context.user_data['gender']}\n"
-    summary_text += f"🏢 Услуга: {context.user_data['service']}\n"
-    summary_text += f"⭐ Понравилось: {', '.join(context.user_data['likes'])}\n"
-    if context.user_data.get('comment'):
-        summary_text += f"💬 Комментарий: {context.user_data['comment']}\n"
-    summary_text += f"🤝 Рекомендация: {context.user_data['recommendation']}\n\n"
-    summary_text += "Всё верно?"
 
-    await update.message.reply_text(
-        summary_text,
-        reply_markup=kb.get_confirmation_keyboard()
+    # Показываем текст по мере генерации в одном сообщении
+    progress = ProgressiveMessage(bot, job.chat_id)
+    stream = yagpt_client.stream_review(
+        job.gender,
+        job.service,
+        job.likes,
+        job.recommendation,
+        job.comment
+    )
+    try:
+        # aclosing сразу освобождает соединение, даже если вышли из цикла раньше
+        async with aclosing(stream):
+            async for text, finished in stream:
+                if finished:
+                    # Финальный текст клиент уже проверил: None — не годится
+                    if text or not config.generation.REVIEW_REGENERATIONS:
+                        if not text:
+                            metrics.YAGPT_FALLBACKS.labels('invalid_text').inc()
+                        return text
+                    # Показанный черновик не годится и не чинится — просим новый текст целиком
+                    break
+                await progress.update(text + " ✍️")
+            else:
+                return None
+    finally:
+        job.message_id = progress.message_id
+    metrics.REVIEW_REGENERATIONS.inc()
+    return await yagpt_client.generate_review(
+        job.gender,
+        job.service,
+        job.likes,
+        job.recommendation,
+        job.comment
     )
-    return FINAL_CONFIRMATION
-
-async def handle_final_confirmation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_answer = update.message.text
 
-    if user_answer not in ['✅ Да, все верно', '❌ Нет, исправить']:
-        await update.message.reply_text(
-            "Пожалуйста, используйте кнопки для ответа 👇",
-            reply_markup=kb.get_confirmation_keyboard()
+async def generate_candidates(job: GenerationJob):
+    """Несколько вариантов отзыва на выбор.
+
+    У YaGPT нет параметра «n вариантов», поэтому запросы идут параллельно
+    с разной температурой: по времени это как один запрос. Повторы между
+    собой и слишком похожие на сохраненные отзывы отбрасываются.
+    """
+    count = config.generation.CANDIDATES
+    results = await asyncio.gather(*(
+        review_backend.generate_review(
+            job.gender,
+            job.service,
+            job.likes,
+            job.recommendation,
+            job.comment,
+            temperature=min(1.0, YandexConfig.TEMPERATURE + 0.1 * i)
         )
-        return FINAL_CONFIRMATION
-
-    if user_answer == '✅ Да, все верно':
-        await update.message.reply_text(
-            "✨ Генерируем ваш отзыв с помощью AI...\n\nЭто займет 10-15 секунд.",
-            reply_markup=ReplyKeyboardRemove()
+        for i in range(count)
+    ))
+
+    texts = []
+    signatures = []
+    for text in filter(None, results):
+        signature = minhash.signature(text)
+        if any(minhash.similarity(signature, other) >= config.dedup.THRESHOLD for other in signatures):
+            continue
+        texts.append(text)
+        signatures.append(signature)
+
+    if config.dedup.ENABLED and texts:
+        similarities = []
+        for signature in signatures:
+            with metrics.DEDUP_CHECK.time():
+                similarities.append(await db_manager.max_similarity(signature))
+        fresh = [text for text, similarity in zip(texts, similarities) if similarity < config.dedup.THRESHOLD]
+        metrics.NEAR_DUPLICATES.inc(len(texts) - len(fresh))
+        # Если похожи все — оставляем самый непохожий
+        texts = fresh or [min(zip(similarities, texts))[1]]
+
+    logger.info(f"Для {job.user_id} готово вариантов: {len(texts)} из {count}")
+    return texts
+
+async def make_unique(job: GenerationJob, text: str) -> str:
+    """Перегенерировать отзыв, слишком похожий на уже выданные.
+
+    Каждая следующая попытка — с температурой выше. Если YaGPT не
+    ответил, остается предыдущий вариант: похожий отзыв лучше fallback.
+    """
+    temperature = YandexConfig.TEMPERATURE
+    for _ in range(config.dedup.MAX_REGENERATIONS):
+        with metrics.DEDUP_CHECK.time():
+            similarity = await db_manager.max_similarity(minhash.signature(text))
+        if similarity < config.dedup.THRESHOLD:
+            break
+
+        metrics.NEAR_DUPLICATES.inc()
+        temperature = min(1.0, temperature + 0.15)
+        logger.info(f"Отзыв для {job.user_id} похож на сохраненный ({similarity:.2f}), перегенерируем с t={temperature}")
+        regenerated = await review_backend.generate_review(
+            job.gender,
+            job.service,
+            job.likes,
+            job.recommendation,
+            job.comment,
+            temperature=temperature
         )
-
-        # Генерируем отзыв с помощью YaGPT
-        generated_review = await yagpt_client.generate_review(
-            context.user_data['gender'],
-            context.user_data['service'],
-            context.user_data['likes'],
-            context.user_data['recommendation'],
-            context.user_data.get('comment', '')
+        if not regenerated:
+            break
+        text = regenerated
+    return text
+
+async def deliver_review(bot: Bot, job: GenerationJob, generated_review, source: str = config.generation.BACKEND):
+    if isinstance(generated_review, list):
+        if len(generated_review) > 1:
+            await offer_candidates(bot, job, generated_review)
+            return
+        generated_review = generated_review[0] if generated_review else None
+    await publish_review(bot, job, generated_review, source)
+
+async def offer_candidates(bot: Bot, job: GenerationJob, texts):
+    """Показать варианты с кнопками листания и запомнить их для этого сообщения"""
+    session = candidates.CandidateSession(job, texts)
+    if job.message_id:
+        await bot.edit_message_text(
+            candidates.render(session),
+            job.chat_id,
+            job.message_id,
+            reply_markup=candidates.keyboard(session)
         )
-
-        # Fallback если YaGPT не сработал
-        if not generated_review:
-            generated_review = (
-                f"Хочу поблагодарить Demyanov realty за {context.user_data['service'].lower()}! "
-                f"Особенно понравилось: {', '.join(context.user_data['likes'])}. "
-                f"{'Обязательно порекомендую ваше агентство!' if context.user_data['recommendation'] == '✅ Да' else 'Спасибо за работу!'}"
-            )
-
-        # Сохраняем в базу
-        user_id = update.message.from_user.id
-        user_name = update.message.from_user.username or update.message.from_user.first_name
-
-        db_manager.save_review(
-            user_id, user_name,
-            context.user_data['gender'],
-            context.user_data['service'],
-            context.user_data['likes'],
-            context.user_data['recommendation'],
-            context.user_data.get('comment', ''),
-            generated_review
+        message_id = job.message_id
+    else:
+        message = await bot.send_message(
+            job.chat_id,
+            candidates.render(session),
+            reply_markup=candidates.keyboard(session)
         )
-
-        # Финальное сообщение с инструкциями
-        final_message = (
-            f"🎉 Готово! Вот ваш отзыв:\n\n"
-            f"`{generated_review}`\n\n"
-            f"💖 Большое спасибо! Ваше мнение очень важно для нас.\n\n"
-            f"**🚀 А теперь отзыв нужно непременно опубликовать!** 😊\n\n"
-            f"📋 *Как это сделать:*\n\n"
-            f"1. 🏢 Выберите площадку, на которой состоялась сделка\n"
-            f"2. 🔍 Найдите на странице кнопку \"Написать отзыв\"\n"  
-            f"3. 🔐 Войдите в аккаунт, если требуется\n"
-            f"4. 📋 Скопируйте получившийся текст (просто нажмите на него в этом сообщении), вставьте в соответствующее окошко и опубликуйте отзыв\n\n"
-            f"**⭐️ Ещё раз благодарим вас!** 🙏"
+        message_id = message.message_id
+    candidates.candidate_cache.put((job.chat_id, message_id), session)
+    metrics.CANDIDATE_ACTIONS.labels('offered').inc()
+
+async def publish_review(bot: Bot, job: GenerationJob, generated_review, source: str = config.generation.BACKEND):
+    # Fallback если YaGPT не сработал: отзыв из шаблонов, каждый раз разный
+    if not generated_review:
+        source = 'fallback'
+        generated_review = local_generator.compose(
+            job.gender, job.service, job.likes, job.recommendation, job.comment
         )
+    # Текст идет внутрь `...` с parse_mode='Markdown': разметка и эмодзи из
+    # ответа модели, пула или комментария пользователя сломали бы сообщение
+    generated_review = review_text.sanitize(generated_review)
+
+    # Сохраняем в базу
+    await db_manager.save_review(
+        job.user_id, job.user_name,
+        job.gender,
+        job.service,
+        job.likes,
+        job.recommendation,
+        job.comment,
+        generated_review
+    )
 
-        await update.message.reply_text(
+    # Финальное сообщение с инструкциями
+    final_message = (
+        f"🎉 Готово! Вот ваш отзыв:\n\n"
+        f"`{generated_review}`\n\n"
+        f"💖 Большое спасибо! Ваше мнение очень важно для нас.\n\n"
+        f"**🚀 А теперь отзыв нужно непременно опубликовать!** 😊\n\n"
+        f"📋 *Как это сделать:*\n\n"
+        f"1. 🏢 Выберите площадку, на которой состоялась сделка\n"
+        f"2. 🔍 Найдите на странице кнопку \"Написать отзыв\"\n"  
+        f"3. 🔐 Войдите в аккаунт, если требуется\n"
+        f"4. 📋 Скопируйте получившийся текст (просто нажмите на него в этом сообщении), вставьте в соответствующее окошко и опубликуйте отзыв\n\n"
+        f"**⭐️ Ещё раз благодарим вас!** 🙏"
+    )
+
+    if job.message_id:
+        # Заменяем черновик из потоковой генерации итоговым сообщением
+        await bot.edit_message_text(
             final_message,
+            job.chat_id,
+            job.message_id,
             parse_mode='Markdown',
             reply_markup=kb.get_platform_keyboard()
         )
-
-        await update.message.reply_text(
-            "Хотите оставить еще один отзыв? Напишите /start"
-        )
-
     else:
-        await update.message.reply_text(
-            "Хорошо, давайте начнем заново.",
-            reply_markup=ReplyKeyboardRemove()
+        await bot.send_message(
+            job.chat_id,
+            final_message,
+            parse_mode='Markdown',
+            reply_markup=kb.get_platform_keyboard()
         )
-        await update.message.reply_text("Напишите /start")
 
-    context.user_data.clear()
-    return ConversationHandler.END
+    await bot.send_message(
+        job.chat_id,
+        "Хотите оставить еще один отзыв? Напишите /start"
+    )
+    metrics.REVIEWS_DELIVERED.labels(source).inc()
+    metrics.SURVEY_FUNNEL.labels('delivered').inc()
+
+generation_pool = GenerationPool(produce_review, deliver_review)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    metrics.SURVEY_FUNNEL.labels('cancelled').inc()
     await update.message.reply_text(
         "❌ Опрос прерван. Если у вас есть время оставить отзыв позже, просто напишите /start",
         reply_markup=ReplyKeyboardRemove()
     )
-    context.user_data.clear()
-    return ConversationHandler.END
+    return end_survey(update, context)
+
+async def survey_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Опрос простоял conversation_timeout без ответа — закрываем и освобождаем память"""
+    persistence = context.application.persistence
+    if persistence and not await persistence.timed_out(update):
+        # Опрос закончился или идет на другой реплике — там и свой таймер
+        return
+    metrics.SURVEY_FUNNEL.labels('timeout').inc()
+    end_survey(update, context)
+    await context.bot.send_message(
+        update.effective_chat.id,
+        "⌛ Опрос закрыт: долго не было ответа. Чтобы оставить отзыв, напишите /start",
+        reply_markup=ReplyKeyboardRemove()
+    )
+
+async def handle_candidate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопки под вариантами отзыва: листать, выбрать, сгенерировать другие"""
+    # Варианты приходят после конца опроса, а Application заводит запись
+    # с ответами на любой апдейт — пустую сразу убираем, как end_survey
+    if context.user_data.empty:
+        context.application.drop_user_data(update.effective_user.id)
+
+    query = update.callback_query
+    key = (query.message.chat_id, query.message.message_id)
+    session = candidates.candidate_cache.get(key)
+    if session is None:
+        await query.answer("Эти варианты уже неактуальны. Напишите /start, чтобы создать новый отзыв")
+        return
+
+    action, index = candidates.parse_callback(query.data)
+    metrics.CANDIDATE_ACTIONS.labels(action).inc()
+
+    if action == candidates.SHOW and index is not None:
+        await query.answer()
+        index %= len(session.texts)
+        if index != session.index:
+            session.index = index
+            await query.edit_message_text(candidates.render(session), reply_markup=candidates.keyboard(session))
+
+    elif action == candidates.PICK:
+        # Убираем из кэша до ответа: повторное нажатие не сохранит отзыв дважды
+        candidates.candidate_cache.pop(key)
+        await query.answer("Отличный выбор!")
+        job = dataclasses.replace(session.job, message_id=key[1])
+        await publish_review(context.bot, job, session.texts[session.index if index is None else index % len(session.texts)])
+
+    elif action == candidates.MORE:
+        if not session.can_reroll:
+            await query.answer("Больше вариантов не будет — выберите один из этих")
+            return
+        if generation_pool.full:
+            await query.answer("Сейчас очень много запросов, попробуйте через минуту")
+            return
+        if not generation_allowed(session.job.user_id, config.generation.CANDIDATES):
+            await query.answer("Новых вариантов пока не будет — выберите один из этих")
+            return
+        candidates.candidate_cache.pop(key)
+        await query.answer()
+        await query.edit_message_text("✨ Генерируем новые варианты...")
+        # Новый дедлайн ставит submit; ответ придет в это же сообщение
+        job = dataclasses.replace(session.job, message_id=key[1], rerolls=session.job.rerolls + 1)
+        try:
+            generation_pool.submit(job)
+        except GenerationQueueFull:
+            candidates.candidate_cache.put(key, session)
+            await query.edit_message_text(candidates.render(session), reply_markup=candidates.keyboard(session))
+
+    else:
+        await query.answer()
+
+async def stale_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Кнопка из старого вопроса или из прерванного опроса
+    await update.callback_query.answer("Этот вопрос уже неактуален. Напишите /start, чтобы начать заново")
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Ошибка: {context.error}")
-    if update and update.message:
-        await update.message.reply_text(
+    if update and update.effective_message:
+        await update.effective_message.reply_text(
             "⚠️ Произошла ошибка. Давайте начнем заново. Напишите /start",
             reply_markup=ReplyKeyboardRemove()
         )
 
 async def test_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Тестовая команда для проверки YaGPT"""
-    test_review = await yagpt_client.generate_review(
+    """Тестовая команда для проверки текущего бэкенда генерации"""
+    if not generation_allowed(update.effective_user.id):
+        await update.message.reply_text("⏳ Слишком много запросов. Попробуйте позже.")
+        return
+
+    # При GENERATION_BACKEND=local YaGPT не вызываем, проверяем то, что реально пишет отзывы
+    backend_name = "Локальный генератор" if review_backend is local_generator else "YaGPT"
+    test_review = await review_backend.generate_review(
         "👩 Женский", "Покупка квартиры", ["Скорость"], "✅ Да", "Тестовый комментарий"
     )
 
     if test_review:
-        await update.message.reply_text(f"✅ YaGPT работает! Тестовый отзыв:\n\n{test_review}")
+        await update.message.reply_text(f"✅ {backend_name} работает! Тестовый отзыв:\n\n{test_review}")
     else:
-        await update.message.reply_text("❌ YaGPT не отвечает. Проверьте настройки.")
+        await update.message.reply_text(f"❌ {backend_name} не отвечает. Проверьте настройки.")
+
+def lazy_command(module, name: str):
+    """Обработчик команды из модуля startup.lazy_import: модуль загрузится при первом вызове"""
+    async def command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return await getattr(module, name)(update, context)
+    command.__name__ = name
+    return command
+
+# Жизненный цикл приложения
+async def resume_broadcasts(application: Application):
+    # Модуль рассылок загружаем, только если есть что продолжать
+    if await db_manager.get_unfinished_broadcasts():
+        await broadcast.resume_broadcasts(application)
+
+async def post_init(application: Application):
+    startup.mark('initialize')
+    if application.persistence:
+        application.persistence.verify()
+    # Порт открываем первым: /readyz отвечает 503, пока бот не запущен
+    if config.server.ENABLED or config.bot.MODE == 'webhook':
+        await web_server.start_web_server(application)
+    await http_session.open_session()
+    application.bot_data['loop_lag_task'] = asyncio.create_task(metrics.monitor_loop_lag())
+    application.bot_data['sessions_report_task'] = asyncio.create_task(metrics.report_sessions(application))
+    application.bot_data['ready_task'] = asyncio.create_task(startup.report_when_ready(application))
+    # Опрос не ходит в БД: миграции идут в фоне, первый запрос к БД их дождется
+    application.bot_data['db_init_task'] = asyncio.create_task(db_manager.init_database())
+    generation_pool.start(application.bot)
+    if config.dedup.ENABLED:
+        # Старые отзывы попадают в индекс похожести в фоне
+        application.bot_data['dedup_backfill_task'] = asyncio.create_task(db_manager.backfill_signatures())
+    if config.pool.ENABLED and review_backend is not local_generator:
+        application.bot_data['pool_refill_task'] = asyncio.create_task(review_pool.refill_loop())
+    application.bot_data['resume_broadcasts_task'] = asyncio.create_task(resume_broadcasts(application))
+    startup.mark('post_init')
+
+async def post_stop(application: Application):
+    # Бот еще может отправлять сообщения: дорабатываем принятые задачи
+    await web_server.stop_web_server()
+    for name in ('pool_refill_task', 'loop_lag_task', 'sessions_report_task', 'dedup_backfill_task', 'ready_task',
+                 'resume_broadcasts_task'):
+        task = application.bot_data.pop(name, None)
+        if task:
+            task.cancel()
+    # Уже готовые отзывы — в БД до ожидания генерации: на остановку мало времени
+    await db_manager.flush()
+    await generation_pool.stop()
+    await broadcast.stop_broadcasts()
+
+async def post_shutdown(application: Application):
+    # Дописываем отложенные отзывы до закрытия соединения
+    await db_manager.close()
+    await http_session.close_session()
+
+def build_states():
+    """Состояния ConversationHandler из схемы опроса"""
+    text_filter = filters.TEXT & ~filters.COMMAND
+    states = {}
+    for step in survey.STEPS:
+        handler = metrics.instrument(make_step_handler(step))
+        # Кнопки — inline, но набранный вручную ответ тоже принимаем
+        states[step.state] = [
+            CallbackQueryHandler(handler, pattern=step.callback_pattern),
+            MessageHandler(text_filter, handler),
+        ]
+    confirmation = metrics.instrument(handle_final_confirmation)
+    states[FINAL_CONFIRMATION] = [
+        CallbackQueryHandler(confirmation, pattern=survey.CONFIRMATION.callback_pattern),
+        MessageHandler(text_filter, confirmation),
+    ]
+    states[ConversationHandler.TIMEOUT] = [TypeHandler(Update, metrics.instrument(survey_timeout))]
+    return states
+
+def build_application(bot: Bot = None) -> Application:
+    """Собрать приложение со всеми обработчиками, не запуская его.
+
+    bot подменяет настоящего бота — так benchmark.py гоняет опросы без Telegram.
+    """
+    builder = Application.builder()
+    builder = builder.bot(bot) if bot else builder.token(TELEGRAM_BOT_TOKEN)
+    builder = (
+        builder
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        # Ответы опроса — компактная запись вместо словаря
+        .context_types(ContextTypes(user_data=survey.SurveySession))
+    )
+
+    # Состояние опросов в общем хранилище, чтобы его видели все реплики
+    persistence = None
+    if config.state.ENABLED:
+        persistence = SurveyPersistence(SQLiteStateStore(config.state.PATH))
+        builder = builder.persistence(persistence)
+
+    # Разные чаты обрабатываются параллельно, один чат — по порядку
+    max_concurrent_updates = config.bot.MAX_CONCURRENT_UPDATES if config.bot.CONCURRENT_UPDATES else 1
+    builder = builder.concurrent_updates(
+        PerChatUpdateProcessor(
+            max_concurrent_updates,
+            before_update=persistence.hydrate if persistence else None,
+            after_update=persistence.after_update if persistence else None
+        )
+    )
+    application = builder.build()
+    if persistence:
+        persistence.attach(application)
+
+    # Добавляем обработчики. Нажатия кнопок привязаны к опросу пользователя,
+    # а не к конкретному сообщению, — предупреждение про per_message не про нас
+    warnings.filterwarnings('ignore', message=".*per_message=False", category=PTBUserWarning)
+    conv_handler = ConversationHandler(
+        entry_points=[CommandHandler('start', metrics.instrument(start_command))],
+        states=build_states(),
+        fallbacks=[
+            CommandHandler('cancel', metrics.instrument(cancel)),
+            CommandHandler('test', metrics.instrument(test_command)),
+        ],
+        name=config.state.CONVERSATION_NAME,
+        persistent=config.state.ENABLED,
+        # Брошенный опрос закрывается по таймеру JobQueue, а не висит в памяти вечно
+        conversation_timeout=config.state.SESSION_TIMEOUT or None
+    )
+    state_names = {step.state: step.key for step in survey.STEPS}
+    state_names[FINAL_CONFIRMATION] = survey.CONFIRMATION.key
+    metrics.watch_conversations(conv_handler, state_names)
+
+    application.add_handler(conv_handler)
+    application.add_handler(CommandHandler('broadcast', metrics.instrument(lazy_command(broadcast, 'broadcast_command'))))
+    application.add_handler(CommandHandler('stats', metrics.instrument(lazy_command(stats, 'stats_command'))))
+    application.add_handler(CommandHandler('export', metrics.instrument(lazy_command(export, 'export_command'))))
+    # Без вариантов на выбор их кнопок не бывает: старые достанутся stale_button
+    if config.generation.CANDIDATES > 1:
+        application.add_handler(CallbackQueryHandler(
+            metrics.instrument(handle_candidate), pattern=f"^{candidates.CALLBACK_PREFIX}:"
+        ))
+    application.add_handler(CallbackQueryHandler(metrics.instrument(stale_button)))
+    application.add_error_handler(error_handler)
+    return application
 
 # Основная функция
 def main():
     # Проверка переменных
-    if not all([TELEGRAM_BOT_TOKEN, YANDEX_API_KEY, YANDEX_FOLDER_ID]):
+    # Ключ и каталог не нужны, если бэкенды перечислены в YANDEX_GPT_BACKENDS
+    yandex_configured = bool(YandexConfig.BACKENDS.strip()) or all([YANDEX_API_KEY, YANDEX_FOLDER_ID])
+    if not TELEGRAM_BOT_TOKEN or not yandex_configured:
         logger.error("Не все переменные окружения установлены!")
         logger.error(f"Telegram Token: {'SET' if TELEGRAM_BOT_TOKEN else 'MISSING'}")
         logger.error(f"Yandex API Key: {'SET' if YANDEX_API_KEY else 'MISSING'}")
         logger.error(f"Yandex Folder ID: {'SET' if YANDEX_FOLDER_ID else 'MISSING'}")
+        logger.error(f"Yandex GPT Backends: {'SET' if YandexConfig.BACKENDS.strip() else 'MISSING'}")
         return
 
-    # Инициализация базы данных
-    db_manager.init_database()
-
-    # Создаем приложение
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-
-    # Добавляем обработчики
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start_command)],
-        states={
-            GENDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_gender)],
-            SERVICE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_service)],
-            LIKES: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_likes)],
-            COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_comment)],
-            RECOMMENDATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_recommendation)],
-            FINAL_CONFIRMATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_final_confirmation)]
-        },
-        fallbacks=[CommandHandler('cancel', cancel), CommandHandler('test', test_command)]
-    )
-
-    application.add_handler(conv_handler)
-    application.add_error_handler(error_handler)
+    application = build_application()
 
     # Запускаем бота
     logger.info("🚀 Бот запускается...")
-    application.run_polling()
+    if config.bot.MODE == 'webhook':
+        web_server.run_webhook(application)
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,194 @@
+import asyncio
+import functools
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from telegram.ext import ConversationHandler
+
+import startup
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Метрики в формате Prometheus, отдаются на /metrics (web_server.py).
+# Наблюдение — это пара операций со словарем и счетчиком под локом,
+# поэтому меряем каждый апдейт, без сэмплирования.
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Границы корзин в секундах: быстрые обработчики и БД — от миллисекунд,
+# запросы к YaGPT — до десятков секунд
+FAST_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+SLOW_BUCKETS = (.1, .25, .5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60)
+
+HANDLER_LATENCY = Histogram(
+    'bot_handler_seconds', "Время работы обработчика апдейта", ['handler'],
+    buckets=FAST_BUCKETS + (10, 30)
+)
+HANDLER_ERRORS = Counter('bot_handler_errors_total', "Исключения в обработчиках", ['handler'])
+
+YAGPT_LATENCY = Histogram(
+    'yagpt_request_seconds', "Длительность HTTP-запроса к YaGPT по бэкенду и статусу ответа", ['backend', 'status'],
+    buckets=SLOW_BUCKETS
+)
+YAGPT_BACKEND_IN_FLIGHT = Gauge('yagpt_backend_in_flight', "Запросы к бэкенду YaGPT в работе", ['backend'])
+YAGPT_BACKEND_EJECTIONS = Counter(
+    'yagpt_backend_ejections_total', "Исключения бэкенда YaGPT из выбора после 429/5xx", ['backend']
+)
+YAGPT_RETRIES = Counter('yagpt_retries_total', "Повторы запросов к YaGPT после 429/5xx")
+YAGPT_HEDGES = Counter('yagpt_hedges_total', "Дублирующие запросы к YaGPT по исходу", ['outcome'])
+YAGPT_HEDGE_DELAY = Gauge('yagpt_hedge_delay_seconds', "Текущая задержка перед дублирующим запросом")
+YAGPT_FALLBACKS = Counter('yagpt_fallbacks_total', "Запросы, оставшиеся без ответа YaGPT", ['reason'])
+YAGPT_TOKENS = Counter('yagpt_tokens_total', "Токены по блоку usage ответа YaGPT", ['kind'])
+YAGPT_BUDGET_SPENT = Gauge('yagpt_budget_spent_tokens', "Токены YaGPT, потраченные за текущие сутки")
+RATE_LIMITED = Counter('review_rate_limited_total', "Генерации, замененные из-за лимитов", ['reason'])
+
+DEDUP_CHECK = Histogram('dedup_check_seconds', "Поиск похожих отзывов по LSH-индексу", buckets=FAST_BUCKETS)
+NEAR_DUPLICATES = Counter('review_near_duplicates_total', "Отзывы, отправленные на перегенерацию из-за сходства")
+
+REVIEW_TEXT_FIXES = Counter('review_text_fixes_total', "Исправления текста отзыва без перегенерации", ['fix'])
+REVIEW_TEXT_REJECTED = Counter('review_text_rejected_total', "Тексты отзыва, которые не удалось исправить", ['reason'])
+REVIEW_REGENERATIONS = Counter('review_regenerations_total', "Повторные запросы к YaGPT из-за негодного текста")
+
+CANDIDATE_ACTIONS = Counter('review_candidate_actions_total', "Действия с вариантами отзыва", ['action'])
+
+REVIEWS_DELIVERED = Counter('reviews_delivered_total', "Выданные отзывы по источнику текста", ['source'])
+
+DB_SAVE_REVIEW = Histogram(
+    'db_save_review_seconds', "Время save_review (постановка в очередь записи)", buckets=FAST_BUCKETS
+)
+DB_WRITE_BATCH = Histogram('db_write_batch_seconds', "Запись пачки отзывов в БД", buckets=FAST_BUCKETS)
+DB_REVIEWS_LOST = Counter('db_reviews_lost_total', "Отзывы, которые не удалось записать в БД даже по одному")
+
+LOOP_LAG = Histogram(
+    'event_loop_lag_seconds', "Опоздание цикла событий относительно таймера", buckets=FAST_BUCKETS
+)
+
+ACTIVE_CONVERSATIONS = Gauge('survey_active_conversations', "Незавершенные опросы по шагам", ['state'])
+SURVEY_FUNNEL = Counter('survey_funnel_total', "Сколько опросов дошло до шага", ['step'])
+SURVEY_SESSIONS = Gauge('survey_sessions', "Записи с ответами опроса в памяти")
+SURVEY_SESSIONS_BYTES = Gauge('survey_sessions_bytes', "Оценка памяти под записи с ответами опроса")
+STARTUP = Gauge('bot_startup_seconds', "Время от запуска процесса до конца этапа старта", ['phase'])
+
+# Ответ YaGPT без HTTP-статуса: таймаут, обрыв соединения и т.п.
+STATUS_ERROR = 'error'
+# Запрос отменен: проиграл дублю или истек срок задачи
+STATUS_CANCELLED = 'cancelled'
+
+_conversation_handler: Optional[ConversationHandler] = None
+_state_names: Dict[object, str] = {}
+
+
+def instrument(callback: Callable) -> Callable:
+    """Обертка обработчика: длительность и исключения с меткой по имени"""
+    name = callback.__name__
+    latency = HANDLER_LATENCY.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+def record_usage(usage: Optional[dict]) -> int:
+    """Учесть токены из блока usage ответа (числа там приходят строками).
+
+    Возвращает, сколько токенов ушло на запрос всего.
+    """
+    if not usage:
+        return 0
+    input_tokens = int(usage.get('inputTextTokens', 0))
+    completion_tokens = int(usage.get('completionTokens', 0))
+    YAGPT_TOKENS.labels('input').inc(input_tokens)
+    YAGPT_TOKENS.labels('completion').inc(completion_tokens)
+    return int(usage.get('totalTokens', input_tokens + completion_tokens))
+
+
+def watch_conversations(handler: ConversationHandler, state_names: Dict[object, str]):
+    """Считать активные опросы этого ConversationHandler по шагам при каждом сборе"""
+    global _conversation_handler, _state_names
+    _conversation_handler = handler
+    _state_names = state_names
+
+
+def _collect_conversations():
+    if _conversation_handler is None:
+        return
+    # Публичного доступа к состояниям нет, читаем словарь обработчика
+    counts = dict.fromkeys(_state_names.values(), 0)
+    for state in list(_conversation_handler._conversations.values()):
+        name = _state_names.get(state, str(state))
+        counts[name] = counts.get(name, 0) + 1
+    for name, count in counts.items():
+        ACTIVE_CONVERSATIONS.labels(name).set(count)
+
+
+def render() -> bytes:
+    """Текущие значения в текстовом формате Prometheus"""
+    _collect_conversations()
+    for phase, seconds in startup.phases.items():
+        STARTUP.labels(phase).set(seconds)
+    return generate_latest()
+
+
+def _resident_memory() -> Optional[int]:
+    """Текущий RSS процесса в байтах (Linux), None — если узнать нельзя"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def collect_sessions(application) -> Dict[str, Optional[int]]:
+    """Опросы и записи с ответами в памяти, их примерный объем и RSS процесса"""
+    sessions = list(application.user_data.values())
+    size = sum(sys.getsizeof(session) for session in sessions)
+    SURVEY_SESSIONS.set(len(sessions))
+    SURVEY_SESSIONS_BYTES.set(size)
+    conversations = len(_conversation_handler._conversations) if _conversation_handler else 0
+    return {
+        'conversations': conversations,
+        'sessions': len(sessions),
+        'sessions_bytes': size,
+        'rss_bytes': _resident_memory(),
+    }
+
+
+async def report_sessions(application, interval: float = config.metrics.SESSION_REPORT_INTERVAL):
+    """Фоновая задача: раз в interval писать в лог, сколько опросов держим в памяти.
+
+    При закрытии брошенных опросов по таймауту эти числа и RSS не должны
+    расти от недели к неделе.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        report = collect_sessions(application)
+        rss = report['rss_bytes']
+        rss_text = f", RSS процесса {rss / 2 ** 20:.0f} МБ" if rss is not None else ""
+        logger.info(
+            f"Опросы в памяти: {report['conversations']} активных, {report['sessions']} записей с ответами "
+            f"(~{report['sessions_bytes'] / 1024:.0f} КБ){rss_text}"
+        )
+
+
+async def monitor_loop_lag(interval: float = config.metrics.LOOP_LAG_INTERVAL):
+    """Фоновая задача: насколько позже положенного просыпается цикл событий"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
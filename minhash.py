@@ -0,0 +1,74 @@
+import random
+import re
+import zlib
+from array import array
+from typing import List, Set
+
+# MinHash-подписи и LSH-корзины для поиска почти одинаковых отзывов.
+#
+# Текст -> множество шинглов (пары соседних слов) -> NUM_PERM минимумов
+# хэш-функций. Доля совпавших позиций двух подписей оценивает
+# коэффициент Жаккара их шинглов. Подпись режется на BANDS полос по ROWS
+# значений; тексты, совпавшие хоть в одной полосе, — кандидаты в
+# похожие. Порог срабатывания LSH около (1 / BANDS) ** (1 / ROWS) ≈ 0.59.
+#
+# Хэши детерминированы (crc32 и фиксированный seed), подписи можно
+# хранить в БД и сравнивать между перезапусками.
+
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 2
+
+_PRIME = (1 << 61) - 1
+_MASK32 = 0xFFFFFFFF
+_MASK63 = (1 << 63) - 1
+
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_WORD = re.compile(r'\w+')
+
+
+def shingles(text: str) -> Set[int]:
+    words = _WORD.findall(text.lower().replace('ё', 'е'))
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(word.encode()) for word in words}
+    return {
+        zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode())
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(text: str) -> List[int]:
+    """MinHash-подпись текста: NUM_PERM 32-битных значений"""
+    hashed = shingles(text)
+    if not hashed:
+        return [_MASK32] * NUM_PERM
+    return [min((a * x + b) % _PRIME for x in hashed) & _MASK32 for a, b in _PERMUTATIONS]
+
+
+def buckets(sig: List[int]) -> List[int]:
+    """Ключи LSH-корзин: по одному на полосу, номер полосы входит в ключ"""
+    keys = []
+    for band in range(BANDS):
+        key = band + 1
+        for value in sig[band * ROWS:(band + 1) * ROWS]:
+            key = (key * 1000003 ^ value) & _MASK63
+        keys.append(key)
+    return keys
+
+
+def similarity(first: List[int], second: List[int]) -> float:
+    """Оценка коэффициента Жаккара по двум подписям"""
+    return sum(a == b for a, b in zip(first, second)) / NUM_PERM
+
+
+def pack(sig: List[int]) -> bytes:
+    return array('I', sig).tobytes()
+
+
+def unpack(data: bytes) -> List[int]:
+    sig = array('I')
+    sig.frombytes(data)
+    return sig.tolist()
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import pickle
+import time
+from typing import Dict, Optional, Tuple
+
+import telegram
+from telegram import Update
+from telegram.ext import Application, BasePersistence, PersistenceInput
+
+from config import config
+from state_store import StateStore
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CONVERSATION = 'conversation'
+
+
+class SurveyPersistence(BasePersistence):
+    """Персистентность опросов в общем хранилище (StateStore).
+
+    Хранятся user_data и состояния ConversationHandler, ничего не
+    читается при старте: данные чата подгружаются лениво перед каждым
+    его апдейтом (hydrate) одним запросом к хранилищу. Локальной копии
+    не доверяем: соседний апдейт чата мог прийти на другую реплику.
+
+    После апдейта изменения сразу сбрасываются (after_update), не дожидаясь
+    update_interval, — иначе следующий апдейт на другой реплике увидит
+    старое состояние. Запись коалесцируется: все изменения одного прохода
+    update_persistence уходят одной транзакцией хранилища.
+    """
+
+    def __init__(self, store: StateStore,
+                 update_interval: float = config.state.FLUSH_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        self.store = store
+        self.application: Optional[Application] = None
+        self._pending: Dict[Tuple[str, str], Optional[bytes]] = {}
+        # Пачка, которая сейчас пишется: в хранилище ее еще нет
+        self._writing: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._write_task: Optional[asyncio.Task] = None
+
+    def attach(self, application: Application):
+        self.application = application
+
+    def verify(self):
+        """Проверить после initialize, что внутренности Application на месте.
+
+        Публичного способа подложить состояние в ConversationHandler нет,
+        hydrate пишет во внутренний словарь Application, поэтому версия
+        python-telegram-bot закреплена в requirements.txt. На другой версии
+        лучше не запуститься, чем молча терять опросы между репликами.
+        """
+        conversations = getattr(self.application, '_conversation_handler_conversations', {})
+        states = conversations.get(config.state.CONVERSATION_NAME)
+        if states is None or not hasattr(states, 'update_no_track') or not hasattr(self.application, '_user_data'):
+            raise RuntimeError(
+                f"python-telegram-bot {telegram.__version__} не поддерживается: не найдены состояния "
+                f"опроса '{config.state.CONVERSATION_NAME}' в Application, нужна версия из requirements.txt"
+            )
+
+    # Ленивая загрузка
+
+    async def hydrate(self, update: object):
+        """Подгрузить состояние пользователя перед обработкой его апдейта"""
+        if not isinstance(update, Update) or not (update.effective_user and update.effective_chat):
+            return
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+
+        user_keys = self._user_keys(chat_id, user_id)
+        # Несброшенные локальные изменения свежее хранилища
+        if any(key in self._pending or key in self._writing for key in user_keys):
+            return
+
+        stored = await self.store.get_many(user_keys)
+        raw_user_data, raw_state = (stored.get(key) for key in user_keys)
+        # application.user_data создает запись при обращении, поэтому
+        # для пользователя без сохраненных ответов ее не трогаем
+        if raw_user_data is not None:
+            user_data = self.application.user_data[user_id]
+            user_data.clear()
+            user_data.update(pickle.loads(raw_user_data))
+        elif user_id in self.application.user_data:
+            # Опрос закончился на другой реплике
+            self.application.user_data[user_id].clear()
+
+        # Публичного способа подложить состояние в ConversationHandler нет (см. verify)
+        conversations = self.application._conversation_handler_conversations[config.state.CONVERSATION_NAME]
+        key = (chat_id, user_id)
+        if raw_state is None:
+            if key in conversations:
+                # Опрос закончился на другой реплике
+                conversations.pop(key)
+        else:
+            conversations.update_no_track({key: pickle.loads(raw_state)})
+
+    async def timed_out(self, update: Update) -> bool:
+        """Сверить с хранилищем опрос, по которому сработал таймер этой реплики.
+
+        Таймер conversation_timeout живет в JobQueue реплики, обработавшей
+        последний апдейт, и про другие реплики не знает. Если опрос с тех пор
+        закончился или продолжился на другой реплике, закрывать его нельзя:
+        возвращаем False, а свою устаревшую копию забываем без записи —
+        иначе END затер бы в хранилище опрос, который идет на другой реплике.
+        """
+        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
+        user_keys = self._user_keys(chat_id, user_id)
+        # Несброшенные локальные изменения свежее хранилища — опрос наш
+        if any(key in self._pending or key in self._writing for key in user_keys):
+            return True
+
+        stored = await self.store.get_many(user_keys)
+        raw_user_data, raw_state = (stored.get(key) for key in user_keys)
+        conversations = self.application._conversation_handler_conversations[config.state.CONVERSATION_NAME]
+        key = (chat_id, user_id)
+        session = self.application.user_data.get(user_id)
+        stored_state = None if raw_state is None else pickle.loads(raw_state)
+        stored_at = None if raw_user_data is None else pickle.loads(raw_user_data).updated_at
+        local_at = None if session is None else session.updated_at
+        if stored_state == conversations.get(key) and stored_at == local_at:
+            return True
+
+        # Без отслеживания: ConversationHandler после таймаута ставит END,
+        # только если ключ еще есть, а drop_user_data записал бы удаление
+        conversations.data.pop(key, None)
+        self.application._user_data.pop(user_id, None)
+        return False
+
+    async def after_update(self, update: object):
+        """Сразу сбросить изменения, сделанные при обработке апдейта"""
+        await self.application.update_persistence()
+        if self._write_task is not None:
+            # Следующий апдейт чата может прийти на другую реплику — он должен застать запись
+            await asyncio.shield(self._write_task)
+
+    @staticmethod
+    def _user_keys(chat_id: int, user_id: int):
+        return [(USER_DATA, str(user_id)), (CONVERSATION, json.dumps([chat_id, user_id]))]
+
+    # Запись
+
+    def _dump(self, user_id: int, session) -> bytes:
+        # Application передает в update_user_data копию — метку ставим и живой записи
+        session.updated_at = time.time()
+        live = self.application.user_data.get(user_id)
+        if live is not None:
+            live.updated_at = session.updated_at
+        return pickle.dumps(session)
+
+    def _enqueue(self, namespace: str, key: str, value: Optional[bytes]):
+        self._pending[(namespace, key)] = value
+        if self._write_task is None:
+            self._write_task = asyncio.create_task(self._write_pending())
+
+    async def _write_pending(self):
+        # Даем остальным update_* текущего прохода тоже попасть в пачку
+        await asyncio.sleep(0)
+        try:
+            while self._pending:
+                batch = self._writing = self._pending
+                self._pending = {}
+                try:
+                    await self.store.put_many((ns, key, value) for (ns, key), value in batch.items())
+                except Exception as e:
+                    logger.error(f"Ошибка записи состояния опросов ({len(batch)} записей): {e}")
+                    # Не теряем изменения: более новые значения важнее старых
+                    for item_key, value in batch.items():
+                        self._pending.setdefault(item_key, value)
+                    return
+        finally:
+            self._writing = {}
+            self._write_task = None
+
+    async def flush(self):
+        if self._write_task is not None:
+            await self._write_task
+        if self._pending:
+            await self._write_pending()
+        await self.store.close()
+
+    async def update_user_data(self, user_id: int, data: dict):
+        if not data.empty:
+            self._enqueue(USER_DATA, str(user_id), self._dump(user_id, data))
+            return
+        # Пустую запись (апдейт вне опроса, опрос только начат) не храним.
+        # Application создает ее при любом апдейте пользователя, так что
+        # из памяти тоже убираем, если ее еще не успели заполнить. Удаление
+        # из хранилища пишем здесь же: отложенный drop_user_data Application
+        # сработал бы позже и стер бы опрос, продолженный на другой реплике.
+        session = self.application.user_data.get(user_id)
+        if session is not None and session.empty:
+            self.application._user_data.pop(user_id, None)
+        self._enqueue(USER_DATA, str(user_id), None)
+
+    async def drop_user_data(self, user_id: int):
+        # Между drop_user_data и этим вызовом пользователь мог начать новый
+        # опрос. Application тогда не сохраняет его запись отдельно, поэтому
+        # пишем ее здесь вместо удаления.
+        session = self.application.user_data.get(user_id)
+        value = None if session is None or session.empty else self._dump(user_id, session)
+        self._enqueue(USER_DATA, str(user_id), value)
+
+    async def update_conversation(self, name: str, key: Tuple[int, ...], new_state: Optional[object]):
+        value = None if new_state is None else pickle.dumps(new_state)
+        self._enqueue(CONVERSATION, json.dumps(list(key)), value)
+
+    # При старте ничего не загружаем — все подгружается лениво
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        pass
+
+    # Остальные данные не храним
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        pass
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
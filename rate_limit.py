@@ -0,0 +1,172 @@
+import asyncio
+import datetime
+import time
+from collections import OrderedDict, deque
+from typing import Hashable
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Через сколько секунд можно будет взять токен (0 — уже можно)"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self._paused_until - now)
+        if self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.rate)
+        return wait
+
+    def consume(self):
+        self._tokens -= 1
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (например, после RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class ChatRateLimiter:
+    """Общий лимит отправки плюс отдельный лимит на каждый чат.
+
+    Корзины чатов хранятся в LRU ограниченного размера: давно
+    неактивный чат все равно успел бы полностью восполнить корзину.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, max_chats: int = 10000):
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_rate = chat_rate
+        self.max_chats = max_chats
+        self._chats: OrderedDict = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chats.pop(chat_id, None)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, capacity=1)
+        self._chats[chat_id] = bucket
+        while len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return bucket
+
+    async def acquire(self, chat_id: Hashable):
+        # Берем токены из обеих корзин сразу, чтобы не тратить общий зря
+        async with self._lock:
+            chat_bucket = self._chat_bucket(chat_id)
+            while True:
+                wait = max(self.global_bucket.delay(), chat_bucket.delay())
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.global_bucket.consume()
+            chat_bucket.consume()
+
+    def pause(self, seconds: float):
+        self.global_bucket.pause(seconds)
+
+
+class SlidingWindowLimiter:
+    """Не больше limit событий за window секунд на ключ.
+
+    На ключ хранится не больше limit меток времени. Ключи лежат в LRU
+    в порядке последнего события: ключ, у которого окно опустело,
+    удаляется при следующем обращении, а сверх max_keys вытесняются
+    самые давние.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events: OrderedDict = OrderedDict()
+
+    def _expire(self, now: float):
+        while self._events:
+            key, events = next(iter(self._events.items()))
+            if events[-1] > now - self.window:
+                break
+            del self._events[key]
+
+    def hit(self, key: Hashable, count: int = 1) -> bool:
+        """Учесть count событий разом, если лимит позволяет; False — лимит исчерпан.
+
+        count больше limit урезается до limit: в пустое окно событие проходит всегда.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        events = self._events.get(key)
+        if events is None:
+            events = deque()
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        count = min(count, self.limit)
+        if len(events) + count > self.limit:
+            return False
+
+        events.extend([now] * count)
+        self._events[key] = events
+        self._events.move_to_end(key)
+        while len(self._events) > self.max_keys:
+            self._events.popitem(last=False)
+        return True
+
+    def retry_after(self, key: Hashable) -> float:
+        """Через сколько секунд для ключа освободится место в окне"""
+        events = self._events.get(key)
+        if not events or len(events) < self.limit:
+            return 0.0
+        return max(0.0, events[0] + self.window - time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+
+class DailyBudget:
+    """Суточный бюджет токенов и их стоимости; лимит 0 — без ограничения.
+
+    Траты известны только после ответа, поэтому одновременные запросы
+    могут превысить бюджет на величину одного ответа каждый.
+    """
+
+    def __init__(self, max_tokens: int, max_cost: float, price_per_1k: float):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.price_per_1k = price_per_1k
+        self._day = datetime.date.today()
+        self._tokens = 0
+
+    def _rollover(self):
+        today = datetime.date.today()
+        if today != self._day:
+            self._day = today
+            self._tokens = 0
+
+    def spend(self, tokens: int):
+        self._rollover()
+        self._tokens += tokens
+
+    @property
+    def tokens(self) -> int:
+        self._rollover()
+        return self._tokens
+
+    @property
+    def cost(self) -> float:
+        return self.tokens * self.price_per_1k / 1000
+
+    @property
+    def exhausted(self) -> bool:
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            return True
+        return bool(self.max_cost) and self.cost >= self.max_cost
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Момент по часам цикла событий (loop.time()), после которого ответ уже
+# не нужен. Ставит очередь генерации на время задачи; клиенты API по нему
+# решают, есть ли смысл в дополнительных запросах.
+request_deadline: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+
+class CircuitBreaker:
+    """Автомат защиты для внешнего API.
+
+    CLOSED — запросы идут как обычно. После failure_threshold ошибок
+    подряд переходит в OPEN: запросы сразу отклоняются, и вызывающий
+    отдает fallback без ожидания таймаута. Через reset_timeout секунд —
+    HALF_OPEN: пропускается не больше half_open_probes пробных запросов.
+    Успешная проба закрывает автомат, ошибка снова открывает его.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        """Можно ли сейчас отправить запрос"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._set_state(self.HALF_OPEN)
+            self._probes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+            self.state = state
+
+
+class AIMDLimiter:
+    """Адаптивный лимит одновременных запросов (AIMD).
+
+    Каждый успешный запрос увеличивает лимит на increase (до max_limit),
+    перегрузка (например, 429) уменьшает его в decrease_factor раз
+    (не ниже min_limit). Используется как async context manager.
+    """
+
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: int = 32,
+                 increase: float = 1.0, decrease_factor: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        # Аддитивный рост: +increase на каждый «полный круг» запросов
+        self._limit = min(self.max_limit, self._limit + self.increase / max(self._limit, 1.0))
+
+    def on_overload(self):
+        # Мультипликативное снижение
+        new_limit = max(self.min_limit, self._limit * self.decrease_factor)
+        if int(new_limit) != int(self._limit):
+            logger.warning(f"AIMD: лимит запросов снижен до {int(new_limit)}")
+        self._limit = new_limit
+
+
+class LatencyWindow:
+    """Задержки последних size успешных запросов и их перцентили"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class HedgeBudget:
+    """Дублирующих запросов — не больше fraction от всех.
+
+    Каждый запрос добавляет fraction токена (копится не больше burst),
+    дубль тратит целый токен. Так при общей деградации API дубли быстро
+    кончаются и не удваивают нагрузку и расходы.
+    """
+
+    def __init__(self, fraction: float, burst: float = 10.0):
+        self.fraction = fraction
+        self.burst = burst
+        self._tokens = 0.0
+
+    def record_request(self):
+        self._tokens = min(self.burst, self._tokens + self.fraction)
+
+    def try_acquire(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
@@ -0,0 +1,123 @@
+import asyncio
+import itertools
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+import http_session
+import survey
+from config import config
+from database import db_manager
+from yagpt_client import yagpt_client
+
+logger = logging.getLogger(__name__)
+
+# Пространство ответов опроса без комментария:
+# 2 пола × 9 услуг × 31 непустой набор «понравилось» × 2 ответа = 1116 комбинаций
+GENDERS = survey.step('gender').options
+SERVICES = survey.step('service').options
+LIKES = survey.step('likes').options
+RECOMMENDATIONS = survey.step('recommendation').options
+SERVICE_INDEX = {service: index for index, service in enumerate(SERVICES)}
+LIKE_BITS = {like: 1 << index for index, like in enumerate(LIKES)}
+
+Combo = Tuple[str, str, List[str], str]
+
+
+def combo_key(gender: str, service: str, likes: List[str], recommendation: str) -> Optional[str]:
+    """Ключ комбинации ответов или None, если ответы вне известного набора"""
+    if service not in SERVICE_INDEX or not likes:
+        return None
+    mask = 0
+    for like in likes:
+        bit = LIKE_BITS.get(like)
+        if bit is None:
+            return None
+        mask |= bit
+    gender_code = 'f' if 'женск' in gender.lower() else 'm'
+    recommendation_code = 'y' if recommendation == survey.RECOMMEND_YES else 'n'
+    return f"{gender_code}|{SERVICE_INDEX[service]}|{mask}|{recommendation_code}"
+
+
+def iter_combos() -> Iterator[Tuple[str, Combo]]:
+    for gender, service, mask, recommendation in itertools.product(
+        GENDERS, SERVICES, range(1, 1 << len(LIKES)), RECOMMENDATIONS
+    ):
+        likes = [like for bit, like in enumerate(LIKES) if mask & (1 << bit)]
+        yield combo_key(gender, service, likes, recommendation), (gender, service, likes, recommendation)
+
+
+async def take(gender: str, service: str, likes: List[str], recommendation: str) -> Optional[str]:
+    """Готовый отзыв из пула за один индексный запрос, если он есть"""
+    key = combo_key(gender, service, likes, recommendation)
+    if key is None:
+        return None
+    return await db_manager.take_pooled_review(key, config.pool.MAX_SERVES)
+
+
+async def refill(limit: int = config.pool.REFILL_BATCH) -> int:
+    """Догенерировать отзывы для комбинаций с низким остатком.
+
+    Возвращает, сколько отзывов добавлено. За один вызов генерируется
+    не больше limit отзывов, чтобы пополнение не съедало квоту YaGPT.
+    """
+    # Выданные отзывы больше не нужны, иначе таблица только растет
+    pruned = await db_manager.prune_pool(config.pool.MAX_SERVES)
+    if pruned:
+        logger.info(f"Из пула удалено выданных отзывов: {pruned}")
+    if config.generation.BACKEND == 'local':
+        # Локальный генератор отвечает сразу, пул не нужен, а YaGPT при этом не трогаем
+        return 0
+    if yagpt_client.budget.exhausted:
+        # Остаток суточного бюджета нужнее живым пользователям
+        return 0
+    stock = await db_manager.pooled_stock(config.pool.MAX_SERVES)
+    needed: List[Tuple[str, Combo]] = []
+    for key, combo in iter_combos():
+        have = stock.get(key, 0)
+        if have < config.pool.LOW_STOCK:
+            needed.extend([(key, combo)] * (config.pool.TARGET_PER_COMBO - have))
+        if len(needed) >= limit:
+            break
+    needed = needed[:limit]
+    if not needed:
+        return 0
+
+    semaphore = asyncio.Semaphore(config.pool.REFILL_CONCURRENCY)
+
+    async def generate(key: str, combo: Combo) -> Optional[Tuple[str, str]]:
+        async with semaphore:
+            text = await yagpt_client.generate_review(*combo)
+        return (key, text) if text else None
+
+    results = await asyncio.gather(*(generate(key, combo) for key, combo in needed))
+    rows = [row for row in results if row]
+    if rows:
+        await db_manager.add_pooled_reviews(rows)
+    logger.info(f"Пул отзывов пополнен: {len(rows)} из {len(needed)}")
+    return len(rows)
+
+
+async def refill_loop():
+    """Фоновое пополнение пула по расписанию"""
+    while True:
+        try:
+            await refill()
+        except Exception as e:
+            logger.error(f"Ошибка пополнения пула отзывов: {e}")
+        await asyncio.sleep(config.pool.REFILL_INTERVAL)
+
+
+async def _fill_all():
+    # Офлайн-заполнение: python review_pool.py
+    await db_manager.init_database()
+    try:
+        while await refill(limit=config.pool.REFILL_BATCH):
+            pass
+    finally:
+        await db_manager.close()
+        await http_session.close_session()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_fill_all())
@@ -0,0 +1,101 @@
+import logging
+import re
+from typing import List, Optional
+
+import metrics
+from config import config
+from local_generator import BRAND
+
+# Проверка и починка текста отзыва перед выдачей.
+#
+# Отзыв показывается внутри `...` с parse_mode='Markdown': лишний
+# обратный апостроф от модели ломает разметку всего сообщения, и
+# Telegram его не принимает. Экранировать внутри code-сущности в
+# старом Markdown нельзя, поэтому такие символы удаляются, как и
+# остальная разметка с эмодзи — в промпте их и так просили не писать.
+#
+# sanitize() чинит только оформление и годится для любого текста,
+# clean() еще проверяет содержание: длину, число предложений и
+# упоминание агентства. Если это не чинится, clean() возвращает None —
+# только тогда стоит просить у YaGPT новый текст.
+
+logger = logging.getLogger(__name__)
+
+_EMOJI = re.compile('[\U0001F000-\U0001FAFF\u2300-\u23FF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D\u20E3]+')
+
+# (название исправления, шаблон, замена) — применяются по порядку
+_FIXES = [
+    ('emoji', _EMOJI, ''),
+    ('link', re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),
+    ('heading', re.compile(r'^[ \t]*#+[ \t]*', re.M), ''),
+    ('markdown', re.compile(r'[*_`]+'), ''),
+    ('prefix', re.compile(r'^\s*(?:текст отзыва|отзыв)\s*(?::|\n)\s*', re.I), ''),
+    ('quotes', re.compile(r'^\s*[«"“„]([^«»"“”„]*)[»"”]\s*$'), r'\1'),
+]
+_BRAND = re.compile(r'demyanov\s*realty', re.I)
+
+_SPACES = re.compile(r'[ \t\xa0]+')
+_SPACE_BEFORE_PUNCTUATION = re.compile(r' +([,.!?…:;])')
+_BLANK_LINES = re.compile(r'\n\s*\n\s*')
+# Конец предложения: знаки препинания, за ними могут идти закрывающие кавычки
+_SENTENCE_END = re.compile(r'[.!?…]+[»")]*(?=\s|$)')
+
+
+def sanitize(text: str) -> str:
+    """Убрать разметку и эмодзи, нормализовать пробелы"""
+    for name, pattern, replacement in _FIXES:
+        fixed = pattern.sub(replacement, text)
+        if fixed != text:
+            metrics.REVIEW_TEXT_FIXES.labels(name).inc()
+            text = fixed
+    lines = [_SPACE_BEFORE_PUNCTUATION.sub(r'\1', _SPACES.sub(' ', line)).strip() for line in text.split('\n')]
+    return _BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def sentence_ends(text: str) -> List[int]:
+    """Позиции концов законченных предложений"""
+    return [match.end() for match in _SENTENCE_END.finditer(text)]
+
+
+def clean(text: str, truncated: bool = False) -> Optional[str]:
+    """Исправленный текст отзыва или None, если исправить нельзя.
+
+    truncated — ответ оборван по maxTokens: недописанное предложение
+    отрезается. Иначе без точки в конце просто ставится точка.
+    """
+    # Название агентства в другом регистре — тоже упоминание
+    text = _BRAND.sub(BRAND, sanitize(text))
+    ends = sentence_ends(text)
+
+    if text and (not ends or ends[-1] < len(text)):
+        if truncated and ends:
+            text = text[:ends[-1]]
+            metrics.REVIEW_TEXT_FIXES.labels('unfinished').inc()
+        elif not truncated:
+            text += '.'
+            ends.append(len(text))
+            metrics.REVIEW_TEXT_FIXES.labels('punctuation').inc()
+
+    # Слишком длинный — сокращаем по границе предложения
+    limit = len(ends)
+    while limit > config.generation.REVIEW_MIN_SENTENCES and (
+        limit > config.generation.REVIEW_MAX_SENTENCES or ends[limit - 1] > config.generation.REVIEW_MAX_LENGTH
+    ):
+        limit -= 1
+    if limit < len(ends):
+        text = text[:ends[limit - 1]]
+        ends = ends[:limit]
+        metrics.REVIEW_TEXT_FIXES.labels('trimmed').inc()
+
+    problem = None
+    if len(ends) < config.generation.REVIEW_MIN_SENTENCES:
+        problem = 'sentences'
+    elif not config.generation.REVIEW_MIN_LENGTH <= len(text) <= config.generation.REVIEW_MAX_LENGTH:
+        problem = 'length'
+    elif BRAND not in text:
+        problem = 'brand'
+    if problem:
+        metrics.REVIEW_TEXT_REJECTED.labels(problem).inc()
+        logger.info(f"Текст отзыва не прошел проверку ({problem}): {text[:80]!r}")
+        return None
+    return text
@@ -0,0 +1,58 @@
+import asyncio
+import importlib.util
+import logging
+import sys
+import time
+from types import ModuleType
+from typing import Dict
+
+# Замер холодного старта. Модуль импортируется первым в main.py: от этого
+# момента считаются этапы запуска. Сколько стоил каждый импорт, показывает
+# python -X importtime main.py, его же разбирает benchmark.py.
+
+logger = logging.getLogger(__name__)
+
+STARTED = time.perf_counter()
+# Время от старта до конца этапа, секунды, в порядке прохождения
+phases: Dict[str, float] = {}
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Модуль, который загрузится при первом обращении к его атрибуту.
+
+    Для команд админов и необязательных функций: пока ими не пользуются,
+    их импорт не входит в холодный старт. Уже загруженный модуль
+    возвращается как есть. Загрузка не потокобезопасна: модуль, который
+    нужен и в asyncio.to_thread, импортируется обычным образом.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def mark(phase: str) -> float:
+    """Отметить конец этапа; возвращает секунды от старта"""
+    elapsed = time.perf_counter() - STARTED
+    phases[phase] = elapsed
+    return elapsed
+
+
+def imports_done():
+    """Отметить конец импортов main.py"""
+    elapsed = mark('imports')
+    logger.info(f"Импорт модулей: {elapsed * 1000:.0f} мс")
+
+
+async def report_when_ready(application, poll_interval: float = 0.01):
+    """Фоновая задача из post_init: дождаться, когда бот начнет принимать апдейты"""
+    while not application.running:
+        await asyncio.sleep(poll_interval)
+    elapsed = mark('ready')
+    timeline = ", ".join(f"{phase} {seconds * 1000:.0f}" for phase, seconds in phases.items())
+    logger.info(f"✅ Бот готов принимать обновления через {elapsed * 1000:.0f} мс после запуска ({timeline})")
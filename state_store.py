@@ -0,0 +1,127 @@
+import abc
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import aiosqlite
+
+# Хранилище состояния опросов: пары (namespace, key) -> bytes.
+# Значения уже сериализованы, хранилище про их формат ничего не знает.
+
+StateItem = Tuple[str, str, Optional[bytes]]
+
+
+class StateStore(abc.ABC):
+    """Интерфейс общего хранилища состояния.
+
+    Обязательны get и put_many, close — по необходимости. put_many получает
+    пачку записей и должен применить их разом; value=None — удаление.
+    get_many стоит переопределить, если хранилище умеет читать пачкой.
+    """
+
+    @abc.abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[bytes]:
+        ...
+
+    async def get_many(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], bytes]:
+        """Значения по ключам (namespace, key); отсутствующих ключей в ответе нет"""
+        result = {}
+        for namespace, key in keys:
+            value = await self.get(namespace, key)
+            if value is not None:
+                result[(namespace, key)] = value
+        return result
+
+    @abc.abstractmethod
+    async def put_many(self, items: Iterable[StateItem]):
+        ...
+
+    async def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """Локальная замена общего хранилища — для тестов и одной реплики"""
+
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], bytes] = {}
+
+    async def get(self, namespace: str, key: str) -> Optional[bytes]:
+        return self._data.get((namespace, key))
+
+    async def put_many(self, items: Iterable[StateItem]):
+        for namespace, key, value in items:
+            if value is None:
+                self._data.pop((namespace, key), None)
+            else:
+                self._data[(namespace, key)] = value
+
+
+class SQLiteStateStore(StateStore):
+    """Хранилище в SQLite-файле, который могут открыть несколько реплик"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db: Optional[aiosqlite.Connection] = None
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is None:
+            self._db = await aiosqlite.connect(self.path)
+            await self._db.execute("PRAGMA journal_mode=WAL")
+            await self._db.execute("PRAGMA synchronous=NORMAL")
+            # Другая реплика может держать блокировку записи
+            await self._db.execute("PRAGMA busy_timeout=5000")
+            await self._db.execute('''
+                CREATE TABLE IF NOT EXISTS state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key)
+                )
+            ''')
+            await self._db.commit()
+        return self._db
+
+    async def get(self, namespace: str, key: str) -> Optional[bytes]:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def get_many(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], bytes]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        db = await self._connection()
+        condition = " OR ".join(["(namespace = ? AND key = ?)"] * len(keys))
+        params = [part for item in keys for part in item]
+        async with db.execute(f"SELECT namespace, key, value FROM state WHERE {condition}", params) as cursor:
+            rows = await cursor.fetchall()
+        return {(namespace, key): value for namespace, key, value in rows}
+
+    async def put_many(self, items: Iterable[StateItem]):
+        db = await self._connection()
+        now = time.time()
+        upserts = []
+        deletes = []
+        for namespace, key, value in items:
+            if value is None:
+                deletes.append((namespace, key))
+            else:
+                upserts.append((namespace, key, value, now))
+
+        if upserts:
+            await db.executemany('''
+                INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            ''', upserts)
+        if deletes:
+            await db.executemany("DELETE FROM state WHERE namespace = ? AND key = ?", deletes)
+        await db.commit()
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
@@ -0,0 +1,47 @@
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from admin import admin_only
+from database import db_manager
+
+# За сколько последних дней показывать отзывы по дням
+STATS_DAYS = 7
+
+
+def _percent(part: int, total: int) -> str:
+    return f"{part * 100 / total:.0f}%" if total else "—"
+
+
+def format_stats(stats: dict) -> str:
+    total = stats['reviews']
+    lines = [
+        "📊 Статистика отзывов\n",
+        f"Всего: {total}",
+        f"Рекомендуют: {stats['recommended']} ({_percent(stats['recommended'], total)})",
+    ]
+
+    if stats['services']:
+        lines.append("\n🏢 По услугам:")
+        for service, reviews, recommended in stats['services']:
+            lines.append(f"• {service}: {reviews}, рекомендуют {_percent(recommended, reviews)}")
+
+    if stats['likes']:
+        lines.append("\n⭐ Что понравилось:")
+        for like, reviews in stats['likes']:
+            lines.append(f"• {like}: {reviews} ({_percent(reviews, total)})")
+
+    if stats['daily']:
+        lines.append(f"\n📅 За {STATS_DAYS} дней:")
+        for day, reviews, recommended in stats['daily']:
+            lines.append(f"• {day}: {reviews}, рекомендуют {_percent(recommended, reviews)}")
+
+    return "\n".join(lines)
+
+
+@admin_only
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats — сводка по отзывам из сводных таблиц"""
+    # Отложенные отзывы сначала дописываем, чтобы цифры были актуальны
+    await db_manager.flush()
+    stats = await db_manager.get_stats(STATS_DAYS)
+    await update.message.reply_text(format_stats(stats))
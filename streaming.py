@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressiveMessage:
+    """Сообщение, которое дописывается по мере генерации текста.
+
+    Первый фрагмент отправляется новым сообщением, дальше оно
+    редактируется не чаще раза в interval секунд (Telegram позволяет
+    примерно одну правку в секунду на чат). Промежуточные
+    тексты, пришедшие между правками, просто пропускаются — следующая
+    правка все равно покажет весь накопленный текст.
+    """
+
+    def __init__(self, bot: Bot, chat_id: int, interval: float = config.generation.STREAM_EDIT_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.interval = interval
+        self.message_id: Optional[int] = None
+        self._shown = ""
+        self._next_edit = 0.0
+
+    async def update(self, text: str):
+        text = text.strip()
+        if not text or text == self._shown:
+            return
+
+        loop = asyncio.get_running_loop()
+        if loop.time() < self._next_edit:
+            return
+
+        try:
+            if self.message_id is None:
+                message = await self.bot.send_message(self.chat_id, text)
+                self.message_id = message.message_id
+            else:
+                await self.bot.edit_message_text(text, self.chat_id, self.message_id)
+            self._shown = text
+            self._next_edit = loop.time() + self.interval
+        except RetryAfter as e:
+            # Промежуточные правки не критичны, просто ждем
+            self._next_edit = loop.time() + e.retry_after
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"Не удалось обновить сообщение в чате {self.chat_id}: {e}")
+
+
+class KeyboardEdits:
+    """Отложенная правка inline-клавиатуры сообщения.
+
+    На нажатие кнопки отвечаем сразу, а клавиатуру правим через delay
+    секунд, взяв к этому моменту актуальную разметку: несколько быстрых
+    нажатий подряд дают одну правку вместо нескольких.
+    """
+
+    def __init__(self, delay: float = config.bot.KEYBOARD_EDIT_DELAY):
+        self.delay = delay
+        # Ждут своей очереди и уже отправляются
+        self._scheduled: Dict[Tuple[int, int], asyncio.Task] = {}
+        self._sending: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    def schedule(self, bot: Bot, chat_id: int, message_id: int,
+                 markup: Callable[[], InlineKeyboardMarkup]):
+        key = (chat_id, message_id)
+        if key not in self._scheduled:
+            self._scheduled[key] = asyncio.create_task(self._edit(bot, key, markup))
+
+    async def _edit(self, bot: Bot, key: Tuple[int, int], markup: Callable[[], InlineKeyboardMarkup],
+                    delay: Optional[float] = None):
+        await asyncio.sleep(self.delay if delay is None else delay)
+        # Нажатия во время отправки запланируют следующую правку
+        task = self._scheduled.pop(key)
+        self._sending[key] = task
+        try:
+            await bot.edit_message_reply_markup(key[0], key[1], reply_markup=markup())
+        except RetryAfter as e:
+            # Без повтора отметки разойдутся с выбором, пока пользователь не нажмет еще раз
+            logger.warning(f"Правка клавиатуры в чате {key[0]} отложена: RetryAfter {e.retry_after} с")
+            if key not in self._scheduled:
+                self._scheduled[key] = asyncio.create_task(self._edit(bot, key, markup, e.retry_after))
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning(f"Не удалось обновить клавиатуру в чате {key[0]}: {e}")
+        finally:
+            # Следующая правка могла уже занять место — ее settle() должен дождаться
+            if self._sending.get(key) is task:
+                del self._sending[key]
+
+    async def settle(self, chat_id: int, message_id: int):
+        """Отменить отложенную правку и дождаться уже отправленной.
+
+        Вызывается перед тем, как сообщение заменяется следующим
+        вопросом, — иначе старая клавиатура может лечь поверх нового.
+        """
+        key = (chat_id, message_id)
+        scheduled = self._scheduled.pop(key, None)
+        if scheduled:
+            scheduled.cancel()
+        sending = self._sending.get(key)
+        if sending:
+            await asyncio.gather(sending, return_exceptions=True)
+
+
+keyboard_edits = KeyboardEdits()
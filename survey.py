@@ -0,0 +1,312 @@
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Декларативное описание опроса. Порядок шагов задает номера состояний
+# ConversationHandler (0, 1, ...), подтверждение идет последним.
+#
+# kind:
+#   choice — один вариант из кнопок
+#   multi  — несколько вариантов, выбор завершается кнопкой done
+#   text   — свободный текст, кнопка skip пропускает шаг
+
+CHOICE = 'choice'
+MULTI = 'multi'
+TEXT = 'text'
+
+SURVEY_SCHEMA = [
+    {
+        'key': 'gender',
+        'kind': CHOICE,
+        'prompt': "👥 Какого вы пола?",
+        'buttons': [['👩 Женский', '👨 Мужской']],
+        # Ответы, набранные вручную, приводим к вариантам с кнопок
+        'aliases': {'Женский': '👩 Женский', 'Мужской': '👨 Мужской'},
+        'invalid': "Пожалуйста, выберите пол с помощью кнопок 👇",
+        'summary': "👥 Пол",
+    },
+    {
+        'key': 'service',
+        'kind': CHOICE,
+        'prompt': "🏢 Какую услугу вы получили?",
+        'buttons': [
+            ['Сдача квартиры в аренду'],
+            ['Съём квартиры'],
+            ['Покупка квартиры'],
+            ['Покупка дома'],
+            ['Продажа квартиры'],
+            ['Продажа дома'],
+            ['Флиппинг'],
+            ['Хоумстейджинг'],
+            ['Финансовые услуги'],
+        ],
+        'invalid': "Пожалуйста, выберите услугу с помощью кнопок 👇",
+        'summary': "🏢 Услуга",
+    },
+    {
+        'key': 'likes',
+        'kind': MULTI,
+        'prompt': (
+            "⭐ Что вам понравилось в работе с нашим агентством?\n\n"
+            "Можно выбрать несколько вариантов. Нажмите '✅ Завершить выбор' когда закончите."
+        ),
+        'buttons': [
+            ['Скорость', 'Вежливость менеджера'],
+            ['Прозрачность договора', 'Цена'],
+            ['Стиль работы', '✅ Завершить выбор'],
+        ],
+        'done': '✅ Завершить выбор',
+        'invalid': "Пожалуйста, используйте кнопки для выбора 👇",
+        'empty': "Пожалуйста, выберите хотя бы один вариант перед завершением 👇",
+        'summary': "⭐ Понравилось",
+    },
+    {
+        'key': 'comment',
+        'kind': TEXT,
+        'prompt': (
+            "💬 Хотите добавить комментарий или уточнение к отзыву?\n\n"
+            "Напишите ваш комментарий или нажмите 'Пропустить'"
+        ),
+        'buttons': [['Пропустить']],
+        'skip': 'Пропустить',
+        'summary': "💬 Комментарий",
+    },
+    {
+        'key': 'recommendation',
+        'kind': CHOICE,
+        'prompt': "🤝 Посоветуете своим знакомым наше агентство?",
+        'buttons': [['✅ Да', '❌ Нет']],
+        'invalid': "Пожалуйста, используйте кнопки для ответа 👇",
+        'summary': "🤝 Рекомендация",
+    },
+]
+
+CONFIRMATION_SCHEMA = {
+    'key': 'confirmation',
+    'kind': CHOICE,
+    'prompt': "Всё верно?",
+    'buttons': [['✅ Да, все верно', '❌ Нет, исправить']],
+    'invalid': "Пожалуйста, используйте кнопки для ответа 👇",
+}
+
+RECOMMEND_YES = '✅ Да'
+CONFIRM_YES = '✅ Да, все верно'
+
+# callback_data кнопок: "<key>:<номер варианта>", "<key>:done", "<key>:skip".
+# Номер вместо текста — текст может не влезть в 64 байта callback_data.
+DONE = 'done'
+SKIP = 'skip'
+CHECKMARK = '✅ '
+
+
+@dataclass(frozen=True)
+class Step:
+    state: int
+    key: str
+    kind: str
+    prompt: str
+    # Варианты ответа в порядке кнопок, без служебных done/skip
+    options: Tuple[str, ...]
+    valid: FrozenSet[str]
+    # Бит варианта в маске multi-шага
+    bits: Dict[str, int] = field(default_factory=dict)
+    aliases: Dict[str, str] = field(default_factory=dict)
+    invalid_text: str = ""
+    empty_text: str = ""
+    done: Optional[str] = None
+    skip: Optional[str] = None
+    summary_label: str = ""
+    next: Optional['Step'] = None
+    # Кнопки inline-клавиатуры по рядам и сама клавиатура без отметок
+    inline_buttons: Tuple[Tuple[str, ...], ...] = ()
+    inline_keyboard: Optional[InlineKeyboardMarkup] = None
+    # Клавиатуры multi-шага с отметками по битовой маске выбранных
+    # вариантов; собираются при первом запросе, а не все 2**n при старте
+    marked_keyboards: Dict[int, InlineKeyboardMarkup] = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def callback_pattern(self) -> str:
+        return f"^{self.key}:"
+
+    def normalize(self, answer: str) -> str:
+        return self.aliases.get(answer, answer)
+
+    def parse_callback(self, data: str) -> Optional[str]:
+        """Ответ по callback_data — тот же текст, что на кнопке; None для чужой кнопки"""
+        key, _, value = data.partition(':')
+        if key != self.key:
+            return None
+        if value == DONE:
+            return self.done
+        if value == SKIP:
+            return self.skip
+        if value.isdigit() and int(value) < len(self.options):
+            return self.options[int(value)]
+        return None
+
+    def mask(self, selected: List[str]) -> int:
+        mask = 0
+        for option in selected:
+            mask |= self.bits.get(option, 0)
+        return mask
+
+    def selected(self, mask: int) -> List[str]:
+        """Варианты, отмеченные в битовой маске, в порядке кнопок"""
+        return [option for index, option in enumerate(self.options) if mask >> index & 1]
+
+    def keyboard_for_mask(self, mask: int) -> InlineKeyboardMarkup:
+        """Inline-клавиатура с отметками вариантов из битовой маски"""
+        keyboard = self.marked_keyboards.get(mask)
+        if keyboard is None:
+            keyboard = _inline_keyboard(self.key, self.inline_buttons, self.options, self.done, self.skip, mask)
+            self.marked_keyboards[mask] = keyboard
+        return keyboard
+
+
+def _inline_keyboard(key: str, buttons: Tuple[Tuple[str, ...], ...], options: Tuple[str, ...],
+                     done: Optional[str], skip: Optional[str], mask: int = 0) -> InlineKeyboardMarkup:
+    rows = []
+    for row in buttons:
+        inline_row = []
+        for button in row:
+            if button == done:
+                inline_row.append(InlineKeyboardButton(button, callback_data=f"{key}:{DONE}"))
+            elif button == skip:
+                inline_row.append(InlineKeyboardButton(button, callback_data=f"{key}:{SKIP}"))
+            else:
+                index = options.index(button)
+                label = CHECKMARK + button if mask & (1 << index) else button
+                inline_row.append(InlineKeyboardButton(label, callback_data=f"{key}:{index}"))
+        rows.append(inline_row)
+    return InlineKeyboardMarkup(rows)
+
+
+def _compile_step(state: int, spec: dict, next_step: Optional[Step]) -> Step:
+    buttons = [list(row) for row in spec['buttons']]
+    service_buttons = {spec.get('done'), spec.get('skip')}
+    options = tuple(button for row in buttons for button in row if button not in service_buttons)
+    done, skip = spec.get('done'), spec.get('skip')
+    inline_buttons = tuple(tuple(row) for row in buttons)
+    return Step(
+        state=state,
+        key=spec['key'],
+        kind=spec['kind'],
+        prompt=spec['prompt'],
+        options=options,
+        bits={option: 1 << index for index, option in enumerate(options)},
+        valid=frozenset(options) | frozenset(spec.get('aliases', {})),
+        aliases=dict(spec.get('aliases', {})),
+        invalid_text=spec.get('invalid', ""),
+        empty_text=spec.get('empty', ""),
+        done=done,
+        skip=skip,
+        summary_label=spec.get('summary', ""),
+        next=next_step,
+        inline_buttons=inline_buttons,
+        inline_keyboard=_inline_keyboard(spec['key'], inline_buttons, options, done, skip),
+    )
+
+
+def compile_survey(schema: List[dict], confirmation: dict) -> Tuple[List[Step], Step]:
+    """Собрать шаги один раз при старте: клавиатуры, множества ответов, связи"""
+    confirmation_step = _compile_step(len(schema), confirmation, None)
+    steps: List[Step] = []
+    next_step = None
+    for state in reversed(range(len(schema))):
+        next_step = _compile_step(state, schema[state], next_step)
+        steps.append(next_step)
+    steps.reverse()
+    return steps, confirmation_step
+
+
+STEPS, CONFIRMATION = compile_survey(SURVEY_SCHEMA, CONFIRMATION_SCHEMA)
+STEPS_BY_KEY = {step.key: step for step in STEPS}
+FIRST_STEP = STEPS[0]
+
+
+def step(key: str) -> Step:
+    return STEPS_BY_KEY[key]
+
+
+class SurveySession:
+    """Ответы пользователя в опросе — это context.user_data (см. ContextTypes в main.py).
+
+    Запись со слотами вместо словаря: по полю на шаг, выбор multi-шага —
+    битовая маска вариантов. Незаполненный шаг — None, multi — 0.
+    updated_at — когда запись последний раз сохранялась (time.time()):
+    по нему реплика видит, что опрос продолжился на другой.
+    """
+
+    __slots__ = tuple(item.key for item in STEPS) + ('updated_at',)
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        for item in STEPS:
+            setattr(self, item.key, 0 if item.kind == MULTI else None)
+        self.updated_at: Optional[float] = None
+
+    def answer(self, item: Step):
+        """Ответ на шаг; для multi — список выбранных вариантов в порядке кнопок"""
+        value = getattr(self, item.key)
+        return item.selected(value) if item.kind == MULTI else value
+
+    def set_answer(self, item: Step, value):
+        setattr(self, item.key, value)
+
+    def mask(self, item: Step) -> int:
+        return getattr(self, item.key)
+
+    def toggle(self, item: Step, option: str) -> bool:
+        """Отметить вариант multi-шага или снять отметку; True — вариант теперь выбран"""
+        bit = item.bits[option]
+        mask = getattr(self, item.key) ^ bit
+        setattr(self, item.key, mask)
+        return bool(mask & bit)
+
+    def answers(self) -> Dict[str, object]:
+        return {item.key: self.answer(item) for item in STEPS}
+
+    def update(self, values):
+        """Перенести ответы из другой записи или словаря (в нем multi — списком или маской)"""
+        if isinstance(values, SurveySession):
+            values = values.__getstate__()
+        for item in STEPS:
+            if item.key not in values:
+                continue
+            value = values[item.key]
+            if item.kind == MULTI and not isinstance(value, int):
+                value = item.mask(value or [])
+            setattr(self, item.key, value)
+        if 'updated_at' in values:
+            self.updated_at = values['updated_at']
+
+    # В pickle — словарь: запись читается, даже если шаги опроса поменялись
+
+    def __getstate__(self) -> Dict[str, object]:
+        state = {item.key: getattr(self, item.key) for item in STEPS}
+        state['updated_at'] = self.updated_at
+        return state
+
+    def __setstate__(self, state: Dict[str, object]):
+        self.clear()
+        self.update(state)
+
+    @property
+    def empty(self) -> bool:
+        return not any(getattr(self, item.key) for item in STEPS)
+
+
+def summary_text(session: SurveySession) -> str:
+    """Сводка ответов перед подтверждением"""
+    lines = ["📋 Проверьте ваши ответы:\n"]
+    for item in STEPS:
+        value = session.answer(item)
+        if item.kind == MULTI:
+            value = ', '.join(value)
+        elif item.kind == TEXT and not value:
+            continue
+        lines.append(f"{item.summary_label}: {value}")
+    return "\n".join(lines) + f"\n\n{CONFIRMATION.prompt}"
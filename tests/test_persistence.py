@@ -0,0 +1,147 @@
+import asyncio
+import itertools
+import json
+import os
+import tempfile
+import unittest
+
+# Конфиг читается при импорте, поэтому окружение — до импорта main
+_workdir = tempfile.mkdtemp(prefix='bot-tests-')
+os.environ.update({
+    'TELEGRAM_BOT_TOKEN': '123456:test',
+    'YANDEX_API_KEY': 'test',
+    'YANDEX_FOLDER_ID': 'test',
+    'DB_PATH': os.path.join(_workdir, 'reviews.db'),
+    'STATE_DB_PATH': os.path.join(_workdir, 'state.db'),
+    'SERVER_ENABLED': '0',
+    'POOL_ENABLED': '0',
+    'GENERATION_BACKEND': 'local',
+    'STATE_SESSION_TIMEOUT': '1',
+})
+
+from telegram import Bot, Update  # noqa: E402
+from telegram.request import BaseRequest, RequestData  # noqa: E402
+
+import main  # noqa: E402
+import survey  # noqa: E402
+from persistence import CONVERSATION, USER_DATA  # noqa: E402
+
+TIMEOUT_TEXT = "Опрос закрыт"
+
+
+class FakeTelegram(BaseRequest):
+    """Bot API без сети: запоминает тексты отправленных сообщений"""
+
+    def __init__(self):
+        self.texts = []
+        self._message_ids = itertools.count(1000)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data: RequestData = None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        name = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if name == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Test", "username": "test_bot"}
+        elif name in ('sendMessage', 'editMessageText'):
+            self.texts.append(params.get('text', ''))
+            result = {
+                "message_id": next(self._message_ids), "date": 0, "text": params.get('text', ''),
+                "chat": {"id": params.get('chat_id', 1), "type": "private"},
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class TwoReplicasTest(unittest.IsolatedAsyncioTestCase):
+    """Две реплики бота с общим хранилищем состояния опросов"""
+
+    chat_id = 5
+
+    async def asyncSetUp(self):
+        self._ids = itertools.count(1)
+        self.replicas = []
+        for _ in range(2):
+            telegram = FakeTelegram()
+            application = main.build_application(bot=Bot('123456:test', request=telegram))
+            await application.initialize()
+            application.persistence.verify()
+            await application.start()
+            self.replicas.append((application, telegram))
+
+    async def asyncTearDown(self):
+        for application, _ in self.replicas:
+            await application.stop()
+            await application.shutdown()
+
+    def _user(self) -> dict:
+        return {"id": self.chat_id, "is_bot": False, "first_name": "User"}
+
+    def _message(self, application, text: str) -> Update:
+        message = {
+            "message_id": next(self._ids), "date": 0, "text": text,
+            "chat": {"id": self.chat_id, "type": "private"}, "from": self._user(),
+        }
+        if text.startswith('/'):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return Update.de_json({"update_id": next(self._ids), "message": message}, application.bot)
+
+    def _press(self, application, data: str) -> Update:
+        query = {
+            "id": str(next(self._ids)), "from": self._user(), "chat_instance": "test", "data": data,
+            "message": {
+                "message_id": next(self._ids), "date": 0, "text": "...",
+                "chat": {"id": self.chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Test"},
+            },
+        }
+        return Update.de_json({"update_id": next(self._ids), "callback_query": query}, application.bot)
+
+    async def _send(self, application, update: Update):
+        await application.update_processor.process_update(update, application.process_update(update))
+
+    async def _stored(self, application):
+        keys = [(USER_DATA, str(self.chat_id)), (CONVERSATION, json.dumps([self.chat_id, self.chat_id]))]
+        stored = await application.persistence.store.get_many(keys)
+        return [stored.get(key) for key in keys]
+
+    async def test_timer_of_previous_replica_keeps_survey(self):
+        (first, first_telegram), (second, second_telegram) = self.replicas
+        await self._send(first, self._message(first, '/start'))
+        await asyncio.sleep(0.4)
+        # Пользователь продолжил опрос на другой реплике
+        await self._send(second, self._press(second, f"{survey.FIRST_STEP.key}:0"))
+        continued = await self._stored(second)
+
+        # Таймер первой реплики (через 1 с после /start) сработал, второй — еще нет
+        await asyncio.sleep(0.8)
+        self.assertFalse(any(TIMEOUT_TEXT in text for text in first_telegram.texts))
+        self.assertEqual(await self._stored(second), continued)
+        self.assertNotIn(self.chat_id, first.user_data)
+
+        # Опрос закрывает таймер реплики, где был последний ответ
+        await asyncio.sleep(0.6)
+        self.assertTrue(any(TIMEOUT_TEXT in text for text in second_telegram.texts))
+        await second.persistence.after_update(None)
+        self.assertEqual(await self._stored(second), [None, None])
+
+    async def test_abandoned_survey_is_closed(self):
+        (first, first_telegram), _ = self.replicas
+        await self._send(first, self._message(first, '/start'))
+        await self._send(first, self._press(first, f"{survey.FIRST_STEP.key}:0"))
+
+        await asyncio.sleep(1.4)
+        self.assertTrue(any(TIMEOUT_TEXT in text for text in first_telegram.texts))
+        await first.persistence.after_update(None)
+        self.assertEqual(await self._stored(first), [None, None])
+        self.assertNotIn(self.chat_id, first.user_data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка апдейтов с сохранением порядка внутри чата.
+
+    Апдейты разных чатов обрабатываются одновременно (не больше
+    max_concurrent_updates), апдейты одного чата — строго по очереди,
+    чтобы состояние ConversationHandler не ломалось.
+
+    Занятый чат держит ровно один слот: новые апдейты этого чата не ждут
+    на семафоре, а складываются в очередь чата и разбираются тем же
+    обработчиком, который уже занял слот.
+
+    before_update и after_update, если заданы, вызываются перед каждым
+    апдейтом чата и после него в том же порядке — например, чтобы
+    подгрузить состояние опроса и сразу сохранить изменения.
+    """
+
+    def __init__(self, max_concurrent_updates: int,
+                 before_update: Optional[Callable[[object], Awaitable[None]]] = None,
+                 after_update: Optional[Callable[[object], Awaitable[None]]] = None):
+        super().__init__(max_concurrent_updates)
+        self.before_update = before_update
+        self.after_update = after_update
+        self._pending: Dict[Hashable, Deque[Tuple[object, Awaitable[Any]]]] = {}
+
+    @staticmethod
+    def _chat_key(update: object) -> Optional[Hashable]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._chat_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        queue = self._pending.get(key)
+        if queue is not None:
+            # Чат уже обрабатывается — встаем в его очередь
+            queue.append((update, coroutine))
+            return
+
+        queue = self._pending[key] = deque([(update, coroutine)])
+        try:
+            while queue:
+                try:
+                    queued_update, queued_coroutine = queue[0]
+                    if self.before_update:
+                        await self.before_update(queued_update)
+                    await queued_coroutine
+                    if self.after_update:
+                        await self.after_update(queued_update)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки апдейта чата {key}: {e}")
+                finally:
+                    queue.popleft()
+        finally:
+            # Недоделанные корутины закрываем, чтобы не было предупреждений
+            for _, pending in queue:
+                close = getattr(pending, 'close', None)
+                if close:
+                    close()
+            del self._pending[key]
+
+    @property
+    def busy_chats(self) -> int:
+        return len(self._pending)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,123 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+import metrics
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# HTTP-сервер на порту Cloud Run: health/readiness в любом режиме,
+# плюс прием вебхуков Telegram в режиме webhook
+_runner: Optional[web.AppRunner] = None
+
+
+async def handle_webhook(request: web.Request) -> web.Response:
+    application: Application = request.app['application']
+
+    secret = request.headers.get(SECRET_HEADER, '')
+    if not hmac.compare_digest(secret, config.server.WEBHOOK_SECRET):
+        logger.warning("Вебхук с неверным секретным токеном отклонен")
+        return web.Response(status=403)
+
+    try:
+        data = await request.json()
+        update = Update.de_json(data, application.bot)
+    except Exception as e:
+        logger.error(f"Не удалось разобрать апдейт из вебхука: {e}")
+        return web.Response(status=400)
+
+    # Обработка идет через обычную очередь Application, Telegram сразу получает 200
+    await application.update_queue.put(update)
+    return web.Response()
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return web.Response(text='ok')
+
+
+async def handle_ready(request: web.Request) -> web.Response:
+    application: Application = request.app['application']
+    if not application.running:
+        return web.Response(status=503, text='starting')
+    return web.Response(text='ready')
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+def build_web_app(application: Application) -> web.Application:
+    app = web.Application()
+    app['application'] = application
+    app.router.add_get('/healthz', handle_health)
+    app.router.add_get('/readyz', handle_ready)
+    if config.metrics.ENABLED:
+        app.router.add_get('/metrics', handle_metrics)
+    if config.bot.MODE == 'webhook':
+        app.router.add_post(config.server.WEBHOOK_PATH, handle_webhook)
+    return app
+
+
+async def start_web_server(application: Application):
+    global _runner
+    _runner = web.AppRunner(build_web_app(application), access_log=None)
+    await _runner.setup()
+    site = web.TCPSite(_runner, config.server.HOST, config.server.PORT)
+    await site.start()
+    logger.info(f"HTTP-сервер слушает {config.server.HOST}:{config.server.PORT}")
+
+
+async def stop_web_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
+
+
+async def _serve_webhook(application: Application):
+    # Тот же порядок запуска и остановки, что и в Application.run_polling
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+
+        await application.start()
+        # Вебхук остается у Telegram между перезапусками, так что обновления
+        # уже идут в сервис; переустанавливаем его после запуска, а не до
+        await application.bot.set_webhook(
+            url=config.server.WEBHOOK_URL.rstrip('/') + config.server.WEBHOOK_PATH,
+            secret_token=config.server.WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=config.server.WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info("🚀 Бот принимает обновления через вебхук")
+        await stop_event.wait()
+    finally:
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application: Application):
+    if not (config.server.WEBHOOK_URL and config.server.WEBHOOK_SECRET):
+        logger.error("Для режима webhook нужны WEBHOOK_URL и WEBHOOK_SECRET")
+        return
+    asyncio.run(_serve_webhook(application))
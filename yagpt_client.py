@@ -1,59 +1,469 @@
+import abc
 import aiohttp
 import json
 import logging
 import asyncio
 import os
-from typing import Optional, Dict, Any
-from tenacity import retry, stop_after_attempt, wait_exponential
+import random
+import time
+from contextlib import aclosing, asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator, List, Tuple
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from http_session import get_session
+from config import config
+from local_generator import local_generator
+from rate_limit import DailyBudget
+from resilience import AIMDLimiter, CircuitBreaker, HedgeBudget, LatencyWindow, request_deadline
+import review_text
+import metrics
 
 # Простой конфиг внутри файла
 class YandexConfig:
     API_KEY = os.getenv('YANDEX_API_KEY', '')
     FOLDER_ID = os.getenv('YANDEX_FOLDER_ID', '')
+    MODEL = os.getenv('YANDEX_GPT_MODEL', 'yandexgpt-lite')
+    # Несколько каталогов через запятую: "каталог:ключ[:модель],...".
+    # Элемент "local" — локальный генератор вместо YaGPT (тесты, стенды).
+    # Пусто — один каталог из YANDEX_FOLDER_ID и YANDEX_API_KEY.
+    BACKENDS = os.getenv('YANDEX_GPT_BACKENDS', '')
     TEMPERATURE = 0.7
     MAX_TOKENS = 500
     TIMEOUT = 30
+    # Каталог, ответивший 429/5xx, на время исключается из выбора;
+    # при ошибках подряд срок удваивается до EJECT_MAX_SECONDS
+    EJECT_SECONDS = float(os.getenv('YANDEX_GPT_EJECT_SECONDS', '5'))
+    EJECT_MAX_SECONDS = float(os.getenv('YANDEX_GPT_EJECT_MAX_SECONDS', '60'))
+    # Можно подменить, например, заглушкой из benchmark.py
+    BASE_URL = os.getenv('YANDEX_GPT_URL', "https://llm.api.cloud.yandex.net/foundationModels/v1/completion")
 
 logger = logging.getLogger(__name__)
 
-class YandexGPTClient:
-    BASE_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+STATUS_FINAL = "ALTERNATIVE_STATUS_FINAL"
+# Ответ оборван по maxTokens
+STATUS_TRUNCATED = "ALTERNATIVE_STATUS_TRUNCATED_FINAL"
+# Модель отказалась отвечать, текст — заготовка отказа
+STATUS_CONTENT_FILTER = "ALTERNATIVE_STATUS_CONTENT_FILTER"
+# После любого из них API больше ничего не пришлет
+FINAL_STATUSES = (STATUS_FINAL, STATUS_TRUNCATED, STATUS_CONTENT_FILTER)
+
+class YandexGPTError(Exception):
+    pass
+
+class RetryableStatusError(YandexGPTError):
+    """Ответ, который имеет смысл повторить: 429 или 5xx"""
+    def __init__(self, status: int):
+        super().__init__(f"YaGPT API error: {status}")
+        self.status = status
+
+
+class Backend(abc.ABC):
+    """Бэкенд пула: запросы в работе, временное исключение и статистика.
+
+    complete() возвращает ответ completion API целиком, stream() — объекты
+    result потокового ответа по мере поступления. survey — ответы опроса,
+    из которых собран промпт: в API они не уходят, но нужны локальным
+    бэкендам.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.in_flight = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        self.latencies = LatencyWindow(config.resilience.HEDGE_WINDOW)
+        self._failures_in_row = 0
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    def eject(self, status: int):
+        self._failures_in_row += 1
+        self.ejections += 1
+        seconds = min(YandexConfig.EJECT_MAX_SECONDS, YandexConfig.EJECT_SECONDS * 2 ** (self._failures_in_row - 1))
+        self.ejected_until = time.monotonic() + seconds
+        metrics.YAGPT_BACKEND_EJECTIONS.labels(self.name).inc()
+        logger.warning(f"Бэкенд YaGPT {self.name} ответил {status}, исключен на {seconds:.0f} с")
 
-    def __init__(self):
-        self.api_key = YandexConfig.API_KEY
-        self.folder_id = YandexConfig.FOLDER_ID
-        self.model_uri = f"gpt://{self.folder_id}/yandexgpt-lite"
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.latencies.percentile(0.5)
+        p95 = self.latencies.percentile(0.95)
+        return {
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'errors': self.errors,
+            'ejections': self.ejections,
+            'ejected': self.ejected,
+            'p50_ms': round(p50 * 1000, 1) if p50 is not None else None,
+            'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+        }
+
+    @abc.abstractmethod
+    async def complete(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> Dict[str, Any]:
+        ...
+
+    @abc.abstractmethod
+    def stream(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        ...
+
+
+class YaGPTBackend(Backend):
+    """Каталог Yandex Cloud со своим ключом и моделью.
+
+    Квота у каждого каталога своя, поэтому и AIMD-лимит параллельности свой.
+    """
+
+    def __init__(self, name: str, api_key: str, folder_id: str, model: str = YandexConfig.MODEL,
+                 url: str = YandexConfig.BASE_URL):
+        super().__init__(name)
+        self.api_key = api_key
+        self.folder_id = folder_id
+        self.model_uri = f"gpt://{folder_id}/{model}"
+        self.url = url
         self.timeout = aiohttp.ClientTimeout(total=YandexConfig.TIMEOUT)
+        self.limiter = AIMDLimiter(
+            initial=config.resilience.CONCURRENCY_INITIAL,
+            min_limit=config.resilience.CONCURRENCY_MIN,
+            max_limit=config.resilience.CONCURRENCY_MAX
+        )
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10)
-    )
-    async def generate_review(self, gender: str, service: str, likes: list, recommendation: str, comment: str = "") -> Optional[str]:
+    async def complete(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._request(payload) as response:
+            return await response.json()
+
+    async def stream(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        async with self._request(payload) as response:
+            async for line in response.content:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)['result']
+
+    @asynccontextmanager
+    async def _request(self, payload: Dict[str, Any]) -> AsyncIterator[aiohttp.ClientResponse]:
+        """Ответ 200 под лимитером каталога; 429/5xx исключают каталог из выбора"""
+        self.in_flight += 1
+        self.requests += 1
+        in_flight = metrics.YAGPT_BACKEND_IN_FLIGHT.labels(self.name)
+        in_flight.inc()
+        status = metrics.STATUS_ERROR
+        started = None
         try:
-            prompt = self._build_prompt(gender, service, likes, recommendation, comment)
-            payload = self._build_payload(prompt)
+            async with self.limiter:
+                session = await get_session()
+                started = time.perf_counter()
+                async with session.post(self.url, json={**payload, "modelUri": self.model_uri},
+                                        headers=self._headers(), timeout=self.timeout) as response:
+                    status = str(response.status)
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"YaGPT API error ({self.name}): {response.status} - {error_text}")
+                        self._check_status(response.status)
+                    yield response
+                    self.limiter.on_success()
+                    self._failures_in_row = 0
+        except asyncio.CancelledError:
+            status = metrics.STATUS_CANCELLED
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            in_flight.dec()
+            if started is not None:
+                elapsed = time.perf_counter() - started
+                metrics.YAGPT_LATENCY.labels(self.name, status).observe(elapsed)
+                if status == '200':
+                    self.latencies.observe(elapsed)
+
+    def _check_status(self, status: int):
+        if status == 429:
+            self.limiter.on_overload()
+            self.eject(status)
+            raise RetryableStatusError(status)
+        if status >= 500:
+            self.eject(status)
+            raise RetryableStatusError(status)
+        raise YandexGPTError(f"YaGPT API error: {status}")
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Authorization": f"Api-Key {self.api_key}",
+            "x-folder-id": self.folder_id
+        }
+
 
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Api-Key {self.api_key}",
-                "x-folder-id": self.folder_id
+class LocalBackend(Backend):
+    """Подмена YaGPT без сети: ответ в формате API из локального генератора.
+
+    Текст собирается из ответов опроса, а запрос проходит тот же путь, что
+    и к настоящему каталогу: пул, повторы, дубли, учет токенов.
+    """
+
+    def __init__(self, name: str = 'local', latency: float = 0.0):
+        super().__init__(name)
+        self.latency = latency
+
+    async def complete(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> Dict[str, Any]:
+        self.in_flight += 1
+        self.requests += 1
+        started = time.perf_counter()
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            text = local_generator.compose(**survey)
+        finally:
+            self.in_flight -= 1
+        self.latencies.observe(time.perf_counter() - started)
+        return {
+            "result": {
+                "alternatives": [{"message": {"role": "assistant", "text": text}, "status": STATUS_FINAL}],
+                "usage": {"inputTextTokens": "0", "completionTokens": "0", "totalTokens": "0"}
             }
+        }
+
+    async def stream(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        data = await self.complete(payload, survey)
+        yield data['result']
 
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.post(self.BASE_URL, json=payload, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data['result']['alternatives'][0]['message']['text'].strip()
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"YaGPT API error: {response.status} - {error_text}")
-                        return None
 
+class BackendPool:
+    """Выбор бэкенда с наименьшим числом запросов в работе среди не исключенных"""
+
+    def __init__(self, backends: List[Backend]):
+        if not backends:
+            raise ValueError("Пул бэкендов YaGPT пуст")
+        self.backends = backends
+
+    def pick(self) -> Backend:
+        available = [backend for backend in self.backends if not backend.ejected]
+        if not available:
+            # Исключены все — идем в тот, что вернется в строй раньше остальных
+            return min(self.backends, key=lambda backend: backend.ejected_until)
+        # При равенстве — случайный, чтобы нагрузка не копилась на первом
+        return min(available, key=lambda backend: (backend.in_flight, random.random()))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {backend.name: backend.stats() for backend in self.backends}
+
+
+def build_backends(spec: str = YandexConfig.BACKENDS) -> List[Backend]:
+    """Бэкенды из YANDEX_GPT_BACKENDS; без него — один каталог из YANDEX_FOLDER_ID"""
+    if not spec.strip():
+        return [YaGPTBackend(YandexConfig.FOLDER_ID or 'default', YandexConfig.API_KEY, YandexConfig.FOLDER_ID)]
+    backends: List[Backend] = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        if item == 'local':
+            backends.append(LocalBackend())
+            continue
+        folder_id, api_key, *model = item.split(':', 2)
+        name = f"{folder_id}/{model[0]}" if model else folder_id
+        backends.append(YaGPTBackend(name, api_key, folder_id, *model))
+    return backends
+
+
+class YandexGPTClient:
+    def __init__(self, backends: Optional[List[Backend]] = None):
+        self.pool = BackendPool(backends if backends is not None else build_backends())
+        self.breaker = CircuitBreaker(
+            'yagpt',
+            failure_threshold=config.resilience.FAILURE_THRESHOLD,
+            reset_timeout=config.resilience.RESET_TIMEOUT,
+            half_open_probes=config.resilience.HALF_OPEN_PROBES
+        )
+        self.latencies = LatencyWindow(config.resilience.HEDGE_WINDOW)
+        self.hedge_budget = HedgeBudget(config.resilience.HEDGE_MAX_FRACTION)
+        self.budget = DailyBudget(
+            config.limits.DAILY_TOKENS,
+            config.limits.DAILY_COST,
+            config.limits.TOKEN_PRICE
+        )
+
+    async def generate_review(self, gender: str, service: str, likes: list, recommendation: str, comment: str = "",
+                              temperature: Optional[float] = None) -> Optional[str]:
+        if self._over_budget():
+            return None
+        # Пока автомат открыт, сразу отдаем None — вызывающий возьмет fallback
+        if not self.breaker.allow():
+            logger.warning("YaGPT недоступен (circuit breaker открыт), используем fallback")
+            metrics.YAGPT_FALLBACKS.labels('breaker_open').inc()
+            return None
+
+        try:
+            survey = {"gender": gender, "service": service, "likes": likes, "recommendation": recommendation, "comment": comment}
+            prompt = self._build_prompt(**survey)
+            payload = self._build_payload(prompt, temperature=temperature)
+            # Новый текст просим, только если ответ не удалось исправить на месте
+            for attempt in range(1 + config.generation.REVIEW_REGENERATIONS):
+                if attempt:
+                    if self.budget.exhausted:
+                        break
+                    metrics.REVIEW_REGENERATIONS.inc()
+                data = await self._hedged_completion(payload, survey)
+                text = self._checked_text(data['result']['alternatives'][0])
+                if text:
+                    break
+        except asyncio.CancelledError:
+            # Срок задачи истек раньше ответа — для автомата это тот же таймаут
+            self.breaker.record_failure()
+            raise
         except Exception as e:
+            self.breaker.record_failure()
+            metrics.YAGPT_FALLBACKS.labels('error').inc()
             logger.error(f"Error generating review: {e}")
             return None
 
+        # Сам YaGPT ответил, так что для автомата это успех, даже если текст не годится
+        self.breaker.record_success()
+        if not text:
+            metrics.YAGPT_FALLBACKS.labels('invalid_text').inc()
+        return text
+
+    def _checked_text(self, alternative: Dict[str, Any]) -> Optional[str]:
+        if alternative.get('status') == STATUS_CONTENT_FILTER:
+            metrics.REVIEW_TEXT_REJECTED.labels('content_filter').inc()
+            return None
+        return review_text.clean(
+            alternative['message']['text'],
+            truncated=alternative.get('status') == STATUS_TRUNCATED
+        )
+
+    async def _hedged_completion(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> Dict[str, Any]:
+        """Запрос, который дублируется, если ответа нет дольше обычного.
+
+        Ответ от первого успешно завершившегося запроса, второй отменяется.
+        Задержка до дубля — перцентиль недавних задержек, доля дублей
+        ограничена HedgeBudget.
+        """
+        self.hedge_budget.record_request()
+        started = time.perf_counter()
+        primary = asyncio.create_task(self._request_completion(payload, survey))
+        pending = {primary}
+        delay = self._hedge_delay()
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Первый запрос не уложился в обычное время — дубль, но только один
+                    delay = None
+                    if self._may_hedge():
+                        pending.add(asyncio.create_task(self._request_completion(payload, survey)))
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary:
+                            # Время с ожиданием лимитера и повторами — с ним и сравнивается задержка дубля
+                            self.latencies.observe(time.perf_counter() - started)
+                        else:
+                            metrics.YAGPT_HEDGES.labels('won').inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Проигравший запрос больше не нужен: отмена освобождает слот лимитера и соединение
+            for task in pending:
+                task.cancel()
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not config.resilience.HEDGE_ENABLED:
+            return None
+        if len(self.latencies) < config.resilience.HEDGE_MIN_SAMPLES:
+            delay = config.resilience.HEDGE_DELAY
+        else:
+            delay = max(config.resilience.HEDGE_MIN_DELAY, self.latencies.percentile(config.resilience.HEDGE_PERCENTILE))
+        metrics.YAGPT_HEDGE_DELAY.set(delay)
+        return delay
+
+    def _may_hedge(self) -> bool:
+        deadline = request_deadline.get()
+        typical = self.latencies.percentile(0.5)
+        if deadline is not None and typical is not None:
+            if deadline - asyncio.get_running_loop().time() < typical:
+                # Дубль не успеет ответить до срока задачи
+                metrics.YAGPT_HEDGES.labels('too_late').inc()
+                return False
+        if not self.hedge_budget.try_acquire():
+            metrics.YAGPT_HEDGES.labels('capped').inc()
+            return False
+        metrics.YAGPT_HEDGES.labels('sent').inc()
+        return True
+
+    @retry(
+        retry=retry_if_exception_type(RetryableStatusError),
+        stop=stop_after_attempt(config.resilience.RETRY_ATTEMPTS),
+        wait=wait_random_exponential(multiplier=1, max=config.resilience.RETRY_MAX_WAIT),
+        before_sleep=lambda retry_state: metrics.YAGPT_RETRIES.inc(),
+        reraise=True
+    )
+    async def _request_completion(self, payload: Dict[str, Any], survey: Dict[str, Any]) -> Dict[str, Any]:
+        # Повторяются только 429 и 5xx, таймауты и прочие ошибки — нет.
+        # Бэкенд выбирается заново: ответивший ошибкой уже исключен из выбора.
+        data = await self.pool.pick().complete(payload, survey)
+        self._record_usage(data['result'].get('usage'))
+        return data
+
+    def _over_budget(self) -> bool:
+        if not self.budget.exhausted:
+            return False
+        logger.warning(f"Суточный бюджет YaGPT исчерпан ({self.budget.tokens} токенов), используем fallback")
+        metrics.YAGPT_FALLBACKS.labels('budget').inc()
+        return True
+
+    def _record_usage(self, usage: Optional[dict]):
+        self.budget.spend(metrics.record_usage(usage))
+        metrics.YAGPT_BUDGET_SPENT.set(self.budget.tokens)
+
+    async def stream_review(self, gender: str, service: str, likes: list, recommendation: str, comment: str = "") -> AsyncIterator[Tuple[Optional[str], bool]]:
+        """Потоковая генерация: отдает пары (накопленный текст, готово ли).
+
+        В режиме stream API присылает JSON-объекты построчно, в каждом —
+        весь текст, сгенерированный к этому моменту. В финальной паре
+        текст уже проверен, как в generate_review: None, если он не
+        годится. При ошибке поток обрывается без финальной пары, это
+        должен проверить вызывающий. Повторов нет: часть текста уже
+        могла быть показана пользователю.
+        """
+        if self._over_budget():
+            return
+        if not self.breaker.allow():
+            logger.warning("YaGPT недоступен (circuit breaker открыт), используем fallback")
+            metrics.YAGPT_FALLBACKS.labels('breaker_open').inc()
+            return
+
+        answered = False
+        try:
+            survey = {"gender": gender, "service": service, "likes": likes, "recommendation": recommendation, "comment": comment}
+            prompt = self._build_prompt(**survey)
+            payload = self._build_payload(prompt, stream=True)
+
+            # aclosing: при отмене по сроку ответ aiohttp закрывается сразу, а не сборщиком мусора
+            async with aclosing(self.pool.pick().stream(payload, survey)) as results:
+                async for result in results:
+                    alternative = result['alternatives'][0]
+                    if alternative.get('status') in FINAL_STATUSES:
+                        answered = True
+                        # usage в каждой строке накопительный, учитываем только итог
+                        self._record_usage(result.get('usage'))
+                        yield self._checked_text(alternative), True
+                    else:
+                        yield alternative['message']['text'], False
+
+            if not answered:
+                raise YandexGPTError("Поток оборвался без финального ответа")
+        except Exception as e:
+            metrics.YAGPT_FALLBACKS.labels('error').inc()
+            logger.error(f"Error streaming review: {e}")
+        finally:
+            # Сам YaGPT ответил, так что для автомата это успех, даже если текст не годится
+            if answered:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
     def _build_prompt(self, gender: str, service: str, likes: list, recommendation: str, comment: str) -> str:
         gender_text = "женщина" if "женск" in gender.lower() else "мужчина"
         recommendation_text = "рекомендует" if recommendation == "✅ Да" else "не рекомендует"
@@ -83,12 +493,12 @@ class YandexGPTClient:
 Только текст отзыва.
 """
 
-    def _build_payload(self, prompt: str) -> Dict[str, Any]:
+    def _build_payload(self, prompt: str, stream: bool = False, temperature: Optional[float] = None) -> Dict[str, Any]:
+        # modelUri добавляет бэкенд: у каждого каталога свой
         return {
-            "modelUri": self.model_uri,
             "completionOptions": {
-                "stream": False,
-                "temperature": YandexConfig.TEMPERATURE,
+                "stream": stream,
+                "temperature": YandexConfig.TEMPERATURE if temperature is None else temperature,
                 "maxTokens": YandexConfig.MAX_TOKENS
             },
             "messages": [
@@ -1,6 +1,6 @@
-import aiohttp
 import os
 import asyncio
+from http_session import get_session
 
 class YandexGPTClient:
     def __init__(self):
@@ -43,13 +43,13 @@ class YandexGPTClient:
                 ]
             }
 
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.base_url, json=data, headers=headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return result['result']['alternatives'][0]['message']['text'].strip()
-                    else:
-                        return None
+            session = await get_session()
+            async with session.post(self.base_url, json=data, headers=headers) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    return result['result']['alternatives'][0]['message']['text'].strip()
+                else:
+                    return None
 
         except Exception:
             return None